@@ -3,6 +3,7 @@ Contains base class of tree and node
 """
 
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
 
 from data_entry import DataEntry
 
@@ -58,6 +59,81 @@ class AbstractTree(ABC):
         In-order tree walk
         """
 
+    def iter_inorder(self) -> Iterator[DataEntry]:
+        """
+        Lazy in-order tree walk, yields entries one by one.
+        Trees override it to walk in O(height) extra memory instead of building a list.
+        Tree must not be modified while iterating
+        """
+
+        return iter(self.inorder())
+
+    def bulk_build(self, data_entries) -> None:
+        """
+        Fills empty tree with data entries sorted by key.
+        Trees override it to link nodes into balanced shape directly instead of
+        rebalancing after every insert
+        """
+
+        for data_entry in data_entries:
+            self.insert(data_entry)
+
+    def _sorted_buckets(self, data_entries) -> list[list[DataEntry]]:
+        """
+        Groups data entries sorted by key into lists of entries with equal key
+        """
+
+        buckets = []
+        for data_entry in data_entries:
+            if buckets and buckets[-1][0].columns[self.key_col] == data_entry.columns[self.key_col]:
+                buckets[-1].append(data_entry)
+            else:
+                buckets.append([data_entry])
+        return buckets
+
+    @staticmethod
+    def _build_binary(buckets: list[list[DataEntry]], make_node, finish_node=None):
+        """
+        Builds binary tree of height ceil(log2(n + 1)) from sorted buckets.
+
+        Args:
+            buckets: Sorted lists of entries with equal key
+            make_node: Callback (bucket, depth) -> node without children
+            finish_node: Optional callback called for node after its children are linked
+
+        Returns:
+            Root node or None
+        """
+
+        def build(low, high, depth):
+            if low >= high:
+                return None
+            middle = (low + high) // 2
+            node = make_node(buckets[middle], depth)
+            node.left = build(low, middle, depth + 1)
+            node.right = build(middle + 1, high, depth + 1)
+            if finish_node is not None:
+                finish_node(node)
+            return node
+
+        return build(0, len(buckets), 0)
+
+    @staticmethod
+    def _iter_binary_inorder(root) -> Iterator[DataEntry]:
+        """
+        Lazy in-order walk of binary tree nodes with left and right children
+        """
+
+        stack = []
+        node = root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield from node.data
+            node = node.right
+
     @abstractmethod
     def preorder(self) -> list[DataEntry]:
         """
@@ -2,6 +2,8 @@
 Implementing AVL-tree.
 """
 
+from collections.abc import Iterator
+
 from data_entry import DataEntry
 from abstract_tree import AbstractTree, AbstractTreeNode
 
@@ -101,6 +103,21 @@ class AVLTree(AbstractTree):
     def insert(self, data_entry: DataEntry) -> None:
         self.__root = self.__insert(self.__root, data_entry)
 
+    def bulk_build(self, data_entries) -> None:
+        if self.__root is not None:
+            super().bulk_build(data_entries)
+            return
+
+        def make_node(bucket, _):
+            node = AVLTreeNode(bucket[0])
+            node.data = bucket
+            return node
+
+        def finish_node(node):
+            node.height = 1 + max(self.get_height(node.left), self.get_height(node.right))
+
+        self.__root = self._build_binary(self._sorted_buckets(data_entries), make_node, finish_node)
+
     def __min_node(self, node: AVLTreeNode) -> AVLTreeNode:
         current = node
         while current.left is not None:
@@ -203,6 +220,9 @@ class AVLTree(AbstractTree):
 
         return result
 
+    def iter_inorder(self) -> Iterator[DataEntry]:
+        return self._iter_binary_inorder(self.__root)
+
     def preorder(self) -> list[DataEntry]:
         """
         Pre-order tree traversal: root → left → right.
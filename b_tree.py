@@ -186,6 +186,16 @@ class GeneralBTree(AbstractTree):
         inorder_recursive(self.root, result)
         return result
 
+    def iter_inorder(self):
+        def inorder_generator(node):
+            for i, bucket in enumerate(node.data):
+                if i < len(node.children):
+                    yield from inorder_generator(node.children[i])
+                yield from bucket
+            if len(node.children) > len(node.data):
+                yield from inorder_generator(node.children[-1])
+        return inorder_generator(self.root)
+
     def preorder(self):
         def preorder_recursive(node, result):
             if node is None:
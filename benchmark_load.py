@@ -0,0 +1,70 @@
+"""
+Compares serial and parallel loading of database tables
+
+Usage:
+    python benchmark_load.py [tables] [rows per table] [workers]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from avl_tree import AVLTree
+from data_entry import ColumnType, DataEntry
+from database import Database
+from database_table import DatabaseTable
+
+
+def create_database(path: str, tables_count: int, rows_count: int) -> None:
+    """
+    Writes database with tables of random rows straight into table files
+    """
+
+    db = Database(AVLTree, path, save_on_exit=False)
+    for table_index in range(tables_count):
+        db.create_table(
+            f"table{table_index}",
+            [("id", ColumnType.INT), ("name", ColumnType.SMALL_STRING), ("value", ColumnType.LONG)],
+            0
+        )
+    db.save()
+
+    for table_index in range(tables_count):
+        tree = AVLTree(0)
+        tree.bulk_build(sorted(
+            (DataEntry([random.randrange(2 ** 32), f"name{i}", i]) for i in range(rows_count)),
+            key=lambda data_entry: data_entry.columns[0]
+        ))
+        DatabaseTable(tree, db.get_table(f"table{table_index}").column_types).write_to_file(
+            f"{path}/table{table_index}"
+        )
+
+
+def measure(path: str, workers: int) -> float:
+    """
+    Measures time of opening database and loading all its tables
+    """
+
+    start = time.perf_counter()
+    Database(AVLTree, path, save_on_exit=False).preload(workers=workers)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    tables = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "db")
+        create_database(db_path, tables, rows)
+
+        serial_time = measure(db_path, 1)
+        parallel_time = measure(db_path, workers)
+
+        print(f"{tables} tables x {rows} rows")
+        print(f"serial:              {serial_time:.2f} s")
+        print(f"parallel ({workers} workers): {parallel_time:.2f} s")
+        print(f"speedup:             {serial_time / parallel_time:.2f}x")
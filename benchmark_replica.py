@@ -0,0 +1,55 @@
+"""
+Measures SELECT throughput of one process against read replicas queried from several threads
+
+Usage:
+    python benchmark_replica.py [rows] [queries] [replicas]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from avl_tree import AVLTree
+from data_entry import ColumnType
+from database import Database
+from query import QuerySession
+from replica import ReplicaSet
+
+
+def run_queries(execute, keys: list[int], threads: int) -> float:
+    """
+    Runs range SELECT for every key from given number of threads
+
+    Returns:
+        Queries per second
+    """
+
+    query = "SELECT name FROM t WHERE id >= ? AND id < ?"
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda key: execute(query, [key, key + 100]), keys))
+    return len(keys) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    replicas_count = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(AVLTree, os.path.join(tmp_dir, "db"), save_on_exit=False)
+        db.create_table("t", [("id", ColumnType.INT), ("name", ColumnType.SMALL_STRING)], 0)
+        db.insert_many("t", [[i, f"name{i}"] for i in range(rows)])
+        keys = [random.randrange(rows) for _ in range(queries)]
+
+        print(f"{rows} rows, {queries} range queries")
+        print(f"one process:            {run_queries(QuerySession(db).execute, keys, 1):.0f} queries/s")
+        replicas = ReplicaSet(db, replicas_count)
+        try:
+            throughput = run_queries(replicas.execute, keys, replicas_count * 2)
+            print(f"{replicas_count} replicas:             {throughput:.0f} queries/s")
+        finally:
+            replicas.close()
@@ -0,0 +1,108 @@
+"""
+Measures query server throughput over loopback: one request at a time, pipelined
+requests and several concurrent clients. Server runs in its own process, like in deployment
+
+Usage:
+    python benchmark_server.py [rows] [requests per client] [clients]
+"""
+
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from avl_tree import AVLTree
+from data_entry import ColumnType
+from database import Database
+from query_server import QueryClient, serve
+
+
+def run_server(path: str, port: int) -> None:
+    """
+    Serves database in child process until it is terminated
+    """
+
+    db = Database(AVLTree, path, save_on_exit=False)
+    asyncio.run(serve(db, port=port))
+
+
+async def connect(port: int) -> QueryClient:
+    """
+    Connects to server, waiting for it to start
+    """
+
+    for _ in range(100):
+        try:
+            return await QueryClient.connect(port=port)
+        except ConnectionError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("Server did not start")
+
+
+async def benchmark(port: int, rows: int, requests: int, clients_count: int) -> None:
+    """
+    Prints requests per second of point lookups in each mode
+    """
+
+    clients = [await connect(port) for _ in range(clients_count)]
+    client = clients[0]
+    keys = [random.randrange(rows) for _ in range(requests)]
+    query = "SELECT * FROM t WHERE id = ?"
+
+    start = time.perf_counter()
+    for key in keys:
+        await client.execute(query, [key])
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client.execute(query, [key]) for key in keys))
+    pipelined = time.perf_counter() - start
+
+    async def run_client(client: QueryClient):
+        for key in keys:
+            await client.execute(query, [key])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(client) for client in clients))
+    concurrent = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parts = 0
+    async for _ in client.stream("SELECT * FROM t"):
+        parts += 1
+    full_scan = time.perf_counter() - start
+
+    print(f"{rows} rows, {requests} point lookups per client")
+    print(f"sequential:            {requests / sequential:.0f} requests/s")
+    print(f"pipelined:             {requests / pipelined:.0f} requests/s")
+    print(f"{clients_count} concurrent clients:  {requests * clients_count / concurrent:.0f} requests/s")
+    print(f"full scan:             {full_scan:.2f} s in {parts} parts")
+    for client in clients:
+        await client.close()
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+    clients_count = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    port = 5433
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "db")
+        db = Database(AVLTree, db_path, save_on_exit=False)
+        db.create_table("t", [("id", ColumnType.INT), ("name", ColumnType.SMALL_STRING)], 0)
+        for i in range(rows):
+            db.insert("t", [i, f"name{i}"])
+        db.save()
+        del db
+
+        server = multiprocessing.Process(target=run_server, args=(db_path, port), daemon=True)
+        server.start()
+        try:
+            asyncio.run(benchmark(port, rows, requests, clients_count))
+        finally:
+            server.terminate()
+            server.join()
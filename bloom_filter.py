@@ -0,0 +1,130 @@
+"""
+Contains bloom filter over table keys, used to answer lookups of missing keys
+without touching the tree or table file
+
+Filter file (stored next to table file as {table}.bloom) is magic, size and modification
+time of table file the filter was built for, capacity, keys count and hash functions count,
+then bit array. Filter of a table file that changed since (e.g. crash between writing both
+files) is ignored, as it may miss keys of the table.
+"""
+
+import hashlib
+import math
+import os
+import struct
+
+
+class BloomFilter:
+    """
+    Set of keys with false positives but without false negatives.
+    Erased keys stay in filter until it is rebuilt
+    """
+
+    MAGIC = b"\xff\xfcBLMF"
+    DEFAULT_BITS_PER_KEY = 10
+
+    __header = struct.Struct(">6sQQQQB")
+    __min_capacity = 64
+
+    def __init__(self, capacity: int, bits_per_key: int = DEFAULT_BITS_PER_KEY):
+        """
+        Args:
+            capacity: Number of keys filter is sized for, false positive rate grows past it
+            bits_per_key: Bits of filter per key, 10 gives about 1% false positives
+        """
+
+        self.capacity = max(capacity, BloomFilter.__min_capacity)
+        self.count = 0
+        self.__bits_count = self.capacity * bits_per_key
+        self.__hashes_count = max(1, round(bits_per_key * math.log(2)))
+        self.__bits = bytearray((self.__bits_count + 7) // 8)
+
+    @classmethod
+    def from_keys(cls, keys, capacity: int) -> "BloomFilter":
+        """
+        Builds filter of keys sized for capacity keys
+        """
+
+        bloom = cls(capacity)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    @property
+    def saturated(self) -> bool:
+        """
+        Whether more keys were added than filter is sized for
+        """
+
+        return self.count > self.capacity
+
+    def add(self, key) -> None:
+        """
+        Adds key to filter
+        """
+
+        bits = self.__bits
+        for position in self.__positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key) -> bool:
+        bits = self.__bits
+        for position in self.__positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __positions(self, key):
+        # Double hashing: k positions are derived from two halves of one digest
+        digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8])
+        second = int.from_bytes(digest[8:]) | 1
+        bits_count = self.__bits_count
+        return [(first + i * second) % bits_count for i in range(self.__hashes_count)]
+
+    def write(self, filename: str, table_filename: str) -> None:
+        """
+        Writes filter of table_filename into file, table file must already be written
+        """
+
+        stat = os.stat(table_filename)
+        header = BloomFilter.__header.pack(
+            BloomFilter.MAGIC, stat.st_size, stat.st_mtime_ns, self.capacity, self.count, self.__hashes_count
+        )
+        with open(f"{filename}.tmp", "wb") as file:
+            file.write(header)
+            file.write(self.__bits)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{filename}.tmp", filename)
+
+    @classmethod
+    def read(cls, filename: str, table_filename: str) -> "BloomFilter | None":
+        """
+        Reads filter from file
+
+        Returns:
+            Filter, or None if it is missing, damaged or was built for another version of table file
+        """
+
+        try:
+            with open(filename, "rb") as file:
+                content = file.read()
+            stat = os.stat(table_filename)
+        except FileNotFoundError:
+            return None
+
+        if len(content) < BloomFilter.__header.size:
+            return None
+        magic, size, mtime_ns, capacity, count, hashes_count = BloomFilter.__header.unpack_from(content, 0)
+        bits = content[BloomFilter.__header.size:]
+        if magic != BloomFilter.MAGIC or (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            return None
+
+        bloom = cls(capacity, len(bits) * 8 // capacity)
+        if (bloom.__hashes_count, len(bloom.__bits)) != (hashes_count, len(bits)):
+            return None
+        bloom.__bits[:] = bits
+        bloom.count = count
+        return bloom
@@ -0,0 +1,367 @@
+"""
+Contains columnar table file format
+
+File consists of header, segment table and column segments, all little-endian:
+    header - magic, format version, key column, columns count, rows count, column types
+    segment table - for every column offset and size of data segment and of offsets segment
+    INT / LONG column - raw array of uint32 / uint64, loadable with numpy.memmap
+    string column - utf-8 data heap plus uint64 array of rows count + 1 heap offsets
+    DICT_STRING column - uint32 array of codes plus encoded StringDictionary (in place of offsets)
+
+Segments are aligned to 64 bytes. Rows are sorted by key like in row format,
+so key lookups are binary searches over the key column.
+NumPy is optional: without it numeric columns are zero-copy memoryviews over mmap.
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from data_entry import ColumnType, DataEntry, StringDictionary
+
+_np = None
+_numpy_checked = False
+
+
+def _numpy():
+    """
+    Imports NumPy on first use, as it takes most of the startup time of short programs.
+    Returns None if NumPy is not installed
+    """
+
+    global _np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            pass
+        _numpy_checked = True
+    return _np
+
+MAGIC = b"\xff\xfeCOLS"
+
+_FORMAT_VERSION = 1
+_ALIGNMENT = 64
+_header = struct.Struct("<6sHHHQ")
+_segment = struct.Struct("<QQQQ")
+_array_codes = {ColumnType.INT: "I", ColumnType.LONG: "Q"}
+_numpy_types = {ColumnType.INT: "<u4", ColumnType.LONG: "<u8", ColumnType.DICT_STRING: "<u4"}
+_segment_codes = {**_array_codes, ColumnType.DICT_STRING: "I"}
+
+
+def is_numeric(column_type: int) -> bool:
+    """
+    Checks whether column is stored as numeric array
+    """
+
+    return column_type in _array_codes
+
+
+def is_columnar_file(filename: str) -> bool:
+    """
+    Checks whether file starts with columnar format magic
+    """
+
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def read_columnar_metadata(filename: str) -> tuple[int, list[int], int]:
+    """
+    Reads schema and row count of columnar file
+
+    Returns:
+        (key column, column types, rows count)
+    """
+
+    with open(filename, "rb") as file:
+        magic, version, key_col, columns_count, row_count = _header.unpack(file.read(_header.size))
+        if magic != MAGIC or version != _FORMAT_VERSION:
+            raise ValueError(f"{filename} is not a columnar table file")
+        return key_col, list(file.read(columns_count)), row_count
+
+
+def _normalize_string(value: str, column_type: int) -> bytes:
+    # Same truncation as fixed-width row format, so both formats give equal values back
+    if column_type == ColumnType.VAR_STRING:
+        return value.encode("utf-8")
+    return value.encode("utf-8")[:ColumnType.get_size(column_type)].rstrip(b"\x00")
+
+
+def _nbytes(buffer) -> int:
+    return memoryview(buffer).nbytes
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def write_columnar(filename: str, key_col: int, column_types: list[int], data_entries) -> None:
+    """
+    Writes rows sorted by key into columnar file.
+    Columns are collected in compact buffers first, then the file is written into
+    a temporary file which atomically replaces the target
+    """
+
+    buffers = []
+    for column_type in column_types:
+        if is_numeric(column_type):
+            buffers.append(array(_array_codes[column_type]))
+        elif column_type == ColumnType.DICT_STRING:
+            buffers.append((array("I"), StringDictionary()))
+        else:
+            buffers.append((array("Q", [0]), bytearray()))
+
+    row_count = 0
+    for data_entry in data_entries:
+        row_count += 1
+        for value, column_type, buffer in zip(data_entry.columns, column_types, buffers):
+            if is_numeric(column_type):
+                buffer.append(value)
+            elif column_type == ColumnType.DICT_STRING:
+                codes, dictionary = buffer
+                codes.append(dictionary.add(value))
+            else:
+                offsets, heap = buffer
+                heap += _normalize_string(value, column_type)
+                offsets.append(len(heap))
+
+    segments = []
+    for column_type, buffer in zip(column_types, buffers):
+        if is_numeric(column_type):
+            if sys.byteorder == "big":
+                buffer.byteswap()
+            segments.append((buffer, None))
+        elif column_type == ColumnType.DICT_STRING:
+            codes, dictionary = buffer
+            if sys.byteorder == "big":
+                codes.byteswap()
+            segments.append((codes, dictionary.encode()))
+        else:
+            offsets, heap = buffer
+            if sys.byteorder == "big":
+                offsets.byteswap()
+            segments.append((heap, offsets))
+
+    offset = _align(_header.size + len(column_types) + _segment.size * len(column_types))
+    table = []
+    layout = []
+    for data, offsets in segments:
+        data_size = _nbytes(data)
+        data_offset = offset
+        offset = _align(offset + data_size)
+        offsets_offset, offsets_size = 0, 0
+        if offsets is not None:
+            offsets_offset, offsets_size = offset, _nbytes(offsets)
+            offset = _align(offset + offsets_size)
+        table.append(_segment.pack(data_offset, data_size, offsets_offset, offsets_size))
+        layout.append((data_offset, data))
+        if offsets is not None:
+            layout.append((offsets_offset, offsets))
+
+    tmp_filename = f"{filename}.tmp"
+    try:
+        with open(tmp_filename, "wb") as file:
+            file.write(_header.pack(MAGIC, _FORMAT_VERSION, key_col, len(column_types), row_count))
+            file.write(bytes(column_types))
+            file.write(b"".join(table))
+            for segment_offset, data in layout:
+                file.write(bytes(segment_offset - file.tell()))
+                file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+class ColumnarRows:
+    """
+    Rows of columnar table file, read through mmap.
+    Column is read only when it is touched: numeric columns are zero-copy views over
+    the file (numpy.memmap if NumPy is installed), string columns are decoded on demand
+    """
+
+    def __init__(self, filename: str):
+        with open(filename, "rb") as file:
+            self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.key_col, columns_count, self.__count = _header.unpack_from(self.__map, 0)
+        if magic != MAGIC or version != _FORMAT_VERSION:
+            self.__map.close()
+            raise ValueError(f"{filename} is not a columnar table file")
+
+        self.__filename = filename
+        self.column_types = list(self.__map[_header.size:_header.size + columns_count])
+        table_offset = _header.size + columns_count
+        self.__segments = [
+            _segment.unpack_from(self.__map, table_offset + i * _segment.size) for i in range(columns_count)
+        ]
+        self.__arrays = {}
+        self.__strings = {}
+        self.__dictionaries = {}
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __iter__(self):
+        columns = [self.column_values(i) for i in range(len(self.column_types))]
+        for values in zip(*columns):
+            yield DataEntry(list(values))
+
+    def column(self, index: int):
+        """
+        Gets numeric column as array without copying (numpy array if NumPy is installed),
+        DICT_STRING column as such array of codes (see dictionary()), string column as list of str
+        """
+
+        column_type = self.column_types[index]
+        if column_type not in _segment_codes:
+            return self.column_values(index)
+
+        if index not in self.__arrays:
+            data_offset, data_size, _, _ = self.__segments[index]
+            np = _numpy()
+            if np is not None:
+                if self.__count == 0:
+                    column = np.zeros(0, dtype=_numpy_types[column_type])
+                else:
+                    column = np.memmap(
+                        self.__filename, dtype=_numpy_types[column_type], mode="r",
+                        offset=data_offset, shape=(self.__count,)
+                    )
+            elif sys.byteorder == "little":
+                column = memoryview(self.__map)[data_offset:data_offset + data_size].cast(_segment_codes[column_type])
+            else:
+                column = array(_segment_codes[column_type], self.__map[data_offset:data_offset + data_size])
+                column.byteswap()
+            self.__arrays[index] = column
+
+        return self.__arrays[index]
+
+    def dictionary(self, index: int) -> StringDictionary:
+        """
+        Gets dictionary of DICT_STRING column
+        """
+
+        if index not in self.__dictionaries:
+            _, _, dictionary_offset, _ = self.__segments[index]
+            self.__dictionaries[index] = StringDictionary.decode_from(self.__map, dictionary_offset)[0]
+        return self.__dictionaries[index]
+
+    def column_values(self, index: int) -> list:
+        """
+        Gets column as list of Python values
+        """
+
+        column_type = self.column_types[index]
+        if is_numeric(column_type):
+            return self.column(index).tolist()
+
+        if index not in self.__strings:
+            if column_type == ColumnType.DICT_STRING:
+                values = self.dictionary(index).values
+                self.__strings[index] = [values[code] for code in self.column(index).tolist()]
+            else:
+                self.__strings[index] = [self.value_at(index, row) for row in range(self.__count)]
+        return self.__strings[index]
+
+    def value_at(self, index: int, row: int):
+        """
+        Gets value of one column in one row
+        """
+
+        if index in self.__strings:
+            return self.__strings[index][row]
+        if is_numeric(self.column_types[index]):
+            return int(self.column(index)[row])
+        if self.column_types[index] == ColumnType.DICT_STRING:
+            return self.dictionary(index).values[int(self.column(index)[row])]
+
+        data_offset, _, offsets_offset, _ = self.__segments[index]
+        start, end = struct.unpack_from("<QQ", self.__map, offsets_offset + row * 8)
+        return self.__map[data_offset + start:data_offset + end].decode("utf-8", "ignore")
+
+    def key_at(self, row: int):
+        """
+        Gets key of row by index
+        """
+
+        return self.value_at(self.key_col, row)
+
+    def row_at(self, row: int) -> DataEntry:
+        """
+        Gets row by index
+        """
+
+        return DataEntry([self.value_at(i, row) for i in range(len(self.column_types))])
+
+    def lower_bound(self, key) -> int:
+        """
+        Gets index of first row with key not less than given
+        """
+
+        return self.__bound(key, "left")
+
+    def upper_bound(self, key) -> int:
+        """
+        Gets index of first row with key greater than given
+        """
+
+        return self.__bound(key, "right")
+
+    def __bound(self, key, side: str) -> int:
+        key_type = self.column_types[self.key_col]
+        np = _numpy()
+        if np is not None and is_numeric(key_type):
+            # Keys out of unsigned range can not be converted to array type
+            if key < 0:
+                return 0
+            if key >= 1 << (8 * ColumnType.get_size(key_type)):
+                return self.__count
+            return int(np.searchsorted(self.column(self.key_col), key, side=side))
+
+        search = bisect_left if side == "left" else bisect_right
+        return search(range(self.__count), key, key=self.key_at)
+
+    def find(self, key) -> list[DataEntry]:
+        """
+        Searches for all rows with key
+        """
+
+        return self.find_range(key, key)
+
+    def find_range(self, low=None, high=None) -> list[DataEntry]:
+        """
+        Gets rows with low <= key <= high, bound set to None is not checked
+        """
+
+        start = 0 if low is None else self.lower_bound(low)
+        end = self.__count if high is None else self.upper_bound(high)
+        return [self.row_at(row) for row in range(start, end)]
+
+    def select_columns(self, indexes: list[int]) -> list[list]:
+        """
+        Gets projection of all rows on given columns, other columns are not read
+        """
+
+        columns = [self.column_values(i) for i in indexes]
+        return [list(values) for values in zip(*columns)] if columns else [[] for _ in range(self.__count)]
+
+    def close(self) -> None:
+        """
+        Unmaps file
+        """
+
+        self.__arrays.clear()
+        try:
+            self.__map.close()
+        except BufferError:
+            # Column view is still referenced outside, mapping is released with it
+            pass
@@ -6,100 +6,24 @@ tree-based database implementations. It supports multiple tree data structures
 (AVL, B-Tree, Red-Black, Splay, Treap) and provides a simple SQL-like query interface.
 """
 
-from typing import Any
-from data_entry import ColumnType
+import sys
+import time
+from typing import Any, Iterable
 from database import Database
-from avl_tree import AVLTree
-from b_tree import SmallBTree, MediumBTree, BigBTree, TwoThreeTree
-from red_black_tree import RedBlackTree
-from splay_tree import SplayTree
-from treap import Treap
-
-
-class QueryError(Exception):
-    """Custom exception for query parsing and execution errors."""
-
-
-def validate_table_name(table_name: str) -> str:
-    """
-    Validates a table name to ensure it contains only valid characters.
-
-    Args:
-        table_name: The name of the table to validate
-
-    Returns:
-        The validated table name
-
-    Raises:
-        QueryError: If the table name contains invalid characters
-    """
-    # Basic validation - could be expanded with more specific rules
-    if not table_name or not isinstance(table_name, str):
-        raise QueryError("Table name must be a non-empty string")
-
-    # Check for invalid characters (basic sanitization)
-    invalid_chars = "\"';\\/"
-    if any(char in table_name for char in invalid_chars):
-        raise QueryError(f"Table name contains invalid characters: {invalid_chars}")
-
-    return table_name
-
-
-def validate_column_names(column_names: list[str]) -> list[str]:
-    """
-    Validates a list of column names to ensure they contain only valid characters.
-
-    Args:
-        column_names: list of column names to validate
-
-    Returns:
-        The validated list of column names
-
-    Raises:
-        QueryError: If any column name contains invalid characters
-    """
-    if not column_names:
-        raise QueryError("At least one column must be specified")
-
-    validated_columns = []
-    for col in column_names:
-        if not isinstance(col, str):
-            raise QueryError(f"Column name must be a string, got {type(col).__name__}")
-
-        # Check for invalid characters (basic sanitization)
-        invalid_chars = "\"';\\/"
-        if any(char in col for char in invalid_chars):
-            raise QueryError(f"Column name contains invalid characters: {invalid_chars}")
-
-        validated_columns.append(col)
-
-    return validated_columns
-
-
-def validate_values(values: list) -> list:
-    """
-    Validates a list of values to be inserted into a table.
-
-    Args:
-        values: list of values to validate
-
-    Returns:
-        The validated list of values
-
-    Raises:
-        QueryError: If values are invalid
-    """
-    if not values:
-        raise QueryError("No values provided for insertion")
-
-    # Further validation could be added based on expected types
-    return values
+from query import (
+    QueryError, session_for, shape_tokens, split_statements, tokenize,
+    validate_table_name, validate_column_names, validate_values
+)
+import tree_registry
 
 
 def parse_query(args: list[str], db: Database) -> Any | None:
     """
     Parses and executes a SQL-like query against the database.
 
+    Queries of the same shape share one cached, precompiled plan (see query.py),
+    prepared statements are kept per database.
+
     Args:
         args: list of query arguments/tokens
         db: Database instance to execute the query against
@@ -113,121 +37,7 @@ def parse_query(args: list[str], db: Database) -> Any | None:
     if not args:
         raise QueryError("Empty query")
 
-    # Normalize arguments
-    args = [s.lower().strip("(),") for s in args]
-    args = [int(s) if s.isdigit() else s for s in args]
-
-    try:
-        match args[0]:
-            case "select":
-                # Find the FROM keyword to separate columns from table name
-                try:
-                    from_index = args.index("from")
-                except ValueError:
-                    raise QueryError("SELECT query must contain FROM keyword")
-
-                if from_index == len(args) - 1:
-                    raise QueryError("Table name missing after FROM")
-
-                columns = args[1:from_index]
-                table_name = args[from_index + 1]
-
-                # Validate inputs
-                validated_table_name = validate_table_name(table_name)
-                validated_columns = validate_column_names(columns)
-                if validated_columns == ["*"]:
-                    validated_columns = db.get_table_columns_names(validated_table_name)
-
-                # Execute query
-                return db.select(validated_columns, validated_table_name)
-
-            case "insert":
-                # Check if the query has enough arguments
-                if len(args) < 4:
-                    raise QueryError("INSERT query is too short")
-
-                # Validate the INSERT INTO syntax
-                if args[1] != "into":
-                    raise QueryError("INSERT query must have 'INTO' keyword")
-
-                # Extract and validate table name
-                table_name = args[2]
-                if not table_name or not isinstance(table_name, str):
-                    raise QueryError("Invalid table name")
-
-                # Extract and validate values section
-                values = args[3:]
-                if not values:
-                    raise QueryError("No values section in INSERT query")
-
-                if values[0] != "values":
-                    raise QueryError("INSERT query must have 'VALUES' keyword")
-
-                # Extract the actual values to insert
-                values = values[1:]
-                if not values:
-                    raise QueryError("No values provided for insertion")
-
-                # Perform the insertion
-                try:
-                    db.insert(table_name, values)
-                    return f"Successfully inserted data into {table_name}"
-                except Exception as e:
-                    raise QueryError(f"Failed to insert data: {str(e)}")
-            case "create":
-                # Check if the query has enough arguments
-                if len(args) < 4:
-                    raise QueryError("CREATE TABLE query is too short")
-
-                # Validate the CREATE TABLE syntax
-                if args[1] != "table":
-                    raise QueryError("CREATE query must have 'TABLE' keyword")
-
-                # Extract and validate table name
-                table_name = args[2]
-                validated_table_name = validate_table_name(table_name)
-
-                # Extract and validate columns section
-                columns = args[3:]
-                if not columns or len(columns) % 2 != 0:
-                    raise QueryError("CREATE TABLE query must have a valid column definition")
-                column_names, column_types = columns[0::2], columns[1::2]
-
-                # Extract column definitions
-                columns = []
-                for i in range(0, len(column_names)):
-                    col_name = column_names[i]
-                    col_type = column_types[i].upper()
-
-                    # Validate column name and type
-                    validated_col_name = validate_column_names([col_name])[0]
-                    match col_type:
-                        case "INT":
-                            col_type = ColumnType.INT
-                        case "LONG":
-                            col_type = ColumnType.LONG
-                        case "CHAR":
-                            col_type = ColumnType.CHAR
-                        case "SMALL_STRING":
-                            col_type = ColumnType.SMALL_STRING
-                        case "BIG_STRING":
-                            col_type = ColumnType.BIG_STRING
-                        case _:
-                            raise QueryError(f"Unsupported column type: {col_type}")
-
-                    columns.append((validated_col_name, col_type))
-
-                # Create the table in the database
-                db.create_table(validated_table_name, columns, 0)
-                return f"Table {validated_table_name} created successfully"
-
-            case _:
-                raise QueryError(f"Unsupported command: {args[0]}")
-    except Exception as e:
-        # Convert any database errors to QueryError for consistent handling
-        if not isinstance(e, QueryError):
-            raise QueryError(f"Database error: {str(e)}")
-        raise
+    return session_for(db).execute(args)
 
 
 def show_help():
@@ -243,19 +53,129 @@ def show_help():
       mb, medium-btree - B-Tree with m = 35
       bb, big-btree - B-Tree with m = 100
       b23, two-three-tree - B-Tree with m = 3 (two-three tree)
+      pb, paged-btree - B-Tree stored in file pages (for tables larger than memory)
       rb, red-black - Red-Black Tree
       sp, splay  - Splay Tree
       tr, treap  - Treap
+      ub, unbalanced - Unbalanced binary search tree
+      Other backends can be installed as "sbbst.tree_backends" entry points (see tree_registry.py)
 
     Options:
       --help     - Show this help message
       -q <query> - Execute a SQL-like query
       -i         - Interactive mode
+      -f <file>  - Execute statements from script file, separated by ";" or new lines
+                 (lines starting with "--" are comments); database is loaded and saved once,
+                 consecutive INSERTs into one table are inserted as a batch
+      --stdin    - Same as -f, reading statements from standard input
+      --serve [host:]port - Keep database loaded and serve queries over TCP (see query_server.py),
+                 database is saved when server is stopped with Ctrl+C
 
     Query Examples:
       SELECT col1 col2 FROM table_name
+      SELECT * FROM table_name WHERE col1 = 5 AND col2 != abc
       INSERT INTO table_name VALUES val1 val2 val3
+      UPDATE table_name SET col2 = val WHERE col1 = 5
+      DELETE FROM table_name WHERE col1 = 5
+      CREATE TABLE table_name col1 INT col2 SMALL_STRING
+      CREATE TABLE table_name col1 INT col2 VAR_STRING
+      CREATE TABLE table_name col1 INT col2 DICT_STRING
+      CREATE TABLE table_name col1 INT col2 LONG STORED AS COLUMNAR
+      CREATE TABLE table_name col1 INT col2 LONG STORED AS LSM
+      PREPARE ins AS INSERT INTO table_name VALUES ?, ?
+      EXECUTE ins 6, 'quoted value'
+    """
+
+
+def run_script(db: Database, lines: Iterable[str], batch_size: int = 10000) -> dict[str, list]:
+    """
+    Executes statements from lines, prints results of statements other than INSERT,
+    errors and timing summary, then saves database once.
+
+    Args:
+        db: Database instance to execute statements against
+        lines: Script lines, each holding statements separated by ";"
+        batch_size: Maximal number of consecutive INSERTs inserted as one batch
+
+    Returns:
+        Dictionary from statement shape to [count, total seconds]
     """
+    session = session_for(db)
+    timings = {}
+    batch = []
+    batch_table = None
+    errors = 0
+    statements = 0
+    start = time.perf_counter()
+
+    def record(shape: str, count: int, seconds: float):
+        timing = timings.setdefault(shape, [0, 0.0])
+        timing[0] += count
+        timing[1] += seconds
+
+    def flush():
+        nonlocal errors
+        if not batch:
+            return
+        flush_start = time.perf_counter()
+        try:
+            db.insert_many(batch_table, [values for _, values in batch])
+        except Exception as e:
+            errors += len(batch)
+            print(f"Error in {len(batch)} INSERT statements into {batch_table}: {str(e)}")
+        # Batch insert time is shared by its statements
+        share = (time.perf_counter() - flush_start) / len(batch)
+        for shape, _ in batch:
+            record(shape, 0, share)
+        batch.clear()
+
+    for line_number, line in enumerate(lines, 1):
+        if line.lstrip().startswith("--"):
+            continue
+        try:
+            line_statements = split_statements(line)
+        except QueryError as e:
+            errors += 1
+            print(f"Error in line {line_number}: {str(e)}")
+            continue
+
+        for statement in line_statements:
+            statements += 1
+            statement_start = time.perf_counter()
+            try:
+                insert = session.compile_insert(statement)
+                if insert is not None:
+                    shape, table_name, values = insert
+                    if table_name != batch_table or len(batch) >= batch_size:
+                        flush()
+                        batch_table = table_name
+                    batch.append((shape, values))
+                    record(shape, 1, time.perf_counter() - statement_start)
+                    continue
+
+                # Anything else may read or change rows of the batch, so it goes first
+                flush()
+                statement_start = time.perf_counter()
+                result = session.execute(statement)
+                record(shape_tokens(tokenize(statement))[0], 1, time.perf_counter() - statement_start)
+                if result is not None:
+                    print(f"Result: {result}")
+            except QueryError as e:
+                errors += 1
+                print(f"Error in line {line_number}: {str(e)}")
+
+    flush()
+    save_start = time.perf_counter()
+    db.save()
+    save_time = time.perf_counter() - save_start
+
+    print(f"Executed {statements} statements in {time.perf_counter() - start:.3f} s "
+          f"({errors} errors, save {save_time:.3f} s)")
+    print(f"{'count':>10} {'total s':>10} {'avg ms':>10}  statement")
+    for shape, (count, seconds) in sorted(timings.items(), key=lambda item: -item[1][1]):
+        print(f"{count:>10} {seconds:>10.3f} {seconds * 1000 / max(count, 1):>10.3f}  {shape}")
+
+    return timings
 
 
 def run_interactive_mode(db: Database):
@@ -266,28 +186,46 @@ def run_interactive_mode(db: Database):
         db: Database instance to execute queries against
     """
     print("Interactive mode. Type 'exit' to quit, 'help' for query syntax.")
+    session = session_for(db)
 
     while True:
         try:
+            if db.background_save_running and db.poll_background_save():
+                if db.background_save_error is None:
+                    print("Background save finished")
+                else:
+                    print(f"Background save failed: {db.background_save_error}")
+
             user_input = input("Query> ").strip()
 
             if user_input.lower() == 'exit':
                 print("Exiting interactive mode")
                 break
 
+            if user_input.lower() == 'bgsave':
+                if db.background_save():
+                    print("Background save started")
+                else:
+                    print("Background save is already running")
+                continue
+
             if user_input.lower() == 'help':
                 print("""
                 Available commands:
-                  SELECT column1 column2 ... FROM table_name
+                  SELECT column1 column2 ... FROM table_name [WHERE column = value AND ...]
                   INSERT INTO table_name VALUES value1 value2 ...
+                  UPDATE table_name SET column = value [WHERE ...]
+                  DELETE FROM table_name [WHERE ...]
+                  PREPARE name AS query_with_?_placeholders
+                  EXECUTE name value1 value2 ...
+                  bgsave - Save database in background process
                   exit - Exit interactive mode
                   help - Show this help
                 """)
                 continue
 
-            # Split the input and parse as a query
-            query_parts = user_input.split()
-            result = parse_query(query_parts, db)
+            # Keep the raw line so quoted values with spaces survive
+            result = session.execute(user_input)
 
             if result is not None:
                 print("Result:", result)
@@ -350,6 +288,35 @@ def main(argv: list[str]):
         print(show_help())
     elif argv[0] == "-i":
         run_interactive_mode(db)
+    elif argv[0] == "-f":
+        if len(argv) < 2:
+            print("Error: No script file specified after -f")
+            return
+
+        try:
+            with open(argv[1], "r", encoding="utf-8") as file:
+                run_script(db, file)
+        except OSError as e:
+            print(f"Failed to read script: {str(e)}")
+    elif argv[0] == "--stdin":
+        run_script(db, sys.stdin)
+    elif argv[0] == "--serve":
+        if len(argv) < 2:
+            print("Error: No port specified after --serve")
+            return
+
+        # Server needs asyncio, so it is imported only by this mode
+        import asyncio
+        from query_server import serve
+
+        host, _, port = argv[1].rpartition(":")
+        try:
+            asyncio.run(serve(db, host or "127.0.0.1", int(port)))
+        except KeyboardInterrupt:
+            db.save()
+            print("Server stopped, database saved")
+        except (OSError, ValueError) as e:
+            print(f"Failed to start server: {str(e)}")
     elif argv[0] == "-q":
         if len(argv) < 2:
             print("Error: No query specified after -q")
@@ -371,6 +338,7 @@ def main(argv: list[str]):
 def get_tree_class(tree_name: str):
     """
     Get the appropriate tree class based on the tree name.
+    Backend module is imported on first use (see tree_registry.py).
 
     Args:
         tree_name: Name of the tree implementation to use
@@ -381,25 +349,7 @@ def get_tree_class(tree_name: str):
     Raises:
         ValueError: If the tree name is not recognized
     """
-    match tree_name.lower():
-        case "avl":
-            return AVLTree
-        case "sb" | "small-btree":
-            return SmallBTree
-        case "mb" | "medium-btree":
-            return MediumBTree
-        case "bb" | "big-btree":
-            return BigBTree
-        case "b23" | "two-three-tree":
-            return TwoThreeTree
-        case "rb" | "red-black":
-            return RedBlackTree
-        case "sp" | "splay":
-            return SplayTree
-        case "tr" | "treap":
-            return Treap
-        case _:
-            raise ValueError(f"{tree_name} is not a valid tree type")
+    return tree_registry.get_tree_class(tree_name)
 
 
 def run_test_mode():
@@ -410,7 +360,7 @@ def run_test_mode():
         print("Running in test mode...")
 
         # Initialize test database with Treap structure
-        start_db = Database(Treap, "test_database")
+        start_db = Database(get_tree_class("treap"), "test_database")
 
         if not start_db.get_tables_names():
             print("Creating test tables...")
@@ -440,7 +390,7 @@ def run_test_mode():
             print("Test data created and saved.")
 
         # Load the database with a different tree structure to test compatibility
-        loaded_db = Database(SplayTree, "test_database")
+        loaded_db = Database(get_tree_class("splay"), "test_database")
         print("Tables in database:", loaded_db.get_tables_names())
         print("Columns in 'another_table':", loaded_db.get_table_columns_names("another_table"))
         print("Data in 'another_table':", loaded_db.get_table("another_table").tree.inorder())
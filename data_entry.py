@@ -2,6 +2,9 @@
 Contains data entry representation
 """
 
+import struct
+import sys
+
 class ColumnType:
     """
     Represents different types of database columns
@@ -12,6 +15,8 @@ class ColumnType:
     CHAR = 2
     SMALL_STRING = 3
     BIG_STRING = 4
+    VAR_STRING = 5
+    DICT_STRING = 6
 
     @staticmethod
     def get_size(column_type: int):
@@ -30,6 +35,12 @@ class ColumnType:
                 return 16
             case ColumnType.BIG_STRING:
                 return 256
+            case ColumnType.VAR_STRING:
+                # Size of slot in row, string itself is stored in table string heap
+                return 8
+            case ColumnType.DICT_STRING:
+                # Size of code in row, string itself is stored in column dictionary
+                return 4
             case _:
                 return -1
 
@@ -64,6 +75,289 @@ class ColumnType:
                 return None
 
 
+class StringDictionary:
+    """
+    Distinct strings of one DICT_STRING column, each string is referenced by its code
+    (index in values). Strings are interned, so all rows share one object per value
+    """
+
+    __size = struct.Struct(">I")
+
+    def __init__(self, values=()):
+        self.values = []
+        self.__codes = {}
+        for value in values:
+            self.add(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add(self, value: str) -> int:
+        """
+        Gets code of string, adding it to dictionary if it is new
+        """
+
+        code = self.__codes.get(value)
+        if code is None:
+            code = len(self.values)
+            value = sys.intern(value)
+            self.values.append(value)
+            self.__codes[value] = code
+        return code
+
+    def lookup(self, value: str) -> int | None:
+        """
+        Gets code of string, or None if dictionary does not contain it
+        """
+
+        return self.__codes.get(value)
+
+    def encode(self) -> bytes:
+        """
+        Converts dictionary into raw bytes: values count, then length and utf-8 bytes of each value
+        """
+
+        parts = [StringDictionary.__size.pack(len(self.values))]
+        for value in self.values:
+            encoded = value.encode("utf-8")
+            parts.append(StringDictionary.__size.pack(len(encoded)))
+            parts.append(encoded)
+        return b"".join(parts)
+
+    @classmethod
+    def decode_from(cls, buffer, offset: int = 0) -> tuple["StringDictionary", int]:
+        """
+        Reads dictionary at offset in buffer
+
+        Returns:
+            (dictionary, offset right after it)
+        """
+
+        dictionary = cls()
+        (count,) = StringDictionary.__size.unpack_from(buffer, offset)
+        offset += StringDictionary.__size.size
+        for _ in range(count):
+            (length,) = StringDictionary.__size.unpack_from(buffer, offset)
+            offset += StringDictionary.__size.size
+            dictionary.add(str(buffer[offset:offset + length], "utf-8"))
+            offset += length
+        return dictionary, offset
+
+
+class RowLayout:
+    """
+    Precompiled binary layout of fixed-width row.
+    Encodes and decodes whole rows with one struct call instead of per-column conversions.
+
+    VAR_STRING column keeps fixed 8-byte slot in row: offset of string in string heap
+    (upper 40 bits) and its length in bytes (lower 24 bits). Layouts with such columns
+    take the heap as an extra argument: encoding appends strings to it, decoding reads them
+
+    DICT_STRING column keeps 4-byte code in row, strings are stored in one StringDictionary
+    per such column. Layouts with them take list of dictionaries (in column order) the same way.
+    Heap and dictionaries are "strings" of encoded rows, stored after the rows (see encode_strings)
+    """
+
+    __formats = {
+        ColumnType.INT: "I",
+        ColumnType.LONG: "Q",
+        ColumnType.CHAR: "1s",
+        ColumnType.SMALL_STRING: "16s",
+        ColumnType.BIG_STRING: "256s",
+        ColumnType.VAR_STRING: "Q",
+        ColumnType.DICT_STRING: "I",
+    }
+    __block_size = 8
+    __length_bits = 24
+    __offset_bits = 40
+
+    def __init__(self, column_types: list[int]):
+        self.column_types = list(column_types)
+        formats = [RowLayout.__formats[col_type] for col_type in column_types]
+        self.__struct = struct.Struct(">" + "".join(formats))
+        self.__offsets = [struct.calcsize(">" + "".join(formats[:i])) for i in range(len(formats))]
+        self.__string_cols = [
+            i for i, col_type in enumerate(column_types)
+            if col_type in (ColumnType.CHAR, ColumnType.SMALL_STRING, ColumnType.BIG_STRING)
+        ]
+        self.__var_cols = [i for i, col_type in enumerate(column_types) if col_type == ColumnType.VAR_STRING]
+        self.__dict_cols = [i for i, col_type in enumerate(column_types) if col_type == ColumnType.DICT_STRING]
+
+    @property
+    def has_heap(self) -> bool:
+        """
+        Whether layout has variable-length columns stored in string heap
+        """
+
+        return bool(self.__var_cols)
+
+    @property
+    def has_dictionaries(self) -> bool:
+        """
+        Whether layout has dictionary encoded columns
+        """
+
+        return bool(self.__dict_cols)
+
+    @property
+    def has_strings(self) -> bool:
+        """
+        Whether encoded rows need heap or dictionaries stored next to them
+        """
+
+        return self.has_heap or self.has_dictionaries
+
+    @property
+    def dictionary_columns(self) -> list[int]:
+        """
+        Gets indexes of DICT_STRING columns, n-th dictionary belongs to n-th of them
+        """
+
+        return self.__dict_cols
+
+    def new_strings(self) -> tuple[bytearray | None, list[StringDictionary] | None]:
+        """
+        Creates empty heap and dictionaries for encoding rows (None where layout does not need them)
+        """
+
+        heap = bytearray() if self.has_heap else None
+        dictionaries = [StringDictionary() for _ in self.__dict_cols] if self.has_dictionaries else None
+        return heap, dictionaries
+
+    def encode_strings(self, heap: bytearray | None, dictionaries: list[StringDictionary] | None) -> bytes:
+        """
+        Converts heap and dictionaries of encoded rows into raw bytes:
+        dictionaries block prefixed with its size, then heap
+        """
+
+        content = b""
+        if self.has_dictionaries:
+            block = b"".join(dictionary.encode() for dictionary in dictionaries)
+            content += len(block).to_bytes(RowLayout.__block_size, "big") + block
+        if self.has_heap:
+            content += heap
+        return content
+
+    def decode_strings(self, buffer) -> tuple:
+        """
+        Reads heap and dictionaries written by encode_strings, heap is a slice of buffer
+
+        Returns:
+            (heap, dictionaries), None where layout does not need them
+        """
+
+        offset = 0
+        dictionaries = None
+        if self.has_dictionaries:
+            dictionaries = []
+            offset = RowLayout.__block_size
+            for _ in self.__dict_cols:
+                dictionary, offset = StringDictionary.decode_from(buffer, offset)
+                dictionaries.append(dictionary)
+        heap = buffer[offset:] if self.has_heap else None
+        return heap, dictionaries
+
+    @property
+    def row_size(self) -> int:
+        """
+        Gets size of encoded row in bytes
+        """
+
+        return self.__struct.size
+
+    def column_offset(self, column: int) -> int:
+        """
+        Gets offset of column inside encoded row
+        """
+
+        return self.__offsets[column]
+
+    def encode(self, columns: list, heap: bytearray | None = None, dictionaries: list | None = None) -> bytes:
+        """
+        Converts row columns into raw bytes, variable-length strings are appended to heap
+        and new dictionary strings to dictionaries
+        """
+
+        return self.__struct.pack(*self.__prepare(columns, heap, dictionaries))
+
+    def encode_into(self, buffer, offset: int, columns: list, heap: bytearray | None = None,
+                    dictionaries: list | None = None) -> None:
+        """
+        Writes row columns as raw bytes into buffer at offset
+        """
+
+        self.__struct.pack_into(buffer, offset, *self.__prepare(columns, heap, dictionaries))
+
+    def decode(self, raw, heap=None, dictionaries: list | None = None) -> list:
+        """
+        Converts raw bytes of one row into columns
+        """
+
+        return self.__finish(self.__struct.unpack(raw), heap, dictionaries)
+
+    def decode_from(self, buffer, offset: int, heap=None, dictionaries: list | None = None) -> list:
+        """
+        Converts raw bytes of row at offset in buffer into columns
+        """
+
+        return self.__finish(self.__struct.unpack_from(buffer, offset), heap, dictionaries)
+
+    def iter_decode(self, buffer, heap=None, dictionaries: list | None = None):
+        """
+        Converts buffer of consecutive rows into columns lists, one row at a time.
+        Trailing incomplete row is ignored
+        """
+
+        usable = len(buffer) - len(buffer) % self.row_size
+        for values in self.__struct.iter_unpack(memoryview(buffer)[:usable]):
+            yield self.__finish(values, heap, dictionaries)
+
+    def __prepare(self, columns: list, heap: bytearray | None, dictionaries: list | None) -> list:
+        values = list(columns)
+        for i in self.__string_cols:
+            values[i] = values[i].encode("utf-8")
+
+        if self.__var_cols:
+            if heap is None:
+                raise ValueError("Layout with VAR_STRING columns needs a string heap")
+            for i in self.__var_cols:
+                encoded = values[i].encode("utf-8")
+                if len(encoded) >> RowLayout.__length_bits or len(heap) >> RowLayout.__offset_bits:
+                    raise ValueError("VAR_STRING value or string heap is too large")
+                values[i] = (len(heap) << RowLayout.__length_bits) | len(encoded)
+                heap += encoded
+
+        if self.__dict_cols:
+            if dictionaries is None:
+                raise ValueError("Layout with DICT_STRING columns needs dictionaries")
+            for i, dictionary in zip(self.__dict_cols, dictionaries):
+                values[i] = dictionary.add(values[i])
+
+        return values
+
+    def __finish(self, values: tuple, heap, dictionaries: list | None) -> list:
+        columns = list(values)
+        for i in self.__string_cols:
+            # struct truncates by bytes, so a multibyte character may be cut at the end
+            columns[i] = columns[i].rstrip(b"\x00").decode("utf-8", "ignore")
+
+        if self.__var_cols:
+            if heap is None:
+                raise ValueError("Layout with VAR_STRING columns needs a string heap")
+            for i in self.__var_cols:
+                start = columns[i] >> RowLayout.__length_bits
+                end = start + (columns[i] & ((1 << RowLayout.__length_bits) - 1))
+                columns[i] = str(heap[start:end], "utf-8")
+
+        if self.__dict_cols:
+            if dictionaries is None:
+                raise ValueError("Layout with DICT_STRING columns needs dictionaries")
+            for i, dictionary in zip(self.__dict_cols, dictionaries):
+                columns[i] = dictionary.values[columns[i]]
+
+        return columns
+
+
 class DataEntry:
     """
     Represents data entry (row) of database
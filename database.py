@@ -4,72 +4,583 @@ Implements database functional
 
 import os
 import shutil
+from collections import deque
+import tree_registry
 from database_table import DatabaseTable
 from data_entry import ColumnType, DataEntry
+from wal import WriteAheadLog
+from workload import BackendAdvisor, Decision
 class Database:
     """
     Represents database
     """
 
     __config_file = "db_data.cnf"
+    __wal_file = "db_wal.log"
+    __snapshot_suffix = ".bgsave"
+    __old_suffix = ".old"
+    __error_size = 4096
+    __decision_log_size = 1000
+
+    def __init__(
+            self, tree_type, db_folder_path: str, save_on_exit: bool = True,
+            use_wal: bool = False, wal_batch_size: int = 1, wal_sync_interval: float = 0.0,
+            mapped: bool = False, cache_bytes: int | None = None
+            ):
+        """
+        Opens database from folder (folder is created on first save).
+
+        Args:
+            tree_type: Tree class used for tables (unless table was converted to another one
+                by convert_table). On-disk tree type (PagedBTree) keeps table pages in table
+                files and writes them in place, so its changes reach the files even without save
+            db_folder_path: Database folder
+            save_on_exit: Whether to save database when the object is destroyed
+            use_wal: Whether to log every modification to write-ahead log, so that it survives
+                a crash before next save; log is replayed on open and emptied by save
+            wal_batch_size: Number of log records written between fsync calls
+            wal_sync_interval: If positive, log is also fsynced in background this often (seconds)
+            mapped: Whether to open table files through mmap and answer reads by binary search
+                over them; table is loaded into tree only when it is modified
+            cache_bytes: Memory budget of buffer pool of every paged table (see PagedBTree),
+                PagedBTree.DEFAULT_CACHE_BYTES if None
+
+        Table files are not read here: each table is opened on first get_table call, or by preload()
+        """
 
-    def __init__(self, tree_type, db_folder_path: str):
         self.__db_folder_path = db_folder_path
         self.__tree_type = tree_type
+        self.__save_on_exit = save_on_exit
         self.__tables = {}
+        # Backend names of tables converted to other tree types than tree_type
+        self.__table_tree_types = {}
+        self.__dropped_tables = set()
+        self.__config_dirty = False
+        self.__wal = None
+        self.__mapped = mapped
+        self.__cache_bytes = cache_bytes
+        self.__schema_version = 0
+        self.__background_save = None
+        self.__background_save_error = None
+        self.__advisor = None
+        self.__advise_interval = 0
+        self.__auto_migrate = False
+        self.__workload_window = 0
+        self.__decisions = deque(maxlen=Database.__decision_log_size)
+        self.__change_listeners = []
+
+        self.__recover_background_save()
+        self.__load_config()
+
+        if use_wal:
+            self.__wal = WriteAheadLog(f"{db_folder_path}/{Database.__wal_file}", wal_batch_size, wal_sync_interval)
+            self.__replay_wal()
+
+    def __load_config(self):
+        if not os.path.exists(f"{self.__db_folder_path}/{Database.__config_file}"):
+            return
+
+        with open(f"{self.__db_folder_path}/{Database.__config_file}", "rb") as file:
+            all_table_data = file.read().decode("utf-8")
+
+        if not all_table_data:
+            return
+
+        # Table files are opened by get_table on first access.
+        # Table name is followed by "@backend" if table has its own tree type
+        for table_data in all_table_data.split("\n"):
+            column_names = table_data.split(" ")
+            table_name, _, tree_name = column_names.pop(0).partition("@")
+            if tree_name:
+                self.__table_tree_types[table_name] = tree_name
+
+            self.__tables[table_name] = (column_names, None)
+
+    def __open_table(self, table_name: str):
+        open_table = DatabaseTable.open_mapped if self.__mapped else DatabaseTable.read_from_file
+        return open_table(
+            self.get_table_tree_type(table_name), f"{self.__db_folder_path}/{table_name}", self.__cache_bytes
+        )
 
-        if os.path.exists(f"{db_folder_path}/{Database.__config_file}"):
-            with open(f"{db_folder_path}/{Database.__config_file}", "rb") as file:
-                all_table_data = file.read().decode("utf-8")
+    def __replay_wal(self):
+        for record in self.__wal.replay(self.get_table):
+            self.apply_change(record)
 
-            if not all_table_data:
-                return
+    def apply_change(self, record: tuple):
+        """
+        Applies change record of write-ahead log or change stream (see add_change_listener).
+        Applied change is neither logged nor passed to change listeners
 
-            for table_data in all_table_data.split("\n"):
-                column_names = table_data.split(" ")
-                table_name = column_names.pop(0)
+        Args:
+            record: ("create", table_name, key_col, columns, storage_format), ("drop", table_name),
+                ("put", table_name, rows) replacing all rows with key of rows, or ("erase", table_name, key)
+        """
 
-                self.__tables[table_name] = (
-                    column_names,
-                    DatabaseTable.read_from_file(tree_type, f"{db_folder_path}/{table_name}")
-                )
+        match record:
+            case ("create", table_name, key_col, columns, storage_format):
+                if table_name in self.__tables:
+                    self.__drop_table(table_name)
+                self.__create_table(table_name, columns, key_col, storage_format)
+            case ("drop", table_name):
+                if table_name in self.__tables:
+                    self.__drop_table(table_name)
+            case ("put", table_name, rows):
+                table = self.get_table(table_name)
+                table.erase(rows[0][table.key_col])
+                for columns in rows:
+                    table.insert(DataEntry(columns))
+            case ("erase", table_name, key):
+                self.get_table(table_name).erase(key)
+            case _:
+                raise RuntimeError(f"Unknown change record {record!r}.")
+
+    def add_change_listener(self, listener):
+        """
+        Registers function called with change record (see apply_change) after every change
+        of tables, in order of changes. Another database reaches the same state by applying them
+        """
+
+        self.__change_listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        """
+        Unregisters change listener
+        """
+
+        self.__change_listeners.remove(listener)
+
+    def __publish(self, record: tuple):
+        for listener in self.__change_listeners:
+            listener(record)
+
+    def __recover_background_save(self):
+        # Background save swaps folders by renaming database folder away first, so missing folder
+        # means crash in the middle of the swap with complete snapshot left behind
+        snapshot_path = f"{self.__db_folder_path}{Database.__snapshot_suffix}"
+        old_path = f"{self.__db_folder_path}{Database.__old_suffix}"
+
+        if not os.path.exists(self.__db_folder_path) and os.path.exists(snapshot_path):
+            if os.path.exists(f"{old_path}/{Database.__wal_file}"):
+                os.replace(f"{old_path}/{Database.__wal_file}", f"{snapshot_path}/{Database.__wal_file}")
+            os.rename(snapshot_path, self.__db_folder_path)
+
+        for path in (snapshot_path, old_path):
+            if os.path.exists(path):
+                shutil.rmtree(path)
 
     def __del__(self):
-        self.save()
+        if getattr(self, "_Database__background_save", None) is not None:
+            self.__finish_background_save(os.waitpid(self.__background_save[0], 0)[1])
+        if getattr(self, "_Database__save_on_exit", False):
+            self.save()
+        if getattr(self, "_Database__wal", None) is not None:
+            self.__wal.close()
+
+    @property
+    def save_on_exit(self) -> bool:
+        """
+        Whether database is saved when the object is destroyed
+        """
+
+        return self.__save_on_exit
+
+    @save_on_exit.setter
+    def save_on_exit(self, value: bool):
+        self.__save_on_exit = value
 
     def save(self):
         """
-        Save database
+        Save database.
+        Only tables changed since the last save are rewritten, files of dropped tables are
+        deleted and config file is atomically replaced only if set of tables changed.
+        Running background save is finished first, its error is left in background_save_error
+        """
+
+        if self.__background_save is not None:
+            self.__finish_background_save(os.waitpid(self.__background_save[0], 0)[1])
+
+        dirty_tables = [
+            name for name, (_, table) in self.__tables.items() if table is not None and table.dirty
+        ]
+        if not dirty_tables and not self.__dropped_tables and not self.__config_dirty:
+            return
+
+        os.makedirs(self.__db_folder_path, exist_ok=True)
+
+        for table_name in dirty_tables:
+            self.__tables[table_name][1].write_to_file(f"{self.__db_folder_path}/{table_name}")
+
+        if self.__config_dirty:
+            self.__write_config()
+
+        # Config never lists a missing file: dropped tables are deleted only after it is replaced
+        for table_name in self.__dropped_tables:
+            if table_name not in self.__tables and os.path.exists(f"{self.__db_folder_path}/{table_name}"):
+                DatabaseTable.remove_file(f"{self.__db_folder_path}/{table_name}")
+        self.__dropped_tables.clear()
+
+        if self.__wal is not None:
+            Database.__sync_folder(self.__db_folder_path)
+            self.__wal.truncate()
+
+    def background_save(self) -> bool:
+        """
+        Starts saving database in forked child process. The child writes changed tables from
+        its copy-on-write view of the trees into snapshot folder (unchanged table files are
+        hard-linked), while this process keeps serving queries. Completion is checked by
+        poll_background_save() or wait_background_save(), which atomically swap finished
+        snapshot in place of database folder; log records written after the fork are kept.
+
+        Returns:
+            False if background save is already running, True if it was started
+
+        Raises:
+            RuntimeError: If processes can not be forked or a table is kept in on-disk tree
+                (its file is written in place, so it can not be snapshotted by fork)
+        """
+
+        if not hasattr(os, "fork"):
+            raise RuntimeError("Background save needs os.fork, use save() on this platform")
+        if self.__background_save is not None:
+            return False
+        for table_name, (_, table) in self.__tables.items():
+            if getattr(table, "sharded", False):
+                # Forked child would talk to shard processes over connections of the parent
+                raise RuntimeError(f"Table \"{table_name}\" is sharded, use save() instead")
+            if table is not None and table.on_disk:
+                raise RuntimeError(f"Table \"{table_name}\" is stored in place, use save() instead")
+
+        snapshot_path = f"{self.__db_folder_path}{Database.__snapshot_suffix}"
+        if os.path.exists(snapshot_path):
+            shutil.rmtree(snapshot_path)
+
+        dirty_tables = {
+            table_name: (table, table.version)
+            for table_name, (_, table) in self.__tables.items() if table is not None and table.dirty
+        }
+        wal_size = self.__wal.size() if self.__wal is not None else 0
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Child never returns: it must not run finalizers of objects shared with the parent
+            os.close(read_fd)
+            status = 0
+            try:
+                self.__write_snapshot(snapshot_path)
+            except BaseException as e:
+                os.write(write_fd, f"{type(e).__name__}: {e}".encode("utf-8")[:Database.__error_size])
+                status = 1
+            finally:
+                os._exit(status)
+
+        os.close(write_fd)
+        self.__background_save = (
+            pid, read_fd, dirty_tables, self.__schema_version, set(self.__dropped_tables), wal_size
+        )
+        return True
+
+    def poll_background_save(self) -> bool:
+        """
+        Checks whether background save finished, finished snapshot is swapped in
+
+        Returns:
+            True if no background save is running anymore
         """
 
+        if self.__background_save is None:
+            return True
+
+        pid, status = os.waitpid(self.__background_save[0], os.WNOHANG)
+        if pid == 0:
+            return False
+        self.__finish_background_save(status)
+        return True
+
+    def wait_background_save(self):
+        """
+        Waits until running background save finishes and swaps its snapshot in
+
+        Raises:
+            RuntimeError: If background save failed, database folder is left unchanged then
+        """
+
+        if self.__background_save is None:
+            return
+
+        self.__finish_background_save(os.waitpid(self.__background_save[0], 0)[1])
+        if self.__background_save_error is not None:
+            raise RuntimeError(f"Background save failed: {self.__background_save_error}")
+
+    @property
+    def background_save_running(self) -> bool:
+        """
+        Whether background save was started and its completion was not processed yet
+        """
+
+        return self.__background_save is not None
+
+    @property
+    def background_save_error(self) -> str | None:
+        """
+        Gets error of the last finished background save, None if it succeeded
+        """
+
+        return self.__background_save_error
+
+    def __write_snapshot(self, snapshot_path: str):
+        os.makedirs(snapshot_path)
+        for table_name, (_, table) in self.__tables.items():
+            filename = f"{snapshot_path}/{table_name}"
+            if table is not None and table.dirty:
+                table.write_to_file(filename)
+            else:
+                # Files are replaced, never modified in place, so link keeps current content
+                for table_file in DatabaseTable.table_files(f"{self.__db_folder_path}/{table_name}"):
+                    os.link(table_file, f"{snapshot_path}/{os.path.basename(table_file)}")
+
+        self.__write_config(snapshot_path)
+        Database.__sync_folder(snapshot_path)
+
+    def __finish_background_save(self, status: int):
+        pid, read_fd, dirty_tables, schema_version, dropped_tables, wal_size = self.__background_save
+        self.__background_save = None
+        with os.fdopen(read_fd, "rb") as pipe:
+            error = pipe.read().decode("utf-8", "replace")
+
+        snapshot_path = f"{self.__db_folder_path}{Database.__snapshot_suffix}"
+        exit_code = os.waitstatus_to_exitcode(status)
+        if exit_code != 0:
+            self.__background_save_error = error or f"Background save process {pid} exited with code {exit_code}"
+            shutil.rmtree(snapshot_path, ignore_errors=True)
+            return
+
+        self.__swap_snapshot(snapshot_path)
+        self.__background_save_error = None
+
+        # Only what did not change since the fork is saved now
+        for table_name, (table, version) in dirty_tables.items():
+            if table_name in self.__tables and self.__tables[table_name][1] is table and table.version == version:
+                table.mark_clean()
+        if schema_version == self.__schema_version:
+            self.__config_dirty = False
+        self.__dropped_tables -= dropped_tables
+        if self.__wal is not None:
+            self.__wal.drop_prefix(wal_size)
+
+    def __swap_snapshot(self, snapshot_path: str):
+        old_path = f"{self.__db_folder_path}{Database.__old_suffix}"
+        if self.__wal is not None:
+            self.__wal.close()
+
         if os.path.exists(self.__db_folder_path):
-            shutil.rmtree(self.__db_folder_path)
+            os.rename(self.__db_folder_path, old_path)
+        if os.path.exists(f"{old_path}/{Database.__wal_file}"):
+            os.replace(f"{old_path}/{Database.__wal_file}", f"{snapshot_path}/{Database.__wal_file}")
+        os.rename(snapshot_path, self.__db_folder_path)
+        Database.__sync_folder(os.path.dirname(os.path.abspath(self.__db_folder_path)))
+
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+
+    @staticmethod
+    def __sync_folder(path: str):
+        folder_fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(folder_fd)
+        finally:
+            os.close(folder_fd)
+
+    def checkpoint(self):
+        """
+        Writes changed tables and empties write-ahead log, same as save()
+        """
 
-        config_data = ""
+        self.save()
 
-        for table_name, table in self.__tables.items():
-            config_data += table_name + " "
-            config_data += " ".join(table[0]) + "\n"
+    def commit(self):
+        """
+        Forces write-ahead log records of all previous modifications to disk
+        """
 
-        os.mkdir(self.__db_folder_path)
-        with open(f"{self.__db_folder_path}/{Database.__config_file}", "wb") as file:
-            file.write(config_data[:-1].encode("utf-8"))
+        if self.__wal is not None:
+            self.__wal.sync()
 
-        for table_name, table in self.__tables.items():
-            table[1].write_to_file(f"{self.__db_folder_path}/{table_name}")
+    def __write_config(self, folder_path: str | None = None):
+        config_data = "\n".join(
+            " ".join([self.__config_table_name(table_name)] + table[0]) for table_name, table in self.__tables.items()
+        )
 
-    def create_table(self, table_name: str, columns: list[tuple[str, int]], key_col: int):
+        config_path = f"{folder_path or self.__db_folder_path}/{Database.__config_file}"
+        with open(f"{config_path}.tmp", "wb") as file:
+            file.write(config_data.encode("utf-8"))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{config_path}.tmp", config_path)
+        self.__config_dirty = False
+
+    def __config_table_name(self, table_name: str) -> str:
+        if table_name in self.__table_tree_types:
+            return f"{table_name}@{self.__table_tree_types[table_name]}"
+        return table_name
+
+    def create_table(self, table_name: str, columns: list[tuple[str, int]], key_col: int,
+                     storage_format: str = DatabaseTable.ROWS_FORMAT):
         """
-        Creates database table
+        Creates database table.
+        storage_format selects table file format: "rows" (fixed-width rows), "columnar"
+        (column segments, see columnar.py) or "lsm" (memtable and sorted runs, see lsm_tree.py)
         """
 
         if table_name in self.__tables:
             raise RuntimeError(f"Table with name \"{table_name}\" already exists.")
-
+        if "@" in table_name:
+            # Config stores tree type of converted table as "name@backend"
+            raise RuntimeError(f"Table name \"{table_name}\" must not contain \"@\".")
+
+        self.__create_table(table_name, columns, key_col, storage_format)
+        if self.__wal is not None:
+            self.__wal.log_create(table_name, key_col, columns, storage_format)
+        if self.__change_listeners:
+            self.__publish(("create", table_name, key_col, [tuple(column) for column in columns], storage_format))
+
+    def __create_table(self, table_name: str, columns: list[tuple[str, int]], key_col: int,
+                       storage_format: str = DatabaseTable.ROWS_FORMAT):
+        self.__table_tree_types.pop(table_name, None)
         self.__tables[table_name] = (
             [column[0] for column in columns],
-            DatabaseTable(self.__tree_type(key_col), [column[1] for column in columns])
+            DatabaseTable.create(
+                self.__tree_type, key_col, [column[1] for column in columns], f"{self.__db_folder_path}/{table_name}",
+                storage_format, self.__cache_bytes
+            )
+        )
+        self.__config_dirty = True
+        self.__schema_version += 1
+
+    def set_table_format(self, table_name: str, storage_format: str):
+        """
+        Changes file format of table, file is rewritten in new format by next save
+        """
+
+        self.get_table(table_name).storage_format = storage_format
+
+    def convert_table(self, table_name: str, tree_type):
+        """
+        Moves table rows into another in-memory tree type without saving and reopening database
+        (see DatabaseTable.convert_tree). Table keeps its tree type when database is opened again:
+        it is recorded in config by next save
+
+        Args:
+            table_name: Table to convert
+            tree_type: Tree class or backend name (see tree_registry)
+        """
+
+        if isinstance(tree_type, str):
+            try:
+                tree_type = tree_registry.get_tree_class(tree_type)
+            except ValueError as e:
+                raise RuntimeError(str(e)) from e
+
+        self.__convert_table(table_name, self.get_table(table_name), tree_type)
+
+    def __convert_table(self, table_name: str, table, tree_type):
+        table.convert_tree(tree_type)
+        if tree_type is self.__tree_type:
+            self.__table_tree_types.pop(table_name, None)
+        else:
+            self.__table_tree_types[table_name] = tree_registry.backend_name(tree_type)
+        self.__config_dirty = True
+
+    def shard_table(self, table_name: str, shards: int | None = None, max_skew: float | None = None):
+        """
+        Moves table rows into shard processes partitioned by key ranges (see sharded_table.py),
+        every shard keeps its rows in tree of table tree type. Table stays sharded until
+        unshard_table or until database is opened again (table file format does not change)
+
+        Args:
+            table_name: Table to shard, it must be stored in rows or columnar format
+            shards: Number of shard processes, number of CPUs if None
+            max_skew: Rows of the largest shard relative to average that trigger rebalancing,
+                ShardedTable.DEFAULT_MAX_SKEW if None, 0 turns automatic rebalancing off
+
+        Returns:
+            Sharded table (also returned by get_table), e.g. for its aggregate() and rebalance()
+        """
+
+        # Imported here: multiprocessing is not needed by databases without sharded tables
+        from sharded_table import ShardedTable
+
+        table = self.get_table(table_name)
+        if getattr(table, "sharded", False):
+            raise RuntimeError(f"Table \"{table_name}\" is already sharded.")
+        if table.storage_format not in (DatabaseTable.ROWS_FORMAT, DatabaseTable.COLUMNAR_FORMAT):
+            raise RuntimeError(f"Table \"{table_name}\" is stored in {table.storage_format} format, "
+                               "only in-memory tables can be sharded.")
+
+        sharded = ShardedTable(
+            self.get_table_tree_type(table_name), table.key_col, table.column_types, table.iter_inorder(),
+            shards, table.storage_format,
+            ShardedTable.DEFAULT_MAX_SKEW if max_skew is None else max_skew
         )
+        if not table.dirty:
+            sharded.mark_clean()
+        table.close()
+        self.__tables[table_name] = (self.__tables[table_name][0], sharded)
+        return sharded
+
+    def unshard_table(self, table_name: str):
+        """
+        Moves rows of sharded table back into one tree of this process and stops its shards
+        """
+
+        table = self.get_table(table_name)
+        if not getattr(table, "sharded", False):
+            return
+
+        unsharded = DatabaseTable.create(
+            self.get_table_tree_type(table_name), table.key_col, table.column_types,
+            f"{self.__db_folder_path}/{table_name}", table.storage_format, self.__cache_bytes
+        )
+        unsharded.insert_many(table.inorder())
+        if not table.dirty:
+            unsharded.mark_clean()
+        table.close()
+        self.__tables[table_name] = (self.__tables[table_name][0], unsharded)
+
+    @property
+    def tree_type(self):
+        """
+        Gets tree class of tables that were not converted to another one
+        """
+
+        return self.__tree_type
+
+    def get_table_tree_type(self, table_name: str):
+        """
+        Gets tree class table is loaded into
+        """
+
+        if table_name not in self.__tables:
+            raise RuntimeError(f"Table with name \"{table_name}\" does not exist.")
+
+        if table_name not in self.__table_tree_types:
+            return self.__tree_type
+        return tree_registry.get_tree_class(self.__table_tree_types[table_name])
+
+    def set_table_bloom_filter(self, table_name: str, enabled: bool = True):
+        """
+        Turns bloom filter of table keys on or off, filter file is written or deleted by next save
+        """
+
+        self.get_table(table_name).bloom_filter = enabled
+
+    def set_table_key_cache(self, table_name: str, capacity: int):
+        """
+        Sets number of hot keys whose rows table caches for point lookups, 0 turns cache off.
+        Cache lives only in memory, its counters are in get_table(table_name).key_cache
+        """
+
+        self.get_table(table_name).set_key_cache(capacity)
 
     def drop_table(self, table_name: str):
         """
@@ -79,7 +590,20 @@ class Database:
         if table_name not in self.__tables:
             raise RuntimeError(f"Table with name \"{table_name}\" does not exist.")
 
-        del self.__tables[table_name]
+        self.__drop_table(table_name)
+        if self.__wal is not None:
+            self.__wal.log_drop(table_name)
+        if self.__change_listeners:
+            self.__publish(("drop", table_name))
+
+    def __drop_table(self, table_name: str):
+        table = self.__tables.pop(table_name)[1]
+        self.__table_tree_types.pop(table_name, None)
+        if table is not None:
+            table.close()
+        self.__dropped_tables.add(table_name)
+        self.__config_dirty = True
+        self.__schema_version += 1
 
     def drop(self):
         """
@@ -87,7 +611,17 @@ class Database:
         This will delete database from filesystem immmediately, even if save() is not called
         """
 
+        if self.__background_save is not None:
+            self.__finish_background_save(os.waitpid(self.__background_save[0], 0)[1])
+
+        for _, table in self.__tables.values():
+            if table is not None:
+                table.close()
         self.__tables = {}
+        self.__dropped_tables.clear()
+        self.__config_dirty = False
+        if self.__wal is not None:
+            self.__wal.close()
         if os.path.exists(self.__db_folder_path):
             shutil.rmtree(self.__db_folder_path)
 
@@ -116,20 +650,231 @@ class Database:
         if table_name not in self.__tables:
             raise RuntimeError(f"Table with name \"{table_name}\" does not exist.")
 
-        return self.__tables[table_name][1]
+        column_names, table = self.__tables[table_name]
+        if table is None:
+            table = self.__open_table(table_name)
+            self.__tables[table_name] = (column_names, table)
+
+        if self.__advisor is not None:
+            if table.workload is None:
+                table.set_workload_tracking(self.__workload_window)
+            elif table.workload.operations >= self.__advise_interval:
+                self.__advise_table(table_name, table)
+
+        return table
+
+    def set_adaptive_backends(self, enabled: bool = True, interval: int = 10000, auto_migrate: bool = False,
+                              advisor: BackendAdvisor | None = None, window: int = 1024):
+        """
+        Starts tracking workload of tables (see workload.py). Once table tree served interval
+        operations, advisor recommends backend for the table on its next get_table call and
+        decision is added to decision_log; with auto_migrate table is converted to recommended
+        backend right there (see convert_table), so migration never runs concurrently with a query.
+        Counters are halved after every recommendation, so recent operations weigh more
+
+        Args:
+            enabled: Whether to track workload, False stops tracking and advising
+            interval: Operations of table between recommendations
+            auto_migrate: Whether tables are converted to recommended backends
+            advisor: Advisor making recommendations, default one if None
+            window: Number of recent point read keys used to estimate key skew
+        """
+
+        self.__advisor = (advisor or BackendAdvisor()) if enabled else None
+        self.__advise_interval = interval
+        self.__auto_migrate = auto_migrate
+        self.__workload_window = window if enabled else 0
+        for _, table in self.__tables.values():
+            if table is not None:
+                table.set_workload_tracking(self.__workload_window)
+
+    def advise(self, table_names: list[str] | None = None) -> list[Decision]:
+        """
+        Makes recommendations for given tables (all loaded tables if None) now instead of
+        waiting for interval operations, tables are migrated if auto_migrate is set
+
+        Returns:
+            Decisions made (also added to decision_log), tables with too few operations have none
+        """
+
+        if self.__advisor is None:
+            raise RuntimeError("Workload is not tracked, call set_adaptive_backends first.")
+
+        if table_names is None:
+            table_names = list(self.__tables)
+        decisions = []
+        for table_name in table_names:
+            # Table that is not loaded has not served anything yet
+            if not self.is_table_loaded(table_name):
+                continue
+            table = self.__tables[table_name][1]
+            if table.workload is not None:
+                decision = self.__advise_table(table_name, table)
+                if decision is not None:
+                    decisions.append(decision)
+        return decisions
+
+    def __advise_table(self, table_name: str, table) -> Decision | None:
+        stats = table.workload
+        recommendation = self.__advisor.recommend(stats)
+        summary = stats.summary()
+        stats.decay()
+        if recommendation is None:
+            return None
+
+        backend, reason = recommendation
+        current = self.get_table_tree_type(table_name)
+        recommended = tree_registry.get_tree_class(backend)
+        # Paged and LSM tables keep their rows on disk, tree type does not decide their performance
+        migrate = self.__auto_migrate and recommended is not current and table.storage_format in (
+            DatabaseTable.ROWS_FORMAT, DatabaseTable.COLUMNAR_FORMAT
+        )
+        if migrate:
+            self.__convert_table(table_name, table, recommended)
+
+        decision = Decision(
+            table_name, tree_registry.backend_name(current), tree_registry.backend_name(recommended),
+            reason, migrate, summary
+        )
+        self.__decisions.append(decision)
+        return decision
+
+    @property
+    def decision_log(self) -> list[Decision]:
+        """
+        Gets recent advisor decisions, oldest first
+        """
+
+        return list(self.__decisions)
+
+    def is_table_loaded(self, table_name: str) -> bool:
+        """
+        Whether table file was already opened by get_table or preload
+        """
+
+        if table_name not in self.__tables:
+            raise RuntimeError(f"Table with name \"{table_name}\" does not exist.")
+
+        return self.__tables[table_name][1] is not None
+
+    def preload(self, table_names: list[str] | None = None, workers: int = 1):
+        """
+        Opens given tables (all tables if None) up front instead of on first access.
+
+        Args:
+            table_names: Tables to open, all tables if None
+            workers: If greater than 1, table files are decoded by this many worker processes
+                (see DatabaseTable.read_many_from_files); mapped database ignores it
+        """
+
+        table_names = self.get_tables_names() if table_names is None else table_names
+        if workers > 1 and not self.__mapped:
+            unloaded = [table_name for table_name in table_names if not self.is_table_loaded(table_name)]
+            by_tree_type = {}
+            for table_name in unloaded:
+                by_tree_type.setdefault(self.get_table_tree_type(table_name), []).append(table_name)
+            for tree_type, names in by_tree_type.items():
+                tables = DatabaseTable.read_many_from_files(
+                    tree_type, [f"{self.__db_folder_path}/{table_name}" for table_name in names], workers,
+                    cache_bytes=self.__cache_bytes
+                )
+                for table_name in names:
+                    self.__tables[table_name] = (
+                        self.__tables[table_name][0], tables[f"{self.__db_folder_path}/{table_name}"]
+                    )
+
+        for table_name in table_names:
+            self.get_table(table_name)
+
+    def get_table_row_count(self, table_name: str) -> int:
+        """
+        Gets number of table rows, table that is not loaded is not loaded for that
+        """
+
+        if table_name not in self.__tables:
+            raise RuntimeError(f"Table with name \"{table_name}\" does not exist.")
+
+        table = self.__tables[table_name][1]
+        if table is None or not table.dirty:
+            return DatabaseTable.read_metadata(f"{self.__db_folder_path}/{table_name}")[2]
+        return table.row_count
 
     def select(self, columns: list[str], table_name: str):
         cols_list = self.get_table_columns_names(table_name)
         cols_ind = [cols_list.index(col) for col in columns]
 
-        selected = self.get_table(table_name).tree.inorder()
-        return [[s.columns[i] for i in cols_ind] for s in selected]
+        return self.get_table(table_name).select_columns(cols_ind)
 
     def insert(self, table_name: str, values: list):
         if table_name not in self.__tables:
             raise RuntimeError(f"Table with name \"{table_name}\" does not exist.")
 
-        self.get_table(table_name).tree.insert(DataEntry(values))
+        table = self.get_table(table_name)
+        if self.__wal is not None:
+            # Fail before the tree is modified if values can not be stored
+            table.layout.encode(values, *table.layout.new_strings())
+
+        table.insert(DataEntry(values))
+        self.__log_bucket(table_name, values[table.key_col])
+
+    def insert_many(self, table_name: str, rows: list[list]):
+        """
+        Inserts many rows into table at once, faster than inserting them one by one
+        (empty table is bulk built, write-ahead log gets one record per distinct key)
+        """
+
+        if table_name not in self.__tables:
+            raise RuntimeError(f"Table with name \"{table_name}\" does not exist.")
+
+        table = self.get_table(table_name)
+        if self.__wal is not None:
+            for values in rows:
+                table.layout.encode(values, *table.layout.new_strings())
+
+        table.insert_many([DataEntry(values) for values in rows])
+        for key in dict.fromkeys(values[table.key_col] for values in rows):
+            self.__log_bucket(table_name, key)
+
+    def erase(self, table_name: str, key):
+        """
+        Erases all table rows with given key
+        """
+
+        self.get_table(table_name).erase(key)
+        self.__log_bucket(table_name, key)
+
+    def update(self, table_name: str, key, rows: list[list]):
+        """
+        Replaces all table rows with given key by new rows
+        """
+
+        table = self.get_table(table_name)
+        if self.__wal is not None:
+            for values in rows:
+                table.layout.encode(values, *table.layout.new_strings())
+
+        table.erase(key)
+        for values in rows:
+            table.insert(DataEntry(values))
+
+        self.__log_bucket(table_name, key)
+        for new_key in {values[table.key_col] for values in rows} - {key}:
+            self.__log_bucket(table_name, new_key)
+
+    def __log_bucket(self, table_name: str, key):
+        if self.__wal is None and not self.__change_listeners:
+            return
+
+        table = self.get_table(table_name)
+        # Listeners may keep records after rows are changed again, so they get copies
+        rows = [list(data_entry.columns) for data_entry in table.find(key)]
+        if self.__wal is not None:
+            if rows:
+                self.__wal.log_put(table_name, table.layout, rows)
+            else:
+                self.__wal.log_erase(table_name, table.key_layout, key)
+        if self.__change_listeners:
+            self.__publish(("put", table_name, rows) if rows else ("erase", table_name, key))
 
 if __name__ == "__main__":
     from treap import Treap
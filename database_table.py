@@ -2,80 +2,851 @@
 Implements database table functional
 """
 
-from data_entry import ColumnType, DataEntry
+import itertools
+import os
+import shutil
+import sys
+from array import array
+from collections import OrderedDict
+
+from bloom_filter import BloomFilter
+from columnar import ColumnarRows, is_columnar_file, read_columnar_metadata, write_columnar
+from data_entry import ColumnType, DataEntry, RowLayout
+from lsm_tree import LsmTree
+from paged_b_tree import PagedBTree
+from row_file import MappedRows, decode_header, iter_rows, read_header, write_rows
+from workload import WorkloadStats
+
+
+def decode_columns(filename: str, rows_offset: int, column_types: list[int], start: int, end: int,
+                   strings_offset: int) -> list:
+    """
+    Decodes rows [start, end) of table file into one compact buffer per column:
+    array of unsigned 64-bit ints for numeric columns, (codes array, dictionary values)
+    pair for DICT_STRING columns, list of str otherwise.
+    Runs in worker processes, so it only takes picklable arguments
+    """
+
+    layout = RowLayout(column_types)
+    with open(filename, "rb") as file:
+        file.seek(rows_offset + start * layout.row_size)
+        content = file.read((end - start) * layout.row_size)
+        heap, dictionaries = None, None
+        if layout.has_strings:
+            file.seek(strings_offset)
+            heap, dictionaries = layout.decode_strings(file.read())
+
+    columns = list(zip(*layout.iter_decode(content, heap, dictionaries))) or [()] * len(column_types)
+    result = [
+        array("Q", column) if column_type in (ColumnType.INT, ColumnType.LONG) else list(column)
+        for column, column_type in zip(columns, column_types)
+    ]
+    for i, dictionary in zip(layout.dictionary_columns, dictionaries or []):
+        result[i] = (array("I", map(dictionary.lookup, result[i])), dictionary.values)
+    return result
+
+
+def expand_columns(columns: list) -> list:
+    """
+    Turns dictionary encoded columns returned by decode_columns back into lists of str,
+    rows share one interned object per distinct value
+    """
+
+    expanded = []
+    for column in columns:
+        if isinstance(column, tuple):
+            codes, values = column
+            values = [sys.intern(value) for value in values]
+            column = [values[code] for code in codes]
+        expanded.append(column)
+    return expanded
+
+
+class KeyCache:
+    """
+    LRU cache of point lookups: key to list of its rows (empty for missing key)
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.__buckets = OrderedDict()
+
+    def get(self, key) -> list[DataEntry] | None:
+        """
+        Gets cached rows of key, or None if key is not cached
+        """
+
+        bucket = self.__buckets.get(key)
+        if bucket is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.__buckets.move_to_end(key)
+        return bucket
+
+    def put(self, key, bucket: list[DataEntry]) -> None:
+        """
+        Caches rows of key, evicting least recently used key if cache is full
+        """
+
+        self.__buckets[key] = bucket
+        self.__buckets.move_to_end(key)
+        if len(self.__buckets) > self.capacity:
+            self.__buckets.popitem(last=False)
+
+    def invalidate(self, key) -> None:
+        """
+        Drops cached rows of key
+        """
+
+        self.__buckets.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Drops all cached rows
+        """
+
+        self.__buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self.__buckets)
+
 
 class DatabaseTable:
     """
     Represents database table
     """
 
-    __columns_count_size = 2
-    __enum_column_type_size = 1
+    ROWS_FORMAT = "rows"
+    COLUMNAR_FORMAT = "columnar"
+    PAGED_FORMAT = "paged"
+    LSM_FORMAT = "lsm"
+    STORAGE_FORMATS = (ROWS_FORMAT, COLUMNAR_FORMAT, LSM_FORMAT)
+
+    __versions = itertools.count()
+
+    def __init__(self, tree, column_types, storage_format: str = ROWS_FORMAT):
+        if storage_format not in DatabaseTable.STORAGE_FORMATS:
+            raise RuntimeError(f"Unknown table storage format \"{storage_format}\".")
 
-    def __init__(self, tree, column_types):
         self.__tree = tree
+        self.__storage_format = storage_format
         self.__column_types = column_types
+        self.__layout = RowLayout(column_types)
+        self.__key_layout = RowLayout([column_types[tree.key_col]])
+        self.__dirty = True
+        self.__version = DatabaseTable.next_version()
+        self.__mapped = None
+        self.__scan_batch = None
+        self.__scan_batch_version = None
+        self.__stale_runs = False
+        self.__bloom_enabled = False
+        self.__bloom = None
+        self.__key_cache = None
+        self.__workload = None
+
+    @staticmethod
+    def next_version() -> int:
+        """
+        Gets new table version, the counter is shared by all tables (sharded ones included)
+        """
+
+        return next(DatabaseTable.__versions)
+
+    @staticmethod
+    def read_metadata(filename: str) -> tuple[int, list[int], int]:
+        """
+        Reads table schema and row count from file header and size, rows are not read
+
+        Returns:
+            (key column, column types, rows count)
+        """
+
+        if PagedBTree.is_paged_file(filename):
+            return PagedBTree.read_metadata(filename)
+        if LsmTree.is_lsm_file(filename):
+            return LsmTree.read_metadata(filename)
+        if is_columnar_file(filename):
+            return read_columnar_metadata(filename)
+
+        key_col, column_types, _, row_count, _ = read_header(filename)
+        return key_col, column_types, row_count
+
+    @staticmethod
+    def is_on_disk(tree_type) -> bool:
+        """
+        Checks whether tree type keeps its nodes in the table file (like PagedBTree)
+        instead of memory
+        """
+
+        return getattr(tree_type, "on_disk", False)
+
+    @staticmethod
+    def table_files(filename: str) -> list[str]:
+        """
+        Gets all files of table stored in filename (LSM table keeps its runs next to it,
+        bloom filter is stored next to table file)
+        """
+
+        files = LsmTree.table_files(filename) if LsmTree.is_lsm_file(filename) else [filename]
+        if os.path.exists(DatabaseTable.__bloom_filename(filename)):
+            files.append(DatabaseTable.__bloom_filename(filename))
+        return files
+
+    @staticmethod
+    def remove_file(filename: str) -> None:
+        """
+        Deletes all files of table stored in filename
+        """
+
+        if LsmTree.is_lsm_file(filename):
+            LsmTree.remove_files(filename)
+        else:
+            os.remove(filename)
+        if os.path.exists(DatabaseTable.__bloom_filename(filename)):
+            os.remove(DatabaseTable.__bloom_filename(filename))
 
     @classmethod
-    def read_from_file(cls, tree_type, filename):
+    def create(cls, tree_type, key_col: int, column_types: list[int], filename: str,
+               storage_format: str = ROWS_FORMAT, cache_bytes: int | None = None):
         """
-        Creates tree from content in file
+        Creates empty table, on-disk tree types create their file right away
+        (and store it in their own format whatever storage_format is), cache_bytes is
+        memory budget of their buffer pool (default of tree type if None).
+        LSM table creates its file too, tree type is used for its memtable
         """
 
+        if not DatabaseTable.is_on_disk(tree_type) and storage_format != DatabaseTable.LSM_FORMAT:
+            return cls(tree_type(key_col), column_types, storage_format)
+
+        folder = os.path.dirname(filename)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if storage_format == DatabaseTable.LSM_FORMAT:
+            if DatabaseTable.is_on_disk(tree_type):
+                raise RuntimeError("LSM table needs in-memory tree type for its memtable.")
+            return cls(LsmTree.create(filename, key_col, column_types, tree_type), column_types, storage_format)
+        return cls(tree_type.create(filename, key_col, column_types, cache_bytes=cache_bytes), column_types)
+
+    @classmethod
+    def read_from_file(cls, tree_type, filename, cache_bytes: int | None = None):
+        """
+        Creates tree from content in file.
+        Paged B-tree file is opened as is whatever the tree type is; other files opened with
+        on-disk tree type are converted into page file in place.
+        Columnar file is opened like in open_mapped, tree is built on first modification.
+        cache_bytes is memory budget of buffer pool of paged file (default of tree type if None)
+        """
+
+        special_table = cls.__open_special(tree_type, filename, cache_bytes)
+        if special_table is not None:
+            special_table.__read_bloom(filename)
+            return special_table
+
         with open(filename, "rb") as file:
             content = file.read()
 
-        columns_count = int.from_bytes(content[:DatabaseTable.__columns_count_size])
-        key_col = int.from_bytes(content[DatabaseTable.__columns_count_size:DatabaseTable.__columns_count_size * 2])
-        column_types = [
-            int.from_bytes(content[
-                DatabaseTable.__columns_count_size * 2 + DatabaseTable.__enum_column_type_size * i:
-                DatabaseTable.__columns_count_size * 2 + DatabaseTable.__enum_column_type_size * (i + 1)
-            ]) for i in range(columns_count)
-        ]
-        column_sizes = [ColumnType.get_size(column_type) for column_type in column_types]
-        row_size = sum(column_sizes)
-        rows_offset = DatabaseTable.__columns_count_size * 2 + DatabaseTable.__enum_column_type_size * columns_count
-
-        tree = tree_type(key_col)
-
-        for row_ind in range((len(content) - rows_offset) // row_size):
-            data_entry_columns = []
-            curr_offset = 0
-            for column_size, column_type in zip(column_sizes, column_types):
-                data_entry_columns.append(ColumnType.from_bytes(content[
-                    rows_offset + row_ind * row_size + curr_offset:
-                    rows_offset + row_ind * row_size + curr_offset + column_size
-                ], column_type))
-                curr_offset += column_size
-
-            tree.insert(DataEntry(data_entry_columns))
-
-        return cls(tree, column_types)
+        key_col, column_types, rows_offset = decode_header(content)
+        table = cls(tree_type(key_col), column_types)
+
+        table.__tree.bulk_build(
+            DataEntry(columns) for columns in iter_rows(content, table.layout, rows_offset)
+        )
+        table.__dirty = False
+        table.__read_bloom(filename)
+
+        return table
+
+    @classmethod
+    def read_many_from_files(cls, tree_type, filenames: list[str], workers: int | None = None,
+                             chunk_rows: int = 1 << 16, cache_bytes: int | None = None) -> dict:
+        """
+        Loads several table files, decoding them in parallel.
+        Flat files are split into chunks of chunk_rows rows decoded into column buffers by
+        worker processes, this process builds trees from the buffers in file order while
+        workers decode the following chunks. Paged and columnar files are opened directly
+
+        Args:
+            tree_type: Tree class used for tables
+            filenames: Table files
+            workers: Number of worker processes, os.cpu_count() if None
+            chunk_rows: Number of rows decoded by one worker task
+            cache_bytes: Memory budget of buffer pool of paged files (see read_from_file)
+
+        Returns:
+            Dictionary from file name to table
+        """
+
+        # Imported here, like scan module below: short programs that never use them start faster
+        from concurrent.futures import ProcessPoolExecutor
+
+        tables = {}
+        pending = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for filename in filenames:
+                if DatabaseTable.is_on_disk(tree_type) or PagedBTree.is_paged_file(filename) \
+                        or is_columnar_file(filename) or LsmTree.is_lsm_file(filename):
+                    tables[filename] = cls.read_from_file(tree_type, filename, cache_bytes)
+                    continue
+
+                key_col, column_types, rows_offset, row_count, strings_offset = read_header(filename)
+                chunks = [
+                    executor.submit(
+                        decode_columns, filename, rows_offset, column_types,
+                        start, min(start + chunk_rows, row_count), strings_offset
+                    )
+                    for start in range(0, row_count, chunk_rows)
+                ]
+                pending.append((filename, key_col, column_types, chunks))
+
+            for filename, key_col, column_types, chunks in pending:
+                table = cls(tree_type(key_col), column_types)
+                table.__tree.bulk_build(
+                    DataEntry(list(row)) for chunk in chunks for row in zip(*expand_columns(chunk.result()))
+                )
+                table.__dirty = False
+                table.__read_bloom(filename)
+                tables[filename] = table
+
+        return tables
+
+    @classmethod
+    def open_mapped(cls, tree_type, filename, cache_bytes: int | None = None):
+        """
+        Opens table file through mmap without reading rows.
+        Reads are answered by binary search over the file, in-memory tree is built
+        from the file only on first modification (or explicit load())
+        """
+
+        special_table = cls.__open_special(tree_type, filename, cache_bytes)
+        if special_table is not None:
+            special_table.__read_bloom(filename)
+            return special_table
+
+        key_col, column_types, rows_offset, row_count, _ = read_header(filename)
+        table = cls(tree_type(key_col), column_types)
+        table.__mapped = MappedRows(filename, table.layout, key_col, rows_offset, row_count)
+        table.__dirty = False
+        table.__read_bloom(filename)
+
+        return table
+
+    @classmethod
+    def __open_special(cls, tree_type, filename, cache_bytes: int | None):
+        if LsmTree.is_lsm_file(filename):
+            if DatabaseTable.is_on_disk(tree_type):
+                raise RuntimeError("LSM table needs in-memory tree type for its memtable.")
+            tree = LsmTree.open(filename, tree_type)
+            table = cls(tree, tree.column_types, DatabaseTable.LSM_FORMAT)
+            table.__dirty = False
+            return table
+
+        paged_type = tree_type if DatabaseTable.is_on_disk(tree_type) else PagedBTree
+
+        if not PagedBTree.is_paged_file(filename):
+            columnar = ColumnarRows(filename) if is_columnar_file(filename) else None
+            if not DatabaseTable.is_on_disk(tree_type):
+                if columnar is None:
+                    return None
+                table = cls(tree_type(columnar.key_col), columnar.column_types, DatabaseTable.COLUMNAR_FORMAT)
+                table.__mapped = columnar
+                table.__dirty = False
+                return table
+
+            if columnar is not None:
+                key_col, column_types, data_entries = columnar.key_col, columnar.column_types, columnar
+            else:
+                with open(filename, "rb") as file:
+                    content = file.read()
+                key_col, column_types, rows_offset = decode_header(content)
+                data_entries = (
+                    DataEntry(columns)
+                    for columns in iter_rows(content, RowLayout(column_types), rows_offset)
+                )
+
+            tree = paged_type.create(f"{filename}.tmp", key_col, column_types, cache_bytes=cache_bytes)
+            for data_entry in data_entries:
+                tree.insert(data_entry)
+            tree.close()
+            if columnar is not None:
+                columnar.close()
+            os.replace(f"{filename}.tmp", filename)
+
+        tree = paged_type.open(filename, cache_bytes)
+        table = cls(tree, tree.column_types)
+        table.__dirty = False
+        return table
+
+    def load(self) -> None:
+        """
+        Builds in-memory tree of mapped table and unmaps its file.
+        Does nothing if table is already in memory
+        """
+
+        if self.__mapped is None:
+            return
+
+        self.__tree.bulk_build(self.__mapped)
+        self.__mapped.close()
+        self.__mapped = None
+        self.__scan_batch = None
+        # Cached rows were decoded from file, tree holds other objects now
+        self.__clear_key_cache()
+
+    @property
+    def mapped(self) -> bool:
+        """
+        Whether table rows are still read from mapped file
+        """
+
+        return self.__mapped is not None
+
+    @property
+    def on_disk(self) -> bool:
+        """
+        Whether table is kept in on-disk tree (paged or LSM) that writes its file in place.
+        Unlike tree, it neither loads the table nor marks it dirty
+        """
+
+        return DatabaseTable.is_on_disk(self.__tree)
 
     def write_to_file(self, filename):
         """
-        Writes to file from content in tree
+        Writes to file from content in tree, rows are streamed into the file (see row_file.write_rows).
+        Columnar table is written in columnar format.
+        On-disk tree flushes its pages instead (and copies page file if it lives elsewhere),
+        LSM table flushes its memtable into new run
         """
 
-        total_res = bytes()
+        if self.__storage_format == DatabaseTable.LSM_FORMAT and not DatabaseTable.is_on_disk(self.__tree):
+            # Table switched to LSM format: all rows become its first run
+            self.__tree = LsmTree.create(filename, self.key_col, self.__column_types, type(self.__tree),
+                                         self.iter_inorder())
+            if self.__mapped is not None:
+                self.__mapped.close()
+                self.__mapped = None
+            self.__clear_key_cache()
+            self.__write_bloom(filename)
+            self.__dirty = False
+            return
+
+        if DatabaseTable.is_on_disk(self.__tree):
+            self.__tree.flush()
+            if os.path.abspath(filename) != os.path.abspath(self.__tree.filename):
+                if isinstance(self.__tree, LsmTree):
+                    raise RuntimeError("LSM table can only be saved to its own file.")
+                shutil.copyfile(self.__tree.filename, f"{filename}.tmp")
+                os.replace(f"{filename}.tmp", filename)
+            self.__write_bloom(filename)
+            self.__dirty = False
+            return
+
+        if self.__storage_format == DatabaseTable.COLUMNAR_FORMAT:
+            write_columnar(filename, self.key_col, self.__column_types, self.iter_inorder())
+        else:
+            write_rows(filename, self.key_col, self.__column_types, self.iter_inorder())
+        if self.__stale_runs:
+            LsmTree.remove_runs(filename)
+            self.__stale_runs = False
+        self.__write_bloom(filename)
+        self.__dirty = False
+
+    @property
+    def bloom_filter(self) -> bool:
+        """
+        Whether table keeps bloom filter of its keys, so that lookups of missing keys
+        skip the tree and table file. Filter is stored next to table file by write_to_file
+        """
+
+        return self.__bloom_enabled
+
+    @bloom_filter.setter
+    def bloom_filter(self, enabled: bool):
+        if enabled != self.__bloom_enabled:
+            self.__bloom_enabled = enabled
+            self.__bloom = None
+            self.mark_dirty()
+
+    def __read_bloom(self, filename: str) -> None:
+        # Table has filter if its file exists, stale filter is rebuilt on first lookup
+        bloom_filename = DatabaseTable.__bloom_filename(filename)
+        if os.path.exists(bloom_filename):
+            self.__bloom_enabled = True
+            self.__bloom = BloomFilter.read(bloom_filename, filename)
+
+    def __write_bloom(self, filename: str) -> None:
+        bloom_filename = DatabaseTable.__bloom_filename(filename)
+        if not self.__bloom_enabled:
+            if os.path.exists(bloom_filename):
+                os.remove(bloom_filename)
+            return
+
+        # Rebuilt when rows were just rewritten anyway, so that erased keys do not stay in filter forever
+        if self.__bloom is None or not DatabaseTable.is_on_disk(self.__tree):
+            self.__bloom = self.__build_bloom()
+        self.__bloom.write(bloom_filename, filename)
+
+    def __build_bloom(self) -> BloomFilter:
+        key_col = self.key_col
+        keys = [data_entry.columns[key_col] for data_entry in self.iter_inorder()]
+        # Spare capacity lets table grow twice before filter is rebuilt
+        return BloomFilter.from_keys(keys, 2 * len(keys))
 
-        total_res += len(self.__column_types).to_bytes(DatabaseTable.__columns_count_size, "big")
-        total_res += self.__tree.key_col.to_bytes(DatabaseTable.__columns_count_size, "big")
-        for column_type in self.__column_types:
-            total_res += column_type.to_bytes(DatabaseTable.__enum_column_type_size, "big")
+    def __bloom_rejects(self, key) -> bool:
+        if not self.__bloom_enabled:
+            return False
+        if self.__bloom is None:
+            self.__bloom = self.__build_bloom()
+        return key not in self.__bloom
 
-        for data_entry in self.__tree.inorder():
-            for data_entry_col, col_type in zip(data_entry.columns, self.__column_types):
-                total_res += ColumnType.to_bytes(data_entry_col, col_type)
+    @staticmethod
+    def __bloom_filename(filename: str) -> str:
+        return f"{filename}.bloom"
+
+    @property
+    def key_layout(self) -> RowLayout:
+        """
+        Gets binary layout of key column alone
+        """
+
+        return self.__key_layout
+
+    def insert(self, data_entry: DataEntry) -> None:
+        """
+        Inserts row into table, strings of DICT_STRING columns are interned
+        """
+
+        self.load()
+        for i in self.__layout.dictionary_columns:
+            data_entry.columns[i] = sys.intern(data_entry.columns[i])
+        self.__tree.insert(data_entry)
+        if self.__workload is not None:
+            self.__workload.record_write()
+        if self.__key_cache is not None:
+            self.__key_cache.invalidate(data_entry.columns[self.key_col])
+        if self.__bloom is not None:
+            self.__bloom.add(data_entry.columns[self.key_col])
+            if self.__bloom.saturated:
+                self.__bloom = None
+        self.mark_dirty()
+
+    def insert_many(self, data_entries: list[DataEntry]) -> None:
+        """
+        Inserts many rows. Empty in-memory table is bulk built from rows sorted by key
+        (sort is stable, so rows with equal keys keep their order as if inserted one by one)
+        """
+
+        self.load()
+        if DatabaseTable.is_on_disk(self.__tree) or next(iter(self.__tree.iter_inorder()), None) is not None:
+            for data_entry in data_entries:
+                self.insert(data_entry)
+            return
+
+        for data_entry in data_entries:
+            for i in self.__layout.dictionary_columns:
+                data_entry.columns[i] = sys.intern(data_entry.columns[i])
+        key_col = self.key_col
+        self.__tree.bulk_build(sorted(data_entries, key=lambda data_entry: data_entry.columns[key_col]))
+        if self.__workload is not None:
+            self.__workload.record_write(len(data_entries))
+        self.__bloom = None
+        self.__clear_key_cache()
+        self.mark_dirty()
+
+    def erase(self, key) -> None:
+        """
+        Erases all rows with key from table
+        """
+
+        if self.__bloom_rejects(key):
+            return
+        self.load()
+        self.__tree.erase(key)
+        if self.__workload is not None:
+            self.__workload.record_write()
+        if self.__key_cache is not None:
+            self.__key_cache.invalidate(key)
+        self.mark_dirty()
+
+    def find(self, key) -> list[DataEntry]:
+        """
+        Searches for all rows with key. Key cache and bloom filter (if table has them)
+        are checked first
+        """
+
+        if self.__key_cache is not None:
+            bucket = self.__key_cache.get(key)
+            if bucket is not None:
+                return list(bucket)
+
+        if self.__bloom_rejects(key):
+            return []
+        if self.__workload is not None:
+            self.__workload.record_read(key)
+        bucket = self.__mapped.find(key) if self.__mapped is not None else self.__tree.find(key)
+        if self.__key_cache is not None:
+            # Caller may modify returned list, cache keeps its own
+            self.__key_cache.put(key, list(bucket))
+        return bucket
+
+    @property
+    def key_cache(self) -> KeyCache | None:
+        """
+        Gets cache of point lookups (with hit and miss counters), None if table has no cache
+        """
+
+        return self.__key_cache
+
+    def set_key_cache(self, capacity: int) -> None:
+        """
+        Sets number of keys in cache of point lookups (dropping cached rows), 0 turns cache off
+        """
+
+        self.__key_cache = KeyCache(capacity) if capacity > 0 else None
+
+    def __clear_key_cache(self) -> None:
+        if self.__key_cache is not None:
+            self.__key_cache.clear()
+
+    @property
+    def workload(self) -> WorkloadStats | None:
+        """
+        Gets statistics of operations served by table tree, None if they are not tracked
+        """
+
+        return self.__workload
+
+    def set_workload_tracking(self, window: int) -> None:
+        """
+        Starts tracking workload (see workload.WorkloadStats) with window of recently read keys,
+        0 stops tracking
+        """
+
+        self.__workload = WorkloadStats(window) if window > 0 else None
+
+    def find_range(self, low=None, high=None) -> list[DataEntry]:
+        """
+        Gets rows with low <= key <= high sorted by key, bound set to None is not checked
+        """
+
+        if self.__workload is not None:
+            self.__workload.record_scan()
+        if self.__mapped is not None:
+            return self.__mapped.find_range(low, high)
+        if DatabaseTable.is_on_disk(self.__tree):
+            return self.__tree.find_range(low, high)
+
+        key_col = self.key_col
+        result = []
+        for data_entry in self.__tree.iter_inorder():
+            key = data_entry.columns[key_col]
+            if high is not None and key > high:
+                break
+            if low is None or key >= low:
+                result.append(data_entry)
+        return result
+
+    def inorder(self) -> list[DataEntry]:
+        """
+        Gets all rows sorted by key
+        """
+
+        if self.__workload is not None:
+            self.__workload.record_scan()
+        if self.__mapped is not None:
+            return list(self.__mapped)
+        return self.__tree.inorder()
+
+    def iter_inorder(self):
+        """
+        Lazily iterates over all rows sorted by key
+        """
+
+        if self.__mapped is not None:
+            return iter(self.__mapped)
+        return self.__tree.iter_inorder()
+
+    def select_columns(self, indexes: list[int]) -> list[list]:
+        """
+        Gets projection of all rows sorted by key on given columns.
+        Columnar table reads only the selected columns from its file
+        """
+
+        if self.__workload is not None:
+            self.__workload.record_scan()
+        if isinstance(self.__mapped, ColumnarRows):
+            return self.__mapped.select_columns(indexes)
+        return [[data_entry.columns[i] for i in indexes] for data_entry in self.iter_inorder()]
+
+    def scan_batch(self) -> "ColumnBatch | None":
+        """
+        Gets column arrays of all rows for vectorized scans, or None if NumPy is missing
+        or table is paged (it may not fit into memory).
+        Columnar file is scanned directly, other tables materialize rows once per table version
+        """
+
+        from scan import ColumnBatch, is_available as scan_available
+
+        if not scan_available() or DatabaseTable.is_on_disk(self.__tree):
+            return None
+
+        if self.__scan_batch is None or self.__scan_batch_version != self.__version:
+            if isinstance(self.__mapped, ColumnarRows):
+                self.__scan_batch = ColumnBatch.from_columnar(self.__mapped)
+            else:
+                self.__scan_batch = ColumnBatch.from_entries(self.__column_types, self.inorder())
+            self.__scan_batch_version = self.__version
+
+        return self.__scan_batch
+
+    def convert_tree(self, tree_type) -> None:
+        """
+        Moves rows into tree of another in-memory tree type, bulk built from in-order walk
+        of the current tree, table file is not read or written for that.
+        Mapped table only changes tree type it is loaded into later, LSM table changes
+        tree type of its memtable, rows of paged table move into memory (table file is
+        rewritten in rows format by next save)
+        """
+
+        if DatabaseTable.is_on_disk(tree_type):
+            raise RuntimeError("Table can only be converted to in-memory tree type.")
+        if isinstance(self.__tree, LsmTree):
+            self.__tree.memtable_type = tree_type
+            return
+        if type(self.__tree) is tree_type:
+            return
+
+        tree = tree_type(self.key_col)
+        if self.__mapped is None:
+            tree.bulk_build(self.__tree.iter_inorder())
+        if DatabaseTable.is_on_disk(self.__tree):
+            self.__tree.close()
+            self.__storage_format = DatabaseTable.ROWS_FORMAT
+            self.mark_dirty()
+        self.__tree = tree
+
+    @property
+    def storage_format(self) -> str:
+        """
+        Gets format of table file: rows, columnar, lsm or paged (for on-disk trees)
+        """
+
+        if DatabaseTable.is_on_disk(self.__tree):
+            return getattr(self.__tree, "storage_format", DatabaseTable.PAGED_FORMAT)
+        return self.__storage_format
+
+    @storage_format.setter
+    def storage_format(self, value: str):
+        if value not in DatabaseTable.STORAGE_FORMATS:
+            raise RuntimeError(f"Unknown table storage format \"{value}\".")
+        if isinstance(self.__tree, LsmTree):
+            if value == DatabaseTable.LSM_FORMAT:
+                return
+            # Rows are moved into memtable tree type, runs are deleted once new file is written
+            tree = self.__tree.memtable_type(self.key_col)
+            tree.bulk_build(self.__tree.iter_inorder())
+            self.__tree.close()
+            self.__tree = tree
+            self.__stale_runs = True
+            self.__clear_key_cache()
+        elif DatabaseTable.is_on_disk(self.__tree):
+            raise RuntimeError("Storage format of paged table is defined by its tree type.")
+
+        if value != self.__storage_format:
+            self.__storage_format = value
+            self.mark_dirty()
+
+    def close(self) -> None:
+        """
+        Releases table file: unmaps mapped rows and closes page file of on-disk tree
+        """
+
+        if self.__mapped is not None:
+            self.__mapped.close()
+        if DatabaseTable.is_on_disk(self.__tree):
+            self.__tree.close()
+
+    @property
+    def row_count(self) -> int:
+        """
+        Gets number of rows, in-memory trees do not track it, so they are counted
+        """
+
+        if self.__mapped is not None:
+            return len(self.__mapped)
+        if DatabaseTable.is_on_disk(self.__tree):
+            return len(self.__tree)
+        return sum(1 for _ in self.__tree.iter_inorder())
+
+    def mark_dirty(self) -> None:
+        """
+        Marks table as changed since it was last written to file
+        """
+
+        self.__dirty = True
+        self.__version = DatabaseTable.next_version()
+
+    def mark_clean(self) -> None:
+        """
+        Marks table as written to file by someone else (e.g. background save)
+        """
+
+        self.__dirty = False
+
+    @property
+    def dirty(self) -> bool:
+        """
+        Whether table changed since it was last read from or written to file
+        """
+
+        return self.__dirty
+
+    @property
+    def version(self) -> int:
+        """
+        Counter increased by every table modification. Versions are unique across all tables,
+        so a recreated table never repeats version of the dropped one
+        """
+
+        return self.__version
+
+    @property
+    def key_col(self) -> int:
+        """
+        Gets key column index
+        """
+
+        return self.__tree.key_col
+
+    @property
+    def layout(self) -> RowLayout:
+        """
+        Gets binary row layout of table
+        """
+
+        return self.__layout
+
+    @property
+    def column_types(self) -> list[int]:
+        """
+        Gets types of table columns
+        """
 
-        with open(filename, "wb") as file:
-            file.write(total_res)
+        return self.__column_types
 
     @property
     def tree(self):
         """
-        Gets tree data structure
+        Gets tree data structure.
+        Caller may modify the tree directly, so table is conservatively marked dirty;
+        use find/inorder for reads and insert/erase for writes to avoid that
         """
 
+        self.load()
+        self.mark_dirty()
+        self.__bloom = None
+        self.__clear_key_cache()
         return self.__tree
@@ -0,0 +1,541 @@
+"""
+Contains LSM storage engine: in-memory tree (memtable) plus immutable sorted runs
+
+Table file is a manifest listing run files in order from oldest to newest, all big-endian:
+    magic, format version, next run id, rows count, key column, columns count, column types,
+    runs count, run ids
+
+Run "<table file>.<id>.run" is a row format table file (see row_file.py) with one extra
+CHAR column at the end: "r" for row, "t" for tombstone. Tombstone says that all rows with
+its key in older runs are erased, it precedes rows with the same key in the run.
+Runs are never modified: memtable is flushed into new run when it is full or table is
+saved, and size-tiered compaction merges runs of similar size into one in background.
+"""
+
+import heapq
+import os
+import struct
+import threading
+from itertools import groupby
+from operator import itemgetter
+
+from abstract_tree import AbstractTree
+from bloom_filter import BloomFilter
+from data_entry import ColumnType, DataEntry, RowLayout
+from row_file import MappedRows, read_header, write_rows
+
+
+class LsmTree(AbstractTree):
+    """
+    Log-structured merge tree over table file.
+    Writes go to memtable of any in-memory tree type, reads merge memtable with runs.
+    Every run has bloom filter of its keys (built when run is opened), point lookups skip
+    runs that do not have the key.
+    Must be created with create() or opened with open(); DatabaseTable does this for
+    tables with "lsm" storage format
+    """
+
+    on_disk = True
+    storage_format = "lsm"
+
+    MAGIC = b"\xff\xfdLSMT"
+    DEFAULT_MEMTABLE_ROWS = 1 << 16
+    DEFAULT_FANIN = 4
+
+    __format_version = 2
+    __header = struct.Struct(">6sHQQHH")
+    __count = struct.Struct(">I")
+    __run_id = struct.Struct(">Q")
+    __row_flag = "r"
+    __tombstone_flag = "t"
+
+    def __init__(self, filename: str, memtable_type, memtable_rows: int | None = None,
+                 fanin: int | None = None, background_compaction: bool = True):
+        """
+        Args:
+            filename: Manifest file
+            memtable_type: In-memory tree class used for memtable
+            memtable_rows: Number of rows and tombstones in memtable that triggers its flush
+            fanin: Number of runs of similar size merged by one compaction
+            background_compaction: Whether compaction runs in background thread
+                (otherwise it runs right after the flush that triggered it)
+        """
+
+        key_col, column_types, self.__next_run_id, self.__row_count, run_ids = LsmTree.__read_manifest(filename)
+        super().__init__(key_col)
+
+        self.__filename = filename
+        self.__memtable_type = memtable_type
+        self.__memtable_rows = memtable_rows or LsmTree.DEFAULT_MEMTABLE_ROWS
+        self.__fanin = max(2, fanin or LsmTree.DEFAULT_FANIN)
+        self.__background_compaction = background_compaction
+        self.__column_types = column_types
+        self.__run_types = column_types + [ColumnType.CHAR]
+
+        self.__memtable = memtable_type(key_col)
+        self.__tombstones = set()
+        self.__memtable_size = 0
+
+        # Run list is replaced by compaction thread, readers take a copy under the lock.
+        # Merged runs stay readable until the next manifest is written
+        self.__lock = threading.Lock()
+        self.__run_blooms = {}
+        self.__runs = [(run_id, self.__open_run(run_id)) for run_id in run_ids]
+        self.__obsolete_runs = []
+        self.__compaction = None
+        self.__compaction_error = None
+        self.compactions = 0
+
+    @classmethod
+    def create(cls, filename: str, key_col: int, column_types: list[int], memtable_type,
+               data_entries=None, **kwargs) -> "LsmTree":
+        """
+        Creates table file (replacing existing one) and opens it.
+        Rows sorted by key given in data_entries are written as the first run
+        """
+
+        run_ids = []
+        row_count = 0
+        if data_entries is not None:
+            run_filename = LsmTree.__run_filename(filename, 0)
+            run_types = column_types + [ColumnType.CHAR]
+            write_rows(
+                run_filename, key_col, run_types,
+                (DataEntry(data_entry.columns + [LsmTree.__row_flag]) for data_entry in data_entries)
+            )
+            run_ids.append(0)
+            row_count = read_header(run_filename)[3]
+
+        header = LsmTree.__header.pack(
+            LsmTree.MAGIC, LsmTree.__format_version, len(run_ids), row_count, key_col, len(column_types)
+        )
+        LsmTree.__write_file(filename, header + bytes(column_types) + LsmTree.__encode_run_ids(run_ids))
+        return cls(filename, memtable_type, **kwargs)
+
+    @classmethod
+    def open(cls, filename: str, memtable_type, **kwargs) -> "LsmTree":
+        """
+        Opens existing table file. Runs written after the last manifest (memtable flushes
+        and compactions of a process that did not save) are deleted
+        """
+
+        tree = cls(filename, memtable_type, **kwargs)
+        LsmTree.__remove_runs_except(filename, {run_id for run_id, _ in tree.__runs})
+        return tree
+
+    @staticmethod
+    def is_lsm_file(filename: str) -> bool:
+        """
+        Checks whether file starts with LSM manifest magic
+        """
+
+        with open(filename, "rb") as file:
+            return file.read(len(LsmTree.MAGIC)) == LsmTree.MAGIC
+
+    @staticmethod
+    def read_metadata(filename: str) -> tuple[int, list[int], int]:
+        """
+        Reads schema and rows count of table from its manifest
+
+        Returns:
+            (key column, column types, rows count)
+        """
+
+        key_col, column_types, _, row_count, _ = LsmTree.__read_manifest(filename)
+        return key_col, column_types, row_count
+
+    @staticmethod
+    def table_files(filename: str) -> list[str]:
+        """
+        Gets manifest and run files of table
+        """
+
+        run_ids = LsmTree.__read_manifest(filename)[4]
+        return [filename] + [LsmTree.__run_filename(filename, run_id) for run_id in run_ids]
+
+    @staticmethod
+    def remove_files(filename: str) -> None:
+        """
+        Deletes manifest and all run files of table
+        """
+
+        os.remove(filename)
+        LsmTree.remove_runs(filename)
+
+    @staticmethod
+    def remove_runs(filename: str) -> None:
+        """
+        Deletes all run files of table, e.g. after it was rewritten in another format
+        """
+
+        LsmTree.__remove_runs_except(filename, set())
+
+    @property
+    def filename(self) -> str:
+        """
+        Gets manifest file path
+        """
+
+        return self.__filename
+
+    @property
+    def column_types(self) -> list[int]:
+        """
+        Gets types of table columns
+        """
+
+        return self.__column_types
+
+    @property
+    def memtable_type(self):
+        """
+        Gets tree class of memtable
+        """
+
+        return self.__memtable_type
+
+    @memtable_type.setter
+    def memtable_type(self, value):
+        if value is self.__memtable_type:
+            return
+        memtable = value(self.key_col)
+        memtable.bulk_build(self.__memtable.iter_inorder())
+        self.__memtable = memtable
+        self.__memtable_type = value
+
+    @property
+    def runs_count(self) -> int:
+        """
+        Gets number of live runs
+        """
+
+        with self.__lock:
+            return len(self.__runs)
+
+    def __len__(self) -> int:
+        return self.__row_count
+
+    def insert(self, data_entry: DataEntry) -> None:
+        self.__memtable.insert(data_entry)
+        self.__row_count += 1
+        self.__memtable_size += 1
+        self.__flush_if_full()
+
+    def erase(self, key) -> None:
+        # Rows count is kept for the manifest, so erase looks the key up (runs without it are skipped by bloom filters)
+        self.__row_count -= len(self.find(key))
+        self.__memtable.erase(key)
+        with self.__lock:
+            has_runs = bool(self.__runs)
+        if has_runs:
+            self.__tombstones.add(key)
+            self.__memtable_size += 1
+            self.__flush_if_full()
+
+    def find(self, key) -> list[DataEntry]:
+        parts = [self.__memtable.find(key)]
+        if key not in self.__tombstones:
+            for run_id, run in reversed(self.__live_runs()):
+                # Bloom filter of run holds tombstone keys too, so skipped run has nothing for key
+                if key not in self.__run_blooms[run_id]:
+                    continue
+                records = run.find(key)
+                parts.append([
+                    DataEntry(record.columns[:-1]) for record in records
+                    if record.columns[-1] == LsmTree.__row_flag
+                ])
+                if any(record.columns[-1] == LsmTree.__tombstone_flag for record in records):
+                    break
+
+        return [data_entry for part in reversed(parts) for data_entry in part]
+
+    def find_range(self, low=None, high=None) -> list[DataEntry]:
+        """
+        Gets rows with low <= key <= high sorted by key, bound set to None is not checked
+        """
+
+        def in_range(key):
+            return (low is None or key >= low) and (high is None or key <= high)
+
+        sources = [self.__run_records(run.find_range(low, high)) for _, run in self.__live_runs()]
+        sources.append(self.__memtable_records(in_range))
+        return [data_entry for _, _, data_entry in LsmTree.__merge(sources, keep_tombstones=False)]
+
+    def iter_inorder(self):
+        sources = [self.__run_records(run) for _, run in self.__live_runs()]
+        sources.append(self.__memtable_records())
+        return (data_entry for _, _, data_entry in LsmTree.__merge(sources, keep_tombstones=False))
+
+    def inorder(self) -> list[DataEntry]:
+        return list(self.iter_inorder())
+
+    def preorder(self) -> list[DataEntry]:
+        # Rows are spread over sorted runs, there is no tree shape to walk
+        return self.inorder()
+
+    def postorder(self) -> list[DataEntry]:
+        return self.inorder()
+
+    def flush(self) -> None:
+        """
+        Flushes memtable into new run and writes manifest, runs merged by compaction
+        are deleted after that. This is the whole save of the table
+        """
+
+        self.__raise_compaction_error()
+        self.__flush_memtable()
+
+        with self.__lock:
+            run_ids = [run_id for run_id, _ in self.__runs]
+            obsolete_runs, self.__obsolete_runs = self.__obsolete_runs, []
+            header = LsmTree.__header.pack(
+                LsmTree.MAGIC, LsmTree.__format_version, self.__next_run_id, self.__row_count, self.key_col,
+                len(self.__column_types)
+            )
+        LsmTree.__write_file(self.__filename, header + bytes(self.__column_types) + LsmTree.__encode_run_ids(run_ids))
+
+        for run_id, run in obsolete_runs:
+            run.close()
+            self.__run_blooms.pop(run_id, None)
+            os.remove(LsmTree.__run_filename(self.__filename, run_id))
+
+    def compact(self) -> None:
+        """
+        Merges all runs into one (waits for running background compaction first)
+        """
+
+        self.wait_compaction()
+        with self.__lock:
+            window = list(self.__runs)
+        if len(window) > 1:
+            self.__merge_runs(window, drop_tombstones=True)
+
+    def wait_compaction(self) -> None:
+        """
+        Waits until background compaction finishes
+
+        Raises:
+            RuntimeError: If compaction failed
+        """
+
+        compaction = self.__compaction
+        if compaction is not None:
+            compaction.join()
+        self.__raise_compaction_error()
+
+    def close(self) -> None:
+        """
+        Waits for compaction and unmaps runs, memtable is not flushed
+        """
+
+        compaction = self.__compaction
+        if compaction is not None:
+            compaction.join()
+        with self.__lock:
+            for _, run in self.__runs + self.__obsolete_runs:
+                run.close()
+            self.__runs = []
+
+    def __del__(self):
+        if getattr(self, "_LsmTree__lock", None) is not None:
+            self.close()
+
+    def __live_runs(self) -> list:
+        with self.__lock:
+            return list(self.__runs)
+
+    def __flush_if_full(self) -> None:
+        if self.__memtable_size >= self.__memtable_rows:
+            self.__flush_memtable()
+
+    def __flush_memtable(self) -> None:
+        if self.__memtable_size == 0:
+            return
+
+        with self.__lock:
+            run_id = self.__next_run_id
+            self.__next_run_id += 1
+
+        self.__write_run(run_id, LsmTree.__merge([self.__memtable_records()], keep_tombstones=True))
+        run = self.__open_run(run_id)
+        with self.__lock:
+            self.__runs.append((run_id, run))
+
+        self.__memtable = self.__memtable_type(self.key_col)
+        self.__tombstones = set()
+        self.__memtable_size = 0
+        self.__schedule_compaction()
+
+    def __schedule_compaction(self) -> None:
+        if self.__compaction is not None and self.__compaction.is_alive():
+            return
+
+        window = self.__pick_window()
+        if window is None:
+            return
+        if not self.__background_compaction:
+            self.__compact(window)
+            return
+
+        self.__compaction = threading.Thread(target=self.__compact, args=(window,), daemon=True)
+        self.__compaction.start()
+
+    def __tier(self, run_size: int) -> int:
+        # Runs flushed from memtable are tier 0, merge of fanin runs of a tier is in the next one
+        tier = 0
+        run_size //= self.__memtable_rows
+        while run_size >= self.__fanin:
+            run_size //= self.__fanin
+            tier += 1
+        return tier
+
+    def __pick_window(self):
+        # First fanin consecutive runs of one size tier are merged, runs must be consecutive
+        # for the merged run to keep their place in order from oldest to newest
+        with self.__lock:
+            runs = list(self.__runs)
+        tiers = [self.__tier(len(run)) for _, run in runs]
+        for start in range(len(runs) - self.__fanin + 1):
+            if len(set(tiers[start:start + self.__fanin])) == 1:
+                return runs[start:start + self.__fanin]
+        return None
+
+    def __compact(self, window: list) -> None:
+        try:
+            while window is not None:
+                with self.__lock:
+                    drop_tombstones = self.__runs[0][0] == window[0][0]
+                self.__merge_runs(window, drop_tombstones)
+                window = self.__pick_window()
+        except BaseException as e:
+            self.__compaction_error = e
+
+    def __merge_runs(self, window: list, drop_tombstones: bool) -> None:
+        with self.__lock:
+            run_id = self.__next_run_id
+            self.__next_run_id += 1
+
+        # Tombstones are needed only while older runs may hold rows with their key
+        sources = [self.__run_records(run) for _, run in window]
+        self.__write_run(run_id, LsmTree.__merge(sources, keep_tombstones=not drop_tombstones))
+        merged = self.__open_run(run_id)
+
+        window_ids = [window_id for window_id, _ in window]
+        with self.__lock:
+            ids = [existing_id for existing_id, _ in self.__runs]
+            start = ids.index(window_ids[0])
+            self.__obsolete_runs += self.__runs[start:start + len(window)]
+            self.__runs[start:start + len(window)] = [(run_id, merged)]
+            self.compactions += 1
+
+    def __raise_compaction_error(self) -> None:
+        if self.__compaction_error is not None:
+            error, self.__compaction_error = self.__compaction_error, None
+            raise RuntimeError(f"LSM compaction failed: {error}") from error
+
+    def __write_run(self, run_id: int, records) -> None:
+        write_rows(
+            LsmTree.__run_filename(self.__filename, run_id), self.key_col, self.__run_types,
+            (self.__encode_record(record) for record in records)
+        )
+
+    def __encode_record(self, record) -> DataEntry:
+        key, tombstone, data_entry = record
+        if not tombstone:
+            return DataEntry(data_entry.columns + [LsmTree.__row_flag])
+
+        columns = [0 if column_type in (ColumnType.INT, ColumnType.LONG) else "" for column_type in self.__column_types]
+        columns[self.key_col] = key
+        return DataEntry(columns + [LsmTree.__tombstone_flag])
+
+    def __open_run(self, run_id: int) -> MappedRows:
+        filename = LsmTree.__run_filename(self.__filename, run_id)
+        key_col, column_types, rows_offset, row_count, _ = read_header(filename)
+        run = MappedRows(filename, RowLayout(column_types), key_col, rows_offset, row_count)
+        self.__run_blooms[run_id] = BloomFilter.from_keys((run.key_at(i) for i in range(row_count)), row_count)
+        return run
+
+    def __run_records(self, data_entries):
+        key_col = self.key_col
+        for data_entry in data_entries:
+            columns = data_entry.columns
+            if columns[-1] == LsmTree.__tombstone_flag:
+                yield columns[key_col], True, None
+            else:
+                yield columns[key_col], False, DataEntry(columns[:-1])
+
+    def __memtable_records(self, in_range=None):
+        key_col = self.key_col
+        tombstones = sorted(key for key in self.__tombstones if in_range is None or in_range(key))
+        rows = (
+            (data_entry.columns[key_col], False, data_entry) for data_entry in self.__memtable.iter_inorder()
+            if in_range is None or in_range(data_entry.columns[key_col])
+        )
+        # Tombstone of memtable is older than its rows with the same key, so it goes first
+        return heapq.merge(((key, True, None) for key in tombstones), rows, key=itemgetter(0))
+
+    @staticmethod
+    def __merge(sources: list, keep_tombstones: bool):
+        """
+        Merges record streams sorted by key given from oldest to newest.
+        Yields records of merged run, tombstones are kept only if keep_tombstones is set
+        """
+
+        def with_index(index, source):
+            for key, tombstone, data_entry in source:
+                yield key, index, tombstone, data_entry
+
+        indexed = [with_index(index, source) for index, source in enumerate(sources)]
+        # heapq.merge keeps order of sources for equal keys, so every group goes from oldest to newest
+        for key, group in groupby(heapq.merge(*indexed, key=itemgetter(0)), key=itemgetter(0)):
+            group = list(group)
+            newest_tombstone = max((index for _, index, tombstone, _ in group if tombstone), default=-1)
+            if keep_tombstones and newest_tombstone >= 0:
+                yield key, True, None
+            for _, index, tombstone, data_entry in group:
+                if not tombstone and index >= newest_tombstone:
+                    yield key, False, data_entry
+
+    @staticmethod
+    def __remove_runs_except(filename: str, run_ids: set) -> None:
+        folder = os.path.dirname(filename) or "."
+        prefix = f"{os.path.basename(filename)}."
+        for name in os.listdir(folder):
+            run_id = name[len(prefix):-len(".run")]
+            if name.startswith(prefix) and name.endswith(".run") and run_id.isdigit() and int(run_id) not in run_ids:
+                os.remove(os.path.join(folder, name))
+
+    @staticmethod
+    def __run_filename(filename: str, run_id: int) -> str:
+        return f"{filename}.{run_id}.run"
+
+    @staticmethod
+    def __read_manifest(filename: str) -> tuple[int, list[int], int, int, list[int]]:
+        with open(filename, "rb") as file:
+            content = file.read()
+
+        magic, version, next_run_id, row_count, key_col, columns_count = LsmTree.__header.unpack_from(content, 0)
+        if magic != LsmTree.MAGIC or version != LsmTree.__format_version:
+            raise RuntimeError(f"{filename} is not an LSM table file")
+
+        offset = LsmTree.__header.size
+        column_types = list(content[offset:offset + columns_count])
+        offset += columns_count
+        (runs_count,) = LsmTree.__count.unpack_from(content, offset)
+        offset += LsmTree.__count.size
+        run_ids = [
+            LsmTree.__run_id.unpack_from(content, offset + i * LsmTree.__run_id.size)[0] for i in range(runs_count)
+        ]
+        return key_col, column_types, next_run_id, row_count, run_ids
+
+    @staticmethod
+    def __encode_run_ids(run_ids: list[int]) -> bytes:
+        return LsmTree.__count.pack(len(run_ids)) + b"".join(LsmTree.__run_id.pack(run_id) for run_id in run_ids)
+
+    @staticmethod
+    def __write_file(filename: str, content: bytes) -> None:
+        with open(f"{filename}.tmp", "wb") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{filename}.tmp", filename)
@@ -0,0 +1,673 @@
+"""
+Contains disk-resident B-tree stored in fixed-size pages
+
+File consists of pages of equal size:
+    page 0 - header (format, root page, free pages list, table schema)
+    node pages - B-tree node: leaf flag, entries and child page ids
+    overflow pages - rows with duplicate keys that did not fit into node entry
+    free pages - released pages, linked into free list
+
+Node entry holds the first row of key bucket inline plus id of overflow pages chain for
+the rest of the bucket, so tables with unique keys never use overflow pages.
+Pages are accessed through buffer pool with LRU eviction and dirty page write-back,
+so only a bounded number of pages stays in memory.
+"""
+
+import os
+import struct
+from bisect import bisect_left
+from collections import OrderedDict
+from operator import itemgetter
+
+from abstract_tree import AbstractTree
+from data_entry import ColumnType, DataEntry, RowLayout
+
+_entry_key = itemgetter(0)
+
+
+class NodePage:
+    """
+    B-tree node page, entries are (key, encoded row, overflow page id) tuples
+    """
+
+    def __init__(self, page_id: int, leaf: bool, entries: list | None = None, children: list | None = None):
+        self.page_id = page_id
+        self.leaf = leaf
+        self.entries = entries if entries is not None else []
+        self.children = children if children is not None else []
+
+
+class OverflowPage:
+    """
+    Page of rows with duplicate key, chained from the newest page to the oldest one
+    """
+
+    def __init__(self, page_id: int, next_page: int, rows: list | None = None):
+        self.page_id = page_id
+        self.next_page = next_page
+        self.rows = rows if rows is not None else []
+
+
+class BufferPool:
+    """
+    Caches decoded pages with LRU eviction, writes dirty pages back on eviction and flush
+    """
+
+    def __init__(self, file, page_size: int, capacity: int, decode_page, encode_page):
+        self.__file = file
+        self.__page_size = page_size
+        self.capacity = capacity
+        self.__decode_page = decode_page
+        self.__encode_page = encode_page
+        self.__pages = OrderedDict()
+        self.__dirty = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+
+    def get(self, page_id: int):
+        """
+        Gets decoded page, reads it from file if it is not cached
+        """
+
+        page = self.__pages.get(page_id)
+        if page is not None:
+            self.hits += 1
+            self.__pages.move_to_end(page_id)
+            return page
+
+        self.misses += 1
+        self.__file.seek(page_id * self.__page_size)
+        page = self.__decode_page(page_id, self.__file.read(self.__page_size))
+        self.__pages[page_id] = page
+        return page
+
+    def add(self, page) -> None:
+        """
+        Adds newly created page, it is written to file on eviction or flush
+        """
+
+        self.__pages[page.page_id] = page
+        self.__dirty.add(page.page_id)
+
+    def mark_dirty(self, page) -> None:
+        """
+        Marks page as modified
+        """
+
+        self.__dirty.add(page.page_id)
+
+    def discard(self, page_id: int) -> None:
+        """
+        Drops page from cache without writing it
+        """
+
+        self.__pages.pop(page_id, None)
+        self.__dirty.discard(page_id)
+
+    def trim(self) -> None:
+        """
+        Evicts least recently used pages above capacity.
+        Called between tree operations only, so pages referenced by an operation in progress
+        are never evicted and reloaded as a second copy
+        """
+
+        while len(self.__pages) > self.capacity:
+            page_id, page = self.__pages.popitem(last=False)
+            self.evictions += 1
+            if page_id in self.__dirty:
+                self.__write(page)
+                self.__dirty.discard(page_id)
+
+    def flush(self) -> None:
+        """
+        Writes all dirty pages to file
+        """
+
+        for page_id in sorted(self.__dirty):
+            self.__write(self.__pages[page_id])
+        self.__dirty.clear()
+
+    def __len__(self) -> int:
+        return len(self.__pages)
+
+    def __write(self, page) -> None:
+        self.writes += 1
+        self.__file.seek(page.page_id * self.__page_size)
+        self.__file.write(self.__encode_page(page))
+
+
+class PagedBTree(AbstractTree):
+    """
+    B-tree stored in page file, only pages in buffer pool are kept in memory.
+    Unlike in-memory trees it needs a file and table column types, so it is created with
+    create() or opened with open(); DatabaseTable does this for tree types with on_disk set
+    """
+
+    on_disk = True
+
+    MAGIC = b"\xff\xffPGBT"
+    DEFAULT_PAGE_SIZE = 4096
+    DEFAULT_CACHE_BYTES = 16 << 20
+
+    __header = struct.Struct(">6sHIIIIQHH")
+    __format_version = 1
+    __node_header = struct.Struct(">BBH")
+    __overflow_header = struct.Struct(">BHI")
+    __page_id = struct.Struct(">I")
+    __node_type = 1
+    __overflow_type = 2
+    __free_type = 3
+
+    def __init__(self, filename: str, cache_bytes: int | None = None):
+        """
+        Opens existing page file, use create() for a new one.
+
+        Args:
+            filename: Page file path
+            cache_bytes: Memory budget of buffer pool, DEFAULT_CACHE_BYTES if None
+        """
+
+        self.__filename = filename
+        self.__file = open(filename, "r+b")
+        header = self.__file.read(PagedBTree.__header.size)
+        (
+            magic, version, self.__page_size, self.__root_id, self.__page_count,
+            self.__free_head, self.__row_count, key_col, columns_count
+        ) = PagedBTree.__header.unpack(header)
+        if magic != PagedBTree.MAGIC or version != PagedBTree.__format_version:
+            self.__file.close()
+            raise ValueError(f"{filename} is not a paged B-tree file")
+
+        super().__init__(key_col)
+        self.__column_types = list(self.__file.read(columns_count))
+        self.__layout = RowLayout(self.__column_types)
+        self.__key_layout = RowLayout([self.__column_types[key_col]])
+        self.__key_offset = self.__layout.column_offset(key_col)
+        self.__row_size = self.__layout.row_size
+        self.__max_entries = self.max_entries(self.__page_size, self.__row_size)
+        self.t = (self.__max_entries + 1) // 2
+        self.__overflow_capacity = (self.__page_size - PagedBTree.__overflow_header.size) // self.__row_size
+        self.__entry = struct.Struct(f">{self.__row_size}sI")
+        self.__header_dirty = False
+
+        cache_bytes = type(self).DEFAULT_CACHE_BYTES if cache_bytes is None else cache_bytes
+        self.pool = BufferPool(
+            self.__file, self.__page_size, max(8, cache_bytes // self.__page_size),
+            self.__decode_page, self.__encode_page
+        )
+
+    @classmethod
+    def create(cls, filename: str, key_col: int, column_types: list[int],
+               page_size: int | None = None, cache_bytes: int | None = None) -> "PagedBTree":
+        """
+        Creates empty page file (replacing existing one) and opens it.
+        Page size is increased to the nearest power of two holding at least 3 node entries
+        """
+
+        if ColumnType.VAR_STRING in column_types or ColumnType.DICT_STRING in column_types:
+            raise RuntimeError("Paged tables do not support VAR_STRING and DICT_STRING columns")
+
+        row_size = RowLayout(column_types).row_size
+        page_size = cls.DEFAULT_PAGE_SIZE if page_size is None else page_size
+        while cls.max_entries(page_size, row_size) < 3:
+            page_size *= 2
+
+        header = PagedBTree.__header.pack(
+            PagedBTree.MAGIC, PagedBTree.__format_version, page_size, 1, 2, 0, 0, key_col, len(column_types)
+        ) + bytes(column_types)
+        if len(header) > page_size:
+            raise ValueError("Too many columns for page size")
+
+        root = bytearray(page_size)
+        PagedBTree.__node_header.pack_into(root, 0, PagedBTree.__node_type, 1, 0)
+
+        with open(filename, "wb") as file:
+            file.write(header + bytes(page_size - len(header)))
+            file.write(root)
+
+        return cls(filename, cache_bytes)
+
+    @classmethod
+    def open(cls, filename: str, cache_bytes: int | None = None) -> "PagedBTree":
+        """
+        Opens existing page file
+        """
+
+        return cls(filename, cache_bytes)
+
+    @staticmethod
+    def is_paged_file(filename: str) -> bool:
+        """
+        Checks whether file starts with paged B-tree magic
+        """
+
+        with open(filename, "rb") as file:
+            return file.read(len(PagedBTree.MAGIC)) == PagedBTree.MAGIC
+
+    @staticmethod
+    def read_metadata(filename: str) -> tuple[int, list[int], int]:
+        """
+        Reads schema and row count from header page without opening the tree
+
+        Returns:
+            (key column, column types, rows count)
+        """
+
+        with open(filename, "rb") as file:
+            header = file.read(PagedBTree.__header.size)
+            *_, row_count, key_col, columns_count = PagedBTree.__header.unpack(header)
+            return key_col, list(file.read(columns_count)), row_count
+
+    @staticmethod
+    def max_entries(page_size: int, row_size: int) -> int:
+        """
+        Gets odd maximal number of node entries (2t - 1) fitting into page
+        """
+
+        fit = (page_size - PagedBTree.__node_header.size - PagedBTree.__page_id.size) \
+            // (row_size + 2 * PagedBTree.__page_id.size)
+        return fit if fit % 2 == 1 else fit - 1
+
+    @property
+    def filename(self) -> str:
+        """
+        Gets page file path
+        """
+
+        return self.__filename
+
+    @property
+    def column_types(self) -> list[int]:
+        """
+        Gets column types of stored rows
+        """
+
+        return self.__column_types
+
+    @property
+    def page_size(self) -> int:
+        """
+        Gets size of page in bytes
+        """
+
+        return self.__page_size
+
+    def __len__(self) -> int:
+        return self.__row_count
+
+    def flush(self) -> None:
+        """
+        Writes dirty pages and header to file and syncs it
+        """
+
+        self.pool.flush()
+        if self.__header_dirty:
+            self.__file.seek(0)
+            self.__file.write(PagedBTree.__header.pack(
+                PagedBTree.MAGIC, PagedBTree.__format_version, self.__page_size, self.__root_id,
+                self.__page_count, self.__free_head, self.__row_count, self.key_col, len(self.__column_types)
+            ))
+            self.__header_dirty = False
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+    def close(self) -> None:
+        """
+        Flushes and closes page file
+        """
+
+        if not self.__file.closed:
+            self.flush()
+            self.__file.close()
+
+    def __del__(self):
+        # Evicted pages are already in the file, so it has to be completed with the rest
+        if getattr(self, "_PagedBTree__file", None) is not None and hasattr(self, "pool"):
+            self.close()
+
+    def find(self, key) -> list[DataEntry]:
+        node = self.pool.get(self.__root_id)
+        while True:
+            i = bisect_left(node.entries, key, key=_entry_key)
+            if i < len(node.entries) and node.entries[i][0] == key:
+                result = self.__bucket_rows(node.entries[i])
+                break
+            if node.leaf:
+                result = []
+                break
+            node = self.pool.get(node.children[i])
+
+        self.pool.trim()
+        return result
+
+    def insert(self, data_entry: DataEntry) -> None:
+        key = data_entry.columns[self.key_col]
+        row = self.__layout.encode(data_entry.columns)
+
+        if not self.__append_to_bucket(key, row):
+            root = self.pool.get(self.__root_id)
+            if len(root.entries) == self.__max_entries:
+                new_root = NodePage(self.__allocate(), False, [], [root.page_id])
+                self.pool.add(new_root)
+                self.__set_root(new_root.page_id)
+                self.__split_child(new_root, 0)
+                root = new_root
+            self.__insert_non_full(root, (key, row, 0))
+
+        self.__row_count += 1
+        self.__header_dirty = True
+        self.pool.trim()
+
+    def erase(self, key) -> None:
+        entry = self.__find_entry(key)
+        if entry is not None:
+            self.__row_count -= 1 + self.__free_overflow(entry[2])
+            self.__header_dirty = True
+            self.__delete(self.pool.get(self.__root_id), key)
+
+            root = self.pool.get(self.__root_id)
+            if not root.entries and not root.leaf:
+                self.__set_root(root.children[0])
+                self.__free(root.page_id)
+
+        self.pool.trim()
+
+    def find_range(self, low=None, high=None) -> list[DataEntry]:
+        """
+        Gets rows with low <= key <= high sorted by key, bound set to None is not checked.
+        Only pages overlapping the range are read
+        """
+
+        def range_recursive(page_id, result):
+            node = self.pool.get(page_id)
+            start = 0 if low is None else bisect_left(node.entries, low, key=_entry_key)
+            for i in range(start, len(node.entries)):
+                if not node.leaf:
+                    range_recursive(node.children[i], result)
+                if high is not None and node.entries[i][0] > high:
+                    return
+                result.extend(self.__bucket_rows(node.entries[i]))
+            if not node.leaf:
+                range_recursive(node.children[-1], result)
+        result = []
+        range_recursive(self.__root_id, result)
+        self.pool.trim()
+        return result
+
+    def iter_inorder(self):
+        def inorder_generator(page_id):
+            node = self.pool.get(page_id)
+            self.pool.trim()
+            for i, entry in enumerate(node.entries):
+                if not node.leaf:
+                    yield from inorder_generator(node.children[i])
+                yield from self.__bucket_rows(entry)
+            if not node.leaf:
+                yield from inorder_generator(node.children[-1])
+
+        return inorder_generator(self.__root_id)
+
+    def inorder(self) -> list[DataEntry]:
+        return list(self.iter_inorder())
+
+    def preorder(self) -> list[DataEntry]:
+        def preorder_recursive(page_id, result):
+            node = self.pool.get(page_id)
+            for entry in node.entries:
+                result.extend(self.__bucket_rows(entry))
+            for child in node.children:
+                preorder_recursive(child, result)
+        result = []
+        preorder_recursive(self.__root_id, result)
+        self.pool.trim()
+        return result
+
+    def postorder(self) -> list[DataEntry]:
+        def postorder_recursive(page_id, result):
+            node = self.pool.get(page_id)
+            for child in node.children:
+                postorder_recursive(child, result)
+            for entry in node.entries:
+                result.extend(self.__bucket_rows(entry))
+        result = []
+        postorder_recursive(self.__root_id, result)
+        self.pool.trim()
+        return result
+
+    def __bucket_rows(self, entry) -> list[DataEntry]:
+        rows = [DataEntry(self.__layout.decode(entry[1]))]
+
+        pages = []
+        page_id = entry[2]
+        while page_id:
+            page = self.pool.get(page_id)
+            pages.append(page)
+            page_id = page.next_page
+        for page in reversed(pages):
+            rows.extend(DataEntry(self.__layout.decode(row)) for row in page.rows)
+
+        return rows
+
+    def __find_entry(self, key):
+        node = self.pool.get(self.__root_id)
+        while True:
+            i = bisect_left(node.entries, key, key=_entry_key)
+            if i < len(node.entries) and node.entries[i][0] == key:
+                return node.entries[i]
+            if node.leaf:
+                return None
+            node = self.pool.get(node.children[i])
+
+    def __append_to_bucket(self, key, row: bytes) -> bool:
+        node = self.pool.get(self.__root_id)
+        while True:
+            i = bisect_left(node.entries, key, key=_entry_key)
+            if i < len(node.entries) and node.entries[i][0] == key:
+                break
+            if node.leaf:
+                return False
+            node = self.pool.get(node.children[i])
+
+        overflow_id = node.entries[i][2]
+        if overflow_id:
+            page = self.pool.get(overflow_id)
+            if len(page.rows) < self.__overflow_capacity:
+                page.rows.append(row)
+                self.pool.mark_dirty(page)
+                return True
+
+        page = OverflowPage(self.__allocate(), overflow_id, [row])
+        self.pool.add(page)
+        node.entries[i] = (key, node.entries[i][1], page.page_id)
+        self.pool.mark_dirty(node)
+        return True
+
+    def __insert_non_full(self, node: NodePage, entry) -> None:
+        while True:
+            i = bisect_left(node.entries, entry[0], key=_entry_key)
+            if node.leaf:
+                node.entries.insert(i, entry)
+                self.pool.mark_dirty(node)
+                return
+
+            child = self.pool.get(node.children[i])
+            if len(child.entries) == self.__max_entries:
+                self.__split_child(node, i)
+                if entry[0] > node.entries[i][0]:
+                    child = self.pool.get(node.children[i + 1])
+            node = child
+
+    def __split_child(self, node: NodePage, i: int) -> None:
+        t = self.t
+        child = self.pool.get(node.children[i])
+        sibling = NodePage(self.__allocate(), child.leaf, child.entries[t:], child.children[t:])
+        self.pool.add(sibling)
+
+        node.entries.insert(i, child.entries[t - 1])
+        node.children.insert(i + 1, sibling.page_id)
+        child.entries = child.entries[:t - 1]
+        child.children = child.children[:t]
+
+        self.pool.mark_dirty(node)
+        self.pool.mark_dirty(child)
+
+    def __delete(self, node: NodePage, key) -> None:
+        t = self.t
+        while True:
+            i = bisect_left(node.entries, key, key=_entry_key)
+
+            if i < len(node.entries) and node.entries[i][0] == key:
+                if node.leaf:
+                    node.entries.pop(i)
+                    self.pool.mark_dirty(node)
+                    return
+
+                left = self.pool.get(node.children[i])
+                if len(left.entries) >= t:
+                    predecessor = left
+                    while not predecessor.leaf:
+                        predecessor = self.pool.get(predecessor.children[-1])
+                    node.entries[i] = predecessor.entries[-1]
+                    self.pool.mark_dirty(node)
+                    node, key = left, node.entries[i][0]
+                    continue
+
+                right = self.pool.get(node.children[i + 1])
+                if len(right.entries) >= t:
+                    successor = right
+                    while not successor.leaf:
+                        successor = self.pool.get(successor.children[0])
+                    node.entries[i] = successor.entries[0]
+                    self.pool.mark_dirty(node)
+                    node, key = right, node.entries[i][0]
+                    continue
+
+                self.__merge(node, i)
+                node = left
+                continue
+
+            if node.leaf:
+                return
+
+            child = self.pool.get(node.children[i])
+            if len(child.entries) == t - 1:
+                left = self.pool.get(node.children[i - 1]) if i > 0 else None
+                right = self.pool.get(node.children[i + 1]) if i < len(node.entries) else None
+
+                if left is not None and len(left.entries) >= t:
+                    child.entries.insert(0, node.entries[i - 1])
+                    node.entries[i - 1] = left.entries.pop()
+                    if not left.leaf:
+                        child.children.insert(0, left.children.pop())
+                    self.pool.mark_dirty(left)
+                elif right is not None and len(right.entries) >= t:
+                    child.entries.append(node.entries[i])
+                    node.entries[i] = right.entries.pop(0)
+                    if not right.leaf:
+                        child.children.append(right.children.pop(0))
+                    self.pool.mark_dirty(right)
+                elif right is not None:
+                    self.__merge(node, i)
+                else:
+                    self.__merge(node, i - 1)
+                    child = left
+
+                self.pool.mark_dirty(node)
+                self.pool.mark_dirty(child)
+
+            node = child
+
+    def __merge(self, node: NodePage, i: int) -> None:
+        child = self.pool.get(node.children[i])
+        sibling = self.pool.get(node.children[i + 1])
+
+        child.entries.append(node.entries.pop(i))
+        child.entries.extend(sibling.entries)
+        child.children.extend(sibling.children)
+        node.children.pop(i + 1)
+
+        self.pool.mark_dirty(node)
+        self.pool.mark_dirty(child)
+        self.__free(sibling.page_id)
+
+    def __free_overflow(self, page_id: int) -> int:
+        rows_count = 0
+        while page_id:
+            page = self.pool.get(page_id)
+            rows_count += len(page.rows)
+            self.__free(page_id)
+            page_id = page.next_page
+        return rows_count
+
+    def __allocate(self) -> int:
+        self.__header_dirty = True
+        if self.__free_head:
+            page_id = self.__free_head
+            self.__file.seek(page_id * self.__page_size + 1)
+            (self.__free_head,) = PagedBTree.__page_id.unpack(self.__file.read(PagedBTree.__page_id.size))
+            return page_id
+
+        self.__page_count += 1
+        return self.__page_count - 1
+
+    def __free(self, page_id: int) -> None:
+        self.pool.discard(page_id)
+        page = bytearray(self.__page_size)
+        page[0] = PagedBTree.__free_type
+        PagedBTree.__page_id.pack_into(page, 1, self.__free_head)
+        self.__file.seek(page_id * self.__page_size)
+        self.__file.write(page)
+        self.__free_head = page_id
+        self.__header_dirty = True
+
+    def __set_root(self, page_id: int) -> None:
+        self.__root_id = page_id
+        self.__header_dirty = True
+
+    def __decode_page(self, page_id: int, raw: bytes):
+        if raw[0] == PagedBTree.__overflow_type:
+            _, count, next_page = PagedBTree.__overflow_header.unpack_from(raw, 0)
+            offset = PagedBTree.__overflow_header.size
+            rows = [raw[offset + i * self.__row_size:offset + (i + 1) * self.__row_size] for i in range(count)]
+            return OverflowPage(page_id, next_page, rows)
+
+        if raw[0] != PagedBTree.__node_type:
+            raise ValueError(f"Page {page_id} of {self.__filename} is not a tree page")
+
+        _, leaf, count = PagedBTree.__node_header.unpack_from(raw, 0)
+        offset = PagedBTree.__node_header.size
+        entries_end = offset + count * self.__entry.size
+        decode_key = self.__key_layout.decode_from
+        key_offset = self.__key_offset
+        entries = [
+            (decode_key(row, key_offset)[0], row, overflow_id)
+            for row, overflow_id in self.__entry.iter_unpack(memoryview(raw)[offset:entries_end])
+        ]
+
+        children = []
+        if not leaf:
+            offset = entries_end
+            children = list(struct.unpack_from(f">{count + 1}I", raw, offset))
+
+        return NodePage(page_id, bool(leaf), entries, children)
+
+    def __encode_page(self, page) -> bytearray:
+        raw = bytearray(self.__page_size)
+
+        if isinstance(page, OverflowPage):
+            PagedBTree.__overflow_header.pack_into(raw, 0, PagedBTree.__overflow_type, len(page.rows), page.next_page)
+            raw[PagedBTree.__overflow_header.size:PagedBTree.__overflow_header.size + len(page.rows) * self.__row_size] \
+                = b"".join(page.rows)
+            return raw
+
+        PagedBTree.__node_header.pack_into(raw, 0, PagedBTree.__node_type, page.leaf, len(page.entries))
+        offset = PagedBTree.__node_header.size
+        for _, row, overflow_id in page.entries:
+            self.__entry.pack_into(raw, offset, row, overflow_id)
+            offset += self.__entry.size
+        if not page.leaf:
+            struct.pack_into(f">{len(page.children)}I", raw, offset, *page.children)
+
+        return raw
@@ -0,0 +1,1087 @@
+"""
+SQL-like query language: tokenizer, parser, compiled plans and prepared statements
+
+A query is tokenized once, literal values are lifted out into parameter slots and the
+remaining token shape (e.g. "insert into t values ? ? ?") is used as a key into an LRU
+cache of compiled plans. Repeated queries of the same shape therefore skip parsing,
+validation and column resolution and go straight to the precompiled plan.
+
+Results of SELECT queries are cached by shape and parameter values, tagged with version
+of the table they were read from; every table modification changes its version.
+"""
+
+import operator
+import re
+import sys
+import weakref
+from collections import OrderedDict
+from typing import Any
+
+from data_entry import ColumnType
+
+
+class QueryError(Exception):
+    """Custom exception for query parsing and execution errors."""
+
+
+INVALID_NAME_CHARS = "\"';\\/"
+# "@" separates table name from its tree backend in database config
+INVALID_TABLE_NAME_CHARS = INVALID_NAME_CHARS + "@"
+
+
+def validate_table_name(table_name: str) -> str:
+    """
+    Validates a table name to ensure it contains only valid characters.
+
+    Args:
+        table_name: The name of the table to validate
+
+    Returns:
+        The validated table name
+
+    Raises:
+        QueryError: If the table name contains invalid characters
+    """
+    # Basic validation - could be expanded with more specific rules
+    if not table_name or not isinstance(table_name, str):
+        raise QueryError("Table name must be a non-empty string")
+
+    # Check for invalid characters (basic sanitization)
+    if any(char in table_name for char in INVALID_TABLE_NAME_CHARS):
+        raise QueryError(f"Table name contains invalid characters: {INVALID_TABLE_NAME_CHARS}")
+
+    return table_name
+
+
+def validate_column_names(column_names: list[str]) -> list[str]:
+    """
+    Validates a list of column names to ensure they contain only valid characters.
+
+    Args:
+        column_names: list of column names to validate
+
+    Returns:
+        The validated list of column names
+
+    Raises:
+        QueryError: If any column name contains invalid characters
+    """
+    if not column_names:
+        raise QueryError("At least one column must be specified")
+
+    validated_columns = []
+    for col in column_names:
+        if not isinstance(col, str):
+            raise QueryError(f"Column name must be a string, got {type(col).__name__}")
+
+        # Check for invalid characters (basic sanitization)
+        if any(char in col for char in INVALID_NAME_CHARS):
+            raise QueryError(f"Column name contains invalid characters: {INVALID_NAME_CHARS}")
+
+        validated_columns.append(col)
+
+    return validated_columns
+
+
+def validate_values(values: list) -> list:
+    """
+    Validates a list of values to be inserted into a table.
+
+    Args:
+        values: list of values to validate
+
+    Returns:
+        The validated list of values
+
+    Raises:
+        QueryError: If values are invalid
+    """
+    if not values:
+        raise QueryError("No values provided for insertion")
+
+    # Further validation could be added based on expected types
+    return values
+
+
+WORD = "word"
+NUMBER = "number"
+STRING = "string"
+OP = "op"
+PUNCT = "punct"
+PLACEHOLDER = "placeholder"
+PARAM = "param"
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+    |(?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+    |(?P<number>-?\d+)(?=[\s(),;=<>!*?]|$)
+    |(?P<op><=|>=|!=|<>|=|<|>)
+    |(?P<placeholder>\?)
+    |(?P<punct>[(),;*])
+    |(?P<word>[^\s(),;=<>*?'"]+)
+""", re.VERBOSE)
+
+COLUMN_TYPES = {
+    "int": ColumnType.INT,
+    "long": ColumnType.LONG,
+    "char": ColumnType.CHAR,
+    "small_string": ColumnType.SMALL_STRING,
+    "big_string": ColumnType.BIG_STRING,
+    "var_string": ColumnType.VAR_STRING,
+    "dict_string": ColumnType.DICT_STRING,
+}
+
+STORAGE_FORMATS = ("rows", "columnar", "lsm")
+
+_COMPARISONS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<>": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def tokenize(text: str) -> list[tuple[str, Any]]:
+    """
+    Splits query text into (kind, value) tokens.
+
+    Numbers become ints, quoted strings are unquoted, words are kept as written.
+
+    Raises:
+        QueryError: If the text contains an unterminated string
+    """
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_PATTERN.match(text, pos)
+        if match is None:
+            raise QueryError(f"Unexpected character at position {pos}: {text[pos:pos + 10]!r}")
+        pos = match.end()
+
+        kind = match.lastgroup
+        value = match.group(kind)
+        match kind:
+            case "space":
+                continue
+            case "number":
+                tokens.append((NUMBER, int(value)))
+            case "string":
+                quote = value[0]
+                tokens.append((STRING, value[1:-1].replace(quote * 2, quote)))
+            case _:
+                tokens.append((kind, value))
+
+    return tokens
+
+
+def split_statements(text: str) -> list[str]:
+    """
+    Splits text into statements separated by ";" (quoted ";" does not separate).
+    Empty statements are dropped
+
+    Raises:
+        QueryError: If the text contains an unterminated string
+    """
+    statements = []
+    start = 0
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_PATTERN.match(text, pos)
+        if match is None:
+            raise QueryError(f"Unexpected character at position {pos}: {text[pos:pos + 10]!r}")
+        pos = match.end()
+        if match.lastgroup == "punct" and match.group("punct") == ";":
+            statements.append(text[start:pos - 1])
+            start = pos
+    statements.append(text[start:])
+
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def shape_tokens(tokens: list[tuple[str, Any]]) -> tuple[str, list, list[int], list[tuple[str, Any]]]:
+    """
+    Lifts literal values out of a token list.
+
+    Values are numbers, quoted strings, bare words that follow a comparison operator
+    or the VALUES keyword, and "?" placeholders. Every value becomes a PARAM token
+    referencing a slot, so queries that differ only in values share one shape.
+
+    Returns:
+        (normalized shape text, slot values, indexes of placeholder slots, shaped tokens)
+    """
+    key_parts = []
+    slots = []
+    placeholders = []
+    shaped = []
+    in_values = False
+    after_op = False
+
+    for kind, value in tokens:
+        if kind == PUNCT:
+            if value != ";":
+                key_parts.append(value)
+                shaped.append((kind, value))
+            continue
+
+        if kind == OP:
+            after_op = True
+            key_parts.append(value)
+            shaped.append((kind, value))
+            continue
+
+        if kind == WORD and not in_values and not after_op:
+            value = value.lower()
+            if value == "values":
+                in_values = True
+            key_parts.append(value)
+            shaped.append((kind, value))
+            continue
+
+        after_op = False
+        if kind == PLACEHOLDER:
+            placeholders.append(len(slots))
+            value = None
+        key_parts.append("?")
+        shaped.append((PARAM, len(slots)))
+        slots.append(value)
+
+    return " ".join(key_parts), slots, placeholders, shaped
+
+
+class Condition:
+    """
+    WHERE comparison: column <op> parameter slot
+    """
+
+    def __init__(self, column: str, op: str, slot: int):
+        self.column = column
+        self.op = op
+        self.slot = slot
+
+
+class SelectStatement:
+    """
+    SELECT columns FROM table [WHERE conditions]
+    """
+
+    def __init__(self, table: str, columns: list[str] | None, conditions: list[Condition]):
+        self.table = table
+        self.columns = columns
+        self.conditions = conditions
+
+    def compile(self, db) -> "SelectPlan":
+        """Binds statement to database schema"""
+        return SelectPlan(self, db)
+
+
+class InsertStatement:
+    """
+    INSERT INTO table VALUES parameters
+    """
+
+    def __init__(self, table: str, slots: list[int]):
+        self.table = table
+        self.slots = slots
+
+    def compile(self, db) -> "InsertPlan":
+        """Binds statement to database schema"""
+        return InsertPlan(self, db)
+
+
+class DeleteStatement:
+    """
+    DELETE FROM table [WHERE conditions]
+    """
+
+    def __init__(self, table: str, conditions: list[Condition]):
+        self.table = table
+        self.conditions = conditions
+
+    def compile(self, db) -> "DeletePlan":
+        """Binds statement to database schema"""
+        return DeletePlan(self, db)
+
+
+class UpdateStatement:
+    """
+    UPDATE table SET column = parameter, ... [WHERE conditions]
+    """
+
+    def __init__(self, table: str, assignments: list[tuple[str, int]], conditions: list[Condition]):
+        self.table = table
+        self.assignments = assignments
+        self.conditions = conditions
+
+    def compile(self, db) -> "UpdatePlan":
+        """Binds statement to database schema"""
+        return UpdatePlan(self, db)
+
+
+class CreateTableStatement:
+    """
+    CREATE TABLE table column type, ... [STORED AS ROWS | COLUMNAR | LSM]
+    """
+
+    def __init__(self, table: str, columns: list[tuple[str, int]], storage_format: str = "rows"):
+        self.table = table
+        self.columns = columns
+        self.storage_format = storage_format
+
+    def compile(self, db) -> "CreateTablePlan":
+        """Binds statement to database schema"""
+        return CreateTablePlan(self)
+
+
+class _Parser:
+    """
+    Recursive descent parser over shaped tokens
+    """
+
+    def __init__(self, tokens: list[tuple[str, Any]]):
+        self.__tokens = tokens
+        self.__pos = 0
+
+    def __peek(self, offset: int = 0):
+        if self.__pos + offset < len(self.__tokens):
+            return self.__tokens[self.__pos + offset]
+        return (None, None)
+
+    def __next(self):
+        token = self.__peek()
+        self.__pos += 1
+        return token
+
+    def __accept(self, kind, value=None) -> bool:
+        curr_kind, curr_value = self.__peek()
+        if curr_kind == kind and (value is None or curr_value == value):
+            self.__pos += 1
+            return True
+        return False
+
+    def __expect_keyword(self, keyword: str, message: str):
+        if not self.__accept(WORD, keyword):
+            raise QueryError(message)
+
+    def __expect_name(self, message: str) -> str:
+        kind, value = self.__next()
+        if kind != WORD:
+            raise QueryError(message)
+        return value
+
+    def __expect_param(self, message: str) -> int:
+        kind, value = self.__next()
+        if kind != PARAM:
+            raise QueryError(message)
+        return value
+
+    def __at_end(self) -> bool:
+        return self.__pos >= len(self.__tokens)
+
+    def parse(self):
+        """
+        Parses whole token list into statement
+        """
+
+        kind, command = self.__next()
+        if kind is None:
+            raise QueryError("Empty query")
+        if kind != WORD:
+            raise QueryError(f"Unsupported command: {command}")
+
+        match command:
+            case "select":
+                statement = self.__parse_select()
+            case "insert":
+                statement = self.__parse_insert()
+            case "delete":
+                statement = self.__parse_delete()
+            case "update":
+                statement = self.__parse_update()
+            case "create":
+                statement = self.__parse_create()
+            case _:
+                raise QueryError(f"Unsupported command: {command}")
+
+        if not self.__at_end():
+            raise QueryError(f"Unexpected token: {self.__peek()[1]}")
+
+        return statement
+
+    def __parse_select(self) -> SelectStatement:
+        columns = None
+        if not self.__accept(PUNCT, "*"):
+            columns = []
+            while self.__peek() != (WORD, "from"):
+                if self.__at_end():
+                    raise QueryError("SELECT query must contain FROM keyword")
+                if not self.__accept(PUNCT, ","):
+                    columns.append(self.__expect_name("Invalid column list in SELECT query"))
+            validate_column_names(columns)
+
+        self.__expect_keyword("from", "SELECT query must contain FROM keyword")
+        if self.__at_end():
+            raise QueryError("Table name missing after FROM")
+        table_name = validate_table_name(self.__expect_name("Table name missing after FROM"))
+
+        return SelectStatement(table_name, columns, self.__parse_where())
+
+    def __parse_insert(self) -> InsertStatement:
+        self.__expect_keyword("into", "INSERT query must have 'INTO' keyword")
+        table_name = validate_table_name(self.__expect_name("Invalid table name"))
+        self.__expect_keyword("values", "INSERT query must have 'VALUES' keyword")
+
+        slots = []
+        while not self.__at_end():
+            if self.__accept(PUNCT, ",") or self.__accept(PUNCT, "(") or self.__accept(PUNCT, ")"):
+                continue
+            slots.append(self.__expect_param("Invalid value in INSERT query"))
+
+        return InsertStatement(table_name, validate_values(slots))
+
+    def __parse_delete(self) -> DeleteStatement:
+        self.__expect_keyword("from", "DELETE query must have 'FROM' keyword")
+        table_name = validate_table_name(self.__expect_name("Table name missing after FROM"))
+
+        return DeleteStatement(table_name, self.__parse_where())
+
+    def __parse_update(self) -> UpdateStatement:
+        table_name = validate_table_name(self.__expect_name("Table name missing after UPDATE"))
+        self.__expect_keyword("set", "UPDATE query must have 'SET' keyword")
+
+        assignments = []
+        while True:
+            column = validate_column_names([self.__expect_name("Invalid column in SET clause")])[0]
+            if not self.__accept(OP, "="):
+                raise QueryError("SET clause must have form column = value")
+            assignments.append((column, self.__expect_param("Missing value in SET clause")))
+            if not self.__accept(PUNCT, ","):
+                break
+
+        return UpdateStatement(table_name, assignments, self.__parse_where())
+
+    def __parse_create(self) -> CreateTableStatement:
+        self.__expect_keyword("table", "CREATE query must have 'TABLE' keyword")
+        table_name = validate_table_name(self.__expect_name("Invalid table name"))
+
+        columns = []
+        storage_format = "rows"
+        while not self.__at_end():
+            if self.__accept(PUNCT, ",") or self.__accept(PUNCT, "(") or self.__accept(PUNCT, ")"):
+                continue
+            if self.__peek() == (WORD, "stored") and self.__peek(1) == (WORD, "as"):
+                self.__pos += 2
+                kind, storage_format = self.__next()
+                if kind != WORD or storage_format not in STORAGE_FORMATS:
+                    raise QueryError("STORED AS must be followed by ROWS, COLUMNAR or LSM")
+                break
+            col_name = validate_column_names(
+                [self.__expect_name("CREATE TABLE query must have a valid column definition")]
+            )[0]
+            kind, col_type = self.__next()
+            if kind != WORD:
+                raise QueryError("CREATE TABLE query must have a valid column definition")
+            if col_type not in COLUMN_TYPES:
+                raise QueryError(f"Unsupported column type: {col_type.upper()}")
+            columns.append((col_name, COLUMN_TYPES[col_type]))
+
+        if not columns:
+            raise QueryError("CREATE TABLE query must have a valid column definition")
+
+        return CreateTableStatement(table_name, columns, storage_format)
+
+    def __parse_where(self) -> list[Condition]:
+        if self.__at_end():
+            return []
+
+        self.__expect_keyword("where", f"Unexpected token: {self.__peek()[1]}")
+        conditions = []
+        while True:
+            column = self.__expect_name("Invalid column in WHERE clause")
+            kind, op = self.__next()
+            if kind != OP:
+                raise QueryError("WHERE clause must have form column <op> value")
+            conditions.append(Condition(column, op, self.__expect_param("Missing value in WHERE clause")))
+            if not self.__accept(WORD, "and"):
+                break
+
+        return conditions
+
+
+def parse_statement(shaped: list[tuple[str, Any]]):
+    """
+    Parses shaped tokens (see shape_tokens) into statement AST
+    """
+
+    return _Parser(shaped).parse()
+
+
+def _converter(column_type: int):
+    match column_type:
+        case ColumnType.INT | ColumnType.LONG:
+            return int
+        case _:
+            return str
+
+
+class _TablePlan:
+    """
+    Base of plans bound to one table schema
+    """
+
+    def __init__(self, table_name: str, db):
+        self.table_name = table_name
+        self._columns = db.get_table_columns_names(table_name)
+        table = db.get_table(table_name)
+        self._key_col = table.key_col
+        self._converters = [_converter(column_type) for column_type in table.column_types]
+
+    def is_valid_for(self, db) -> bool:
+        """
+        Checks that table schema did not change since compilation
+        """
+
+        try:
+            return db.get_table_columns_names(self.table_name) is self._columns
+        except RuntimeError:
+            return False
+
+    def _column_index(self, column: str) -> int:
+        try:
+            return self._columns.index(column)
+        except ValueError:
+            raise QueryError(f"Unknown column {column} in table {self.table_name}") from None
+
+    def _convert(self, col_ind: int, value):
+        try:
+            return self._converters[col_ind](value)
+        except (TypeError, ValueError):
+            raise QueryError(f"Invalid value {value!r} for column {self._columns[col_ind]}") from None
+
+    def _compile_conditions(self, conditions: list[Condition]):
+        self._conditions = [
+            (self._column_index(cond.column), _COMPARISONS[cond.op], cond.slot) for cond in conditions
+        ]
+        self._key_condition = None
+        self._key_bounds = []
+        for i, (col_ind, op, _) in enumerate(self._conditions):
+            if col_ind != self._key_col:
+                continue
+            if op is operator.eq:
+                self._key_condition = i
+                break
+            if op in (operator.lt, operator.le, operator.gt, operator.ge):
+                self._key_bounds.append(i)
+
+    def _bind_conditions(self, slots: list) -> list:
+        return [(col_ind, op, self._convert(col_ind, slots[slot])) for col_ind, op, slot in self._conditions]
+
+    def _matching_rows(self, table, bound: list) -> list:
+        if self._key_condition is not None:
+            rows = list(table.find(bound[self._key_condition][2]))
+        elif self._key_bounds:
+            # Bounds are inclusive here, strict comparisons are rechecked by the filter below
+            low = high = None
+            for i in self._key_bounds:
+                _, op, value = bound[i]
+                if op in (operator.gt, operator.ge):
+                    low = value if low is None else max(low, value)
+                else:
+                    high = value if high is None else min(high, value)
+            if getattr(table, "sharded", False):
+                # Shards filter their rows in parallel
+                return table.scan(low, high, bound)
+            rows = table.find_range(low, high)
+        elif getattr(table, "sharded", False):
+            return table.scan(conditions=bound)
+        else:
+            batch = table.scan_batch() if bound else None
+            if batch is not None:
+                try:
+                    return batch.filter(bound)
+                except (OverflowError, TypeError, ValueError):
+                    # Values not representable in column arrays, filter row by row below
+                    pass
+            rows = table.inorder()
+
+        if not bound:
+            return rows
+
+        return [
+            row for row in rows
+            if all(op(row.columns[col_ind], value) for col_ind, op, value in bound)
+        ]
+
+
+class SelectPlan(_TablePlan):
+    """
+    Compiled SELECT
+    """
+
+    def __init__(self, statement: SelectStatement, db):
+        super().__init__(statement.table, db)
+        if statement.columns is None:
+            self.__indexes = list(range(len(self._columns)))
+        else:
+            self.__indexes = [self._column_index(col) for col in statement.columns]
+        self._compile_conditions(statement.conditions)
+
+    def execute(self, db, slots: list):
+        """Runs plan with given parameter slots"""
+
+        table = db.get_table(self.table_name)
+        if not self._conditions:
+            return table.select_columns(self.__indexes)
+
+        rows = self._matching_rows(table, self._bind_conditions(slots))
+        indexes = self.__indexes
+        return [[row.columns[i] for i in indexes] for row in rows]
+
+
+class InsertPlan(_TablePlan):
+    """
+    Compiled INSERT
+    """
+
+    def __init__(self, statement: InsertStatement, db):
+        super().__init__(statement.table, db)
+        if len(statement.slots) != len(self._columns):
+            raise QueryError(
+                f"Table {self.table_name} has {len(self._columns)} columns, "
+                f"but {len(statement.slots)} values were given"
+            )
+        self.__slots = statement.slots
+
+    def values(self, slots: list) -> list:
+        """Converts parameter slots into row values"""
+        return [self._convert(i, slots[slot]) for i, slot in enumerate(self.__slots)]
+
+    def execute(self, db, slots: list):
+        """Runs plan with given parameter slots"""
+
+        values = self.values(slots)
+        try:
+            db.insert(self.table_name, values)
+        except Exception as e:
+            raise QueryError(f"Failed to insert data: {str(e)}")
+        return f"Successfully inserted data into {self.table_name}"
+
+
+class DeletePlan(_TablePlan):
+    """
+    Compiled DELETE
+    """
+
+    def __init__(self, statement: DeleteStatement, db):
+        super().__init__(statement.table, db)
+        self._compile_conditions(statement.conditions)
+
+    def execute(self, db, slots: list):
+        """Runs plan with given parameter slots"""
+
+        table = db.get_table(self.table_name)
+        bound = self._bind_conditions(slots)
+        deleted = 0
+
+        if self._key_condition is not None and len(bound) == 1:
+            key = bound[0][2]
+            deleted = len(table.find(key))
+            if deleted:
+                db.erase(self.table_name, key)
+            return f"Deleted {deleted} rows from {self.table_name}"
+
+        for key in _distinct_keys(self._matching_rows(table, bound), self._key_col):
+            bucket = table.find(key)
+            survivors = [row for row in bucket if not _row_matches(row, bound)]
+            deleted += len(bucket) - len(survivors)
+            if survivors:
+                db.update(self.table_name, key, [row.columns for row in survivors])
+            else:
+                db.erase(self.table_name, key)
+
+        return f"Deleted {deleted} rows from {self.table_name}"
+
+
+class UpdatePlan(_TablePlan):
+    """
+    Compiled UPDATE
+    """
+
+    def __init__(self, statement: UpdateStatement, db):
+        super().__init__(statement.table, db)
+        self.__assignments = [(self._column_index(col), slot) for col, slot in statement.assignments]
+        self._compile_conditions(statement.conditions)
+
+    def execute(self, db, slots: list):
+        """Runs plan with given parameter slots"""
+
+        table = db.get_table(self.table_name)
+        bound = self._bind_conditions(slots)
+        assignments = [(col_ind, self._convert(col_ind, slots[slot])) for col_ind, slot in self.__assignments]
+        updated = 0
+
+        # New rows are computed before anything is written, so that rows moved to a key
+        # not reached yet are not matched again (Halloween problem)
+        buckets = []
+        moved = []
+        for key in _distinct_keys(self._matching_rows(table, bound), self._key_col):
+            kept = []
+            for row in table.find(key):
+                columns = list(row.columns)
+                if _row_matches(row, bound):
+                    for col_ind, value in assignments:
+                        columns[col_ind] = value
+                    updated += 1
+                (kept if columns[self._key_col] == key else moved).append(columns)
+            buckets.append((key, kept))
+
+        # Moved rows go in after all buckets are replaced, otherwise replacing their new key would erase them
+        for key, kept in buckets:
+            db.update(self.table_name, key, kept)
+        if moved:
+            db.insert_many(self.table_name, moved)
+
+        return f"Updated {updated} rows in {self.table_name}"
+
+
+class CreateTablePlan:
+    """
+    Compiled CREATE TABLE
+    """
+
+    def __init__(self, statement: CreateTableStatement):
+        self.__statement = statement
+
+    def is_valid_for(self, db) -> bool:
+        """CREATE TABLE does not depend on schema"""
+        return True
+
+    def execute(self, db, slots: list):
+        """Runs plan"""
+
+        db.create_table(self.__statement.table, self.__statement.columns, 0, self.__statement.storage_format)
+        return f"Table {self.__statement.table} created successfully"
+
+
+def _distinct_keys(rows: list, key_col: int) -> list:
+    return list(dict.fromkeys(row.columns[key_col] for row in rows))
+
+
+def _row_matches(row, bound: list) -> bool:
+    # Rows are matched by values, not identity: mapped, columnar, LSM and sharded tables
+    # decode new row objects on every read
+    return all(op(row.columns[col_ind], value) for col_ind, op, value in bound)
+
+
+class CachedQuery:
+    """
+    Parsed statement and its last compiled plan
+    """
+
+    def __init__(self, statement, plan=None):
+        self.statement = statement
+        self.plan = plan
+
+    def plan_for(self, db):
+        """
+        Gets plan compiled against db, recompiling if schema changed
+        """
+
+        if self.plan is None or not self.plan.is_valid_for(db):
+            self.plan = self.statement.compile(db)
+        return self.plan
+
+
+class PlanCache:
+    """
+    LRU cache of parsed and compiled queries keyed by normalized query shape
+    """
+
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+
+    def get(self, key: str, shaped: list[tuple[str, Any]]) -> CachedQuery:
+        """
+        Gets cached query for shape key, parsing shaped tokens on miss
+        """
+
+        entry = self.__entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.__entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        entry = CachedQuery(parse_statement(shaped))
+        self.__entries[key] = entry
+        if len(self.__entries) > self.capacity:
+            self.__entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        """Drops all cached plans"""
+        self.__entries.clear()
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+PLAN_CACHE = PlanCache()
+
+
+class ResultCache:
+    """
+    LRU cache of SELECT results keyed by query shape and parameter values, bounded by
+    estimated size of cached results in bytes. Entry is used only while versions of
+    tables it was read from are unchanged.
+    Cached results are shared by all callers, so they must not be modified
+    """
+
+    def __init__(self, capacity_bytes: int = 64 << 20):
+        self.capacity_bytes = capacity_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.__entries = OrderedDict()
+
+    def get(self, key: tuple, versions: tuple, run) -> Any:
+        """
+        Gets cached result of query, calling run() on miss
+
+        Args:
+            key: Query shape and parameter values
+            versions: Versions of tables query reads
+            run: Function computing the result
+        """
+
+        try:
+            entry = self.__entries.get(key)
+        except TypeError:
+            # Parameter value can not be hashed, such query is not cached
+            return run()
+
+        if entry is not None:
+            if entry[0] == versions:
+                self.hits += 1
+                self.__entries.move_to_end(key)
+                return entry[1]
+            self.invalidations += 1
+            self.__remove(key)
+
+        self.misses += 1
+        result = run()
+        size = _result_size(result)
+        if size <= self.capacity_bytes:
+            self.__entries[key] = (versions, result, size)
+            self.size_bytes += size
+            while self.size_bytes > self.capacity_bytes:
+                self.__remove(next(iter(self.__entries)))
+                self.evictions += 1
+        return result
+
+    def clear(self):
+        """Drops all cached results"""
+        self.__entries.clear()
+        self.size_bytes = 0
+
+    def __remove(self, key: tuple):
+        self.size_bytes -= self.__entries.pop(key)[2]
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+def _result_size(result) -> int:
+    if not isinstance(result, list):
+        return sys.getsizeof(result)
+    # Row values are often shared with the tree, so this is an upper bound
+    return sys.getsizeof(result) + sum(
+        sys.getsizeof(row) + sum(map(sys.getsizeof, row)) for row in result
+    )
+
+
+class PreparedStatement:
+    """
+    Statement registered with PREPARE
+    """
+
+    def __init__(self, key: str, shaped: list, slots: list, placeholders: list[int]):
+        self.key = key
+        self.shaped = shaped
+        self.slots = slots
+        self.placeholders = placeholders
+
+
+class QuerySession:
+    """
+    Executes queries against database, keeps prepared statements
+    """
+
+    def __init__(self, db, plan_cache: PlanCache | None = None, result_cache: ResultCache | None = None):
+        """
+        Args:
+            db: Database queries run against
+            plan_cache: Cache of compiled plans, shared PLAN_CACHE if None
+            result_cache: Cache of SELECT results, results are not cached if None
+        """
+
+        self.db = db
+        self.plan_cache = plan_cache if plan_cache is not None else PLAN_CACHE
+        self.result_cache = result_cache
+        self.__prepared = {}
+
+    def execute(self, query: str | list[str], params: list | tuple = ()) -> Any | None:
+        """
+        Parses and executes query.
+
+        Args:
+            query: Query text or list of query tokens (e.g. from command line)
+            params: Values for "?" placeholders, in order
+
+        Returns:
+            Query results for SELECT queries, status message for other operations
+
+        Raises:
+            QueryError: If the query syntax is invalid or execution fails
+        """
+        if not isinstance(query, str):
+            query = " ".join(query)
+
+        tokens = tokenize(query)
+        if not tokens:
+            raise QueryError("Empty query")
+
+        try:
+            kind, command = tokens[0]
+            if kind == WORD:
+                match command.lower():
+                    case "prepare":
+                        return self.__prepare(tokens[1:])
+                    case "execute":
+                        return self.__execute_prepared(tokens[1:])
+                    case "deallocate":
+                        return self.__deallocate(tokens[1:])
+
+            key, slots, placeholders, shaped = shape_tokens(tokens)
+            _bind_placeholders(slots, placeholders, params)
+            return self.__run(key, shaped, slots)
+        except Exception as e:
+            # Convert any database errors to QueryError for consistent handling
+            if not isinstance(e, QueryError):
+                raise QueryError(f"Database error: {str(e)}")
+            raise
+
+    def compile_insert(self, query: str) -> tuple[str, str, list] | None:
+        """
+        Compiles INSERT query without running it, so that caller can insert rows of
+        many queries at once (see Database.insert_many)
+
+        Returns:
+            (query shape, table name, row values), or None if query is not INSERT without placeholders
+
+        Raises:
+            QueryError: If the query is invalid
+        """
+        tokens = tokenize(query)
+        if not tokens or tokens[0][0] != WORD or tokens[0][1].lower() != "insert":
+            return None
+
+        try:
+            key, slots, placeholders, shaped = shape_tokens(tokens)
+            if placeholders:
+                return None
+            plan = self.plan_cache.get(key, shaped).plan_for(self.db)
+            return key, plan.table_name, plan.values(slots)
+        except Exception as e:
+            if not isinstance(e, QueryError):
+                raise QueryError(f"Database error: {str(e)}")
+            raise
+
+    def prepare(self, name: str, query: str):
+        """
+        Registers prepared statement, same as PREPARE name AS query
+        """
+
+        return self.__prepare([(WORD, name), (WORD, "as")] + tokenize(query))
+
+    def __run(self, key: str, shaped: list, slots: list):
+        entry = self.plan_cache.get(key, shaped)
+        plan = entry.plan_for(self.db)
+        if self.result_cache is None or not isinstance(plan, SelectPlan):
+            return plan.execute(self.db, slots)
+
+        versions = (self.db.get_table(plan.table_name).version,)
+        return self.result_cache.get((key, tuple(slots)), versions, lambda: plan.execute(self.db, slots))
+
+    def __prepare(self, tokens: list):
+        if len(tokens) < 3 or tokens[0][0] != WORD:
+            raise QueryError("PREPARE query must have form PREPARE name AS query")
+
+        name = tokens[0][1].lower()
+        body = tokens[1:]
+        if body[0][0] == WORD and body[0][1].lower() in ("as", "from"):
+            body = body[1:]
+
+        key, slots, placeholders, shaped = shape_tokens(body)
+        # Parse right away so syntax errors are reported by PREPARE itself
+        self.plan_cache.get(key, shaped)
+        self.__prepared[name] = PreparedStatement(key, shaped, slots, placeholders)
+        return f"Statement {name} prepared"
+
+    def __execute_prepared(self, tokens: list):
+        if not tokens or tokens[0][0] != WORD:
+            raise QueryError("EXECUTE query must have form EXECUTE name [params]")
+
+        name = tokens[0][1].lower()
+        prepared = self.__prepared.get(name)
+        if prepared is None:
+            raise QueryError(f"Prepared statement {name} does not exist")
+
+        slots = list(prepared.slots)
+        _bind_placeholders(slots, prepared.placeholders, _execute_params(tokens[1:]))
+        return self.__run(prepared.key, prepared.shaped, slots)
+
+    def __deallocate(self, tokens: list):
+        if tokens and tokens[0] == (WORD, "prepare"):
+            tokens = tokens[1:]
+        if len(tokens) != 1 or tokens[0][0] != WORD:
+            raise QueryError("DEALLOCATE query must have form DEALLOCATE name")
+
+        name = tokens[0][1].lower()
+        if self.__prepared.pop(name, None) is None:
+            raise QueryError(f"Prepared statement {name} does not exist")
+        return f"Statement {name} deallocated"
+
+
+def _execute_params(tokens: list) -> list:
+    if tokens and tokens[0][0] == WORD and tokens[0][1].lower() == "using":
+        tokens = tokens[1:]
+    return [value for kind, value in tokens if kind not in (PUNCT, OP)]
+
+
+def _bind_placeholders(slots: list, placeholders: list[int], params) -> None:
+    if len(params) != len(placeholders):
+        raise QueryError(f"Query expects {len(placeholders)} parameters, but {len(params)} were given")
+    for slot, value in zip(placeholders, params):
+        slots[slot] = value
+
+
+_sessions = weakref.WeakKeyDictionary()
+
+
+def session_for(db) -> QuerySession:
+    """
+    Gets default query session of database (keeps its prepared statements and cached results)
+    """
+
+    session = _sessions.get(db)
+    if session is None:
+        session = _sessions[db] = QuerySession(db, result_cache=ResultCache())
+    return session
@@ -0,0 +1,295 @@
+"""
+asyncio TCP server keeping database loaded and executing SQL-like queries, and its client
+
+Every message is a frame: 4-byte big-endian payload length, then UTF-8 JSON payload.
+Request is {"query": text, "params": [values for "?" placeholders]}. Response to it is
+zero or more {"rows": [...]} frames with the next part of SELECT result, then final frame:
+{"done": true, "result": status message or null, "rows": rows count} or {"error": message}.
+
+Client may send many requests without waiting for responses (pipelining); requests of one
+connection are executed in order and answered in order. Queries run in a bounded thread pool,
+one at a time, as trees are not thread-safe; event loop keeps reading and writing other
+connections meanwhile.
+"""
+
+import asyncio
+import json
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from query import QueryError, QuerySession, ResultCache
+
+_frame_header = struct.Struct(">I")
+MAX_FRAME_SIZE = 64 << 20
+
+
+async def read_frame(reader: asyncio.StreamReader):
+    """
+    Reads one frame and decodes its JSON payload
+
+    Returns:
+        Decoded payload, or None if connection was closed between frames
+
+    Raises:
+        ValueError: If frame is too large or its payload is not valid JSON
+    """
+
+    try:
+        header = await reader.readexactly(_frame_header.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ConnectionError("Connection closed in the middle of frame") from e
+        return None
+
+    (size,) = _frame_header.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {size} bytes is too large")
+    return json.loads(await reader.readexactly(size))
+
+
+def encode_frame(payload) -> bytes:
+    """
+    Encodes payload into frame
+    """
+
+    content = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    return _frame_header.pack(len(content)) + content
+
+
+class QueryServer:
+    """
+    Serves queries against one database to many concurrent connections
+    """
+
+    def __init__(self, db, workers: int = 1, pipeline_depth: int = 128, chunk_rows: int = 1000,
+                 result_cache: ResultCache | None = None):
+        """
+        Args:
+            db: Database, it is not saved by server
+            workers: Threads executing queries (they take turns on database lock,
+                extra threads let one connection start while another one's result is encoded)
+            pipeline_depth: Requests of one connection read ahead before reading pauses
+            chunk_rows: Rows of SELECT result sent in one frame
+            result_cache: Cache of SELECT results shared by all connections, new one if None
+        """
+
+        self.db = db
+        self.chunk_rows = chunk_rows
+        self.result_cache = result_cache if result_cache is not None else ResultCache()
+        self.connections = 0
+        self.requests = 0
+        self.__pipeline_depth = pipeline_depth
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        self.__db_lock = threading.Lock()
+        self.__server = None
+        self.__handlers = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """
+        Starts listening, port 0 picks free port
+
+        Returns:
+            Port server listens on
+        """
+
+        self.__server = await asyncio.start_server(self.__handle, host, port)
+        return self.__server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        """
+        Serves connections until task is cancelled
+        """
+
+        await self.__server.serve_forever()
+
+    async def close(self) -> None:
+        """
+        Stops accepting connections, waits for current ones to finish their requests
+        and stops executor
+        """
+
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+        for handler in list(self.__handlers):
+            handler.cancel()
+        await asyncio.gather(*self.__handlers, return_exceptions=True)
+        self.__executor.shutdown(wait=True)
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.__handlers.add(asyncio.current_task())
+        self.connections += 1
+        session = QuerySession(self.db, result_cache=self.result_cache)
+        requests = asyncio.Queue(maxsize=self.__pipeline_depth)
+        responder = asyncio.create_task(self.__respond(session, requests, writer))
+        handler = asyncio.current_task()
+
+        def stop_reading(task: asyncio.Task) -> None:
+            # Reading must not wait for room in queue that nobody empties anymore
+            if not task.cancelled() and task.exception() is not None:
+                handler.cancel()
+
+        responder.add_done_callback(stop_reading)
+        try:
+            while True:
+                try:
+                    request = await read_frame(reader)
+                except ValueError as e:
+                    # Stream position is lost after bad frame, so connection ends after its error
+                    request = e
+                await requests.put(request)
+                if request is None or isinstance(request, ValueError):
+                    break
+            await responder
+        except (ConnectionError, asyncio.CancelledError):
+            responder.cancel()
+        finally:
+            self.connections -= 1
+            writer.close()
+            self.__handlers.discard(asyncio.current_task())
+
+    async def __respond(self, session: QuerySession, requests: asyncio.Queue,
+                        writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        while (request := await requests.get()) is not None:
+            if isinstance(request, ValueError):
+                writer.write(encode_frame({"error": f"Bad request: {request}"}))
+                await writer.drain()
+                break
+            if not isinstance(request, dict) or not isinstance(request.get("query"), str):
+                writer.write(encode_frame({"error": "Request must have form {\"query\": text, \"params\": [...]}"}))
+                await writer.drain()
+                continue
+
+            self.requests += 1
+            try:
+                result = await loop.run_in_executor(
+                    self.__executor, self.__execute, session, request["query"], request.get("params") or ()
+                )
+            except QueryError as e:
+                writer.write(encode_frame({"error": str(e)}))
+                await writer.drain()
+                continue
+
+            if not isinstance(result, list):
+                writer.write(encode_frame({"done": True, "result": result, "rows": 0}))
+                await writer.drain()
+                continue
+
+            # Large results go out in parts, drain pauses us while client is slow to read
+            for start in range(0, len(result), self.chunk_rows):
+                writer.write(encode_frame({"rows": result[start:start + self.chunk_rows]}))
+                await writer.drain()
+            writer.write(encode_frame({"done": True, "result": None, "rows": len(result)}))
+            await writer.drain()
+
+    def __execute(self, session: QuerySession, query: str, params):
+        with self.__db_lock:
+            return session.execute(query, params)
+
+
+class QueryClient:
+    """
+    Client of QueryServer. Requests may be pipelined: start several execute() calls
+    (e.g. with asyncio.gather) and they are sent without waiting for each other
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.__reader = reader
+        self.__writer = writer
+        self.__pending = deque()
+        self.__receiver = asyncio.create_task(self.__receive())
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 0) -> "QueryClient":
+        """
+        Connects to server
+        """
+
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def execute(self, query: str, params: list | tuple = ()):
+        """
+        Executes query on server
+
+        Returns:
+            Rows of SELECT result or status message of other queries
+
+        Raises:
+            QueryError: If server reports error
+        """
+
+        rows = []
+        async for part in self.stream(query, params):
+            if isinstance(part, list):
+                rows.extend(part)
+            else:
+                return part
+        return rows
+
+    async def stream(self, query: str, params: list | tuple = ()):
+        """
+        Executes query on server, yielding parts of SELECT result as they arrive
+        (lists of rows) or status message of other queries
+        """
+
+        frames = asyncio.Queue()
+        self.__pending.append(frames)
+        self.__writer.write(encode_frame({"query": query, "params": list(params)}))
+        await self.__writer.drain()
+
+        while True:
+            frame = await frames.get()
+            if isinstance(frame, Exception):
+                raise frame
+            if "error" in frame:
+                raise QueryError(frame["error"])
+            if "rows" in frame and not frame.get("done"):
+                yield frame["rows"]
+                continue
+            if frame["result"] is not None:
+                yield frame["result"]
+            return
+
+    async def close(self) -> None:
+        """
+        Closes connection
+        """
+
+        self.__writer.close()
+        await self.__writer.wait_closed()
+        self.__receiver.cancel()
+        await asyncio.gather(self.__receiver, return_exceptions=True)
+
+    async def __receive(self) -> None:
+        # Server answers in request order, so frames belong to the oldest pending request
+        error = ConnectionError("Connection closed by server")
+        try:
+            while (frame := await read_frame(self.__reader)) is not None:
+                if not self.__pending:
+                    raise ConnectionError("Unexpected frame from server")
+                self.__pending[0].put_nowait(frame)
+                if frame.get("done") or "error" in frame:
+                    self.__pending.popleft()
+        except (ConnectionError, ValueError) as e:
+            error = e
+        finally:
+            while self.__pending:
+                self.__pending.popleft().put_nowait(error)
+
+
+async def serve(db, host: str = "127.0.0.1", port: int = 5433, **kwargs) -> None:
+    """
+    Runs server until cancelled (e.g. by Ctrl+C in asyncio.run)
+    """
+
+    server = QueryServer(db, **kwargs)
+    port = await server.start(host, port)
+    print(f"Serving queries on {host}:{port}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
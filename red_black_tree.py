@@ -2,6 +2,7 @@
 Implementation of Red-Black tree
 https://youtu.be/w5cvkTXY0vQ?si=OQWCfaSMtiO05mOA
 """
+from collections.abc import Iterator
 from enum import Enum
 
 from data_entry import DataEntry
@@ -197,6 +198,24 @@ class RedBlackTree(AbstractTree):
 
         return None
 
+    def bulk_build(self, data_entries) -> None:
+        if self.__root is not None:
+            super().bulk_build(data_entries)
+            return
+
+        buckets = self._sorted_buckets(data_entries)
+        # Leaves of the balanced build are on the last two levels:
+        # painting the deepest level red keeps black height equal on all paths
+        max_depth = len(buckets).bit_length() - 1
+
+        def make_node(bucket, depth):
+            color = RedBlackNode.COLORS["RED"].value if 0 < depth == max_depth else RedBlackNode.COLORS["BLACK"].value
+            node = RedBlackNode(bucket[0], color)
+            node.data = bucket
+            return node
+
+        self.__root = self._build_binary(buckets, make_node)
+
     def __transplant(self, u: RedBlackNode, v: RedBlackNode):
         if u.parent is None:
             self.__root = v
@@ -311,7 +330,8 @@ class RedBlackTree(AbstractTree):
 
         return inner(self.__root)
 
-
+    def iter_inorder(self) -> Iterator[DataEntry]:
+        return self._iter_binary_inorder(self.__root)
 
     def preorder(self) -> list[DataEntry]:
         def inner(node: RedBlackNode) -> list[RedBlackNode]:
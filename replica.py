@@ -0,0 +1,321 @@
+"""
+Read replicas of database: processes forked after database is loaded, which share its trees
+copy-on-write and serve SELECT queries in parallel (see ReplicaSet)
+
+Database of this process stays the only writer. Its changes are shipped to every replica as
+ordered change stream of numbered records (see Database.apply_change), replicas apply them
+in order and acknowledge the number of the last applied one, so lag of every replica is known.
+Queries and changes for a replica go through one queue, so a replica answers SELECT only
+after applying every change made before it was submitted.
+"""
+
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from database_table import DatabaseTable
+from query import WORD, QueryError, QuerySession, ResultCache, tokenize
+
+# Consecutive changes sent to replica in one message at most
+_max_batch = 1000
+
+
+def is_read_only(query: str) -> bool:
+    """
+    Checks whether query is SELECT, which replicas can serve
+    """
+
+    tokens = tokenize(query)
+    return bool(tokens) and tokens[0][0] == WORD and tokens[0][1].lower() == "select"
+
+
+def _serve_replica(db, connection) -> None:
+    """
+    Main function of replica process: applies changes and runs queries from connection in order.
+    Replica never writes files, process exits without running finalizers of database
+    """
+
+    session = QuerySession(db, result_cache=ResultCache())
+    applied = 0
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+
+        match message:
+            case ("changes", changes):
+                for applied, record in changes:
+                    if record[0] == "create" and record[4] == DatabaseTable.LSM_FORMAT:
+                        # Rows of LSM table would be flushed into run files, replica keeps them in memory
+                        record = (*record[:4], DatabaseTable.ROWS_FORMAT)
+                    db.apply_change(record)
+                connection.send(("applied", applied))
+            case ("query", request_id, query, params):
+                try:
+                    if not is_read_only(query):
+                        raise QueryError("Replica serves only SELECT queries")
+                    connection.send(("result", request_id, session.execute(query, params), None))
+                except QueryError as e:
+                    connection.send(("result", request_id, None, str(e)))
+            case ("close",):
+                return
+
+
+class _Replica:
+    """
+    Replica process with threads sending its queue and receiving its responses
+    """
+
+    def __init__(self, process, connection, on_applied):
+        self.process = process
+        self.connection = connection
+        self.outgoing = queue.Queue()
+        self.applied = 0
+        self.alive = True
+        self.__pending = {}
+        self.__lock = threading.Lock()
+        self.__on_applied = on_applied
+        self.__sender = threading.Thread(target=self.__send_loop, daemon=True)
+        self.__receiver = threading.Thread(target=self.__receive_loop, daemon=True)
+
+    def start(self) -> None:
+        self.__sender.start()
+        self.__receiver.start()
+
+    def join(self) -> None:
+        self.__sender.join()
+        self.__receiver.join()
+
+    @property
+    def pending(self) -> int:
+        """
+        Gets number of queries waiting for result
+        """
+
+        return len(self.__pending)
+
+    def submit(self, request_id: int, query: str, params) -> Future:
+        future = Future()
+        with self.__lock:
+            if not self.alive:
+                raise RuntimeError("Replica process stopped")
+            self.__pending[request_id] = future
+        self.outgoing.put(("query", request_id, query, list(params)))
+        return future
+
+    def __send_loop(self) -> None:
+        try:
+            while True:
+                # Changes queued meanwhile go in one message, messages keep their order
+                messages = [self.outgoing.get()]
+                while len(messages) < _max_batch:
+                    try:
+                        messages.append(self.outgoing.get_nowait())
+                    except queue.Empty:
+                        break
+
+                changes = []
+                for message in messages:
+                    if message is not None and message[0] == "change":
+                        changes.append(message[1:])
+                        continue
+                    if changes:
+                        self.connection.send(("changes", changes))
+                        changes = []
+                    if message is None:
+                        self.connection.send(("close",))
+                        return
+                    self.connection.send(message)
+                if changes:
+                    self.connection.send(("changes", changes))
+        except (BrokenPipeError, OSError):
+            pass
+
+    def __receive_loop(self) -> None:
+        try:
+            while True:
+                message = self.connection.recv()
+                if message[0] == "applied":
+                    self.applied = message[1]
+                    self.__on_applied()
+                    continue
+                _, request_id, result, error = message
+                with self.__lock:
+                    future = self.__pending.pop(request_id)
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(QueryError(error))
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self.__lock:
+                self.alive = False
+                pending, self.__pending = self.__pending, {}
+            for future in pending.values():
+                future.set_exception(RuntimeError("Replica process stopped"))
+            self.__on_applied()
+
+
+class ReplicaSet:
+    """
+    Forks read replicas of loaded database and routes queries: SELECT goes to the replica
+    with fewest queries in flight, other queries run on database of this process (the writer),
+    whose changes replicas then apply in order. May be used from several threads, SELECTs
+    of different threads then run on different replicas in parallel
+    """
+
+    def __init__(self, db, replicas: int = 2):
+        """
+        Loads all tables and forks replicas. Changes made to db directly (not through execute)
+        are replicated too, but they must not run concurrently with execute
+
+        Args:
+            db: Database, its tables must be kept in memory (not paged, LSM or sharded)
+            replicas: Number of replica processes
+
+        Raises:
+            RuntimeError: If processes can not be forked or a table is not kept in memory
+        """
+
+        if not hasattr(os, "fork"):
+            raise RuntimeError("Read replicas need os.fork, they are not available on this platform")
+        if DatabaseTable.is_on_disk(db.tree_type):
+            raise RuntimeError("Replicas can not share tables of on-disk tree type")
+
+        db.preload()
+        for table_name in db.get_tables_names():
+            table = db.get_table(table_name)
+            if getattr(table, "sharded", False) or table.storage_format not in (
+                    DatabaseTable.ROWS_FORMAT, DatabaseTable.COLUMNAR_FORMAT):
+                raise RuntimeError(f"Table \"{table_name}\" is not kept in memory, replicas can not share it")
+
+        self.db = db
+        self.__sequence = 0
+        # Numbers and times of changes not applied by every replica yet
+        self.__published = deque()
+        self.__applied = threading.Condition()
+        self.__write_lock = threading.Lock()
+        self.__writer = QuerySession(db)
+        self.__request_ids = itertools.count()
+
+        # All replicas are forked before any thread of this set starts
+        context = multiprocessing.get_context("fork")
+        self.__replicas = []
+        for _ in range(replicas):
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=_serve_replica, args=(db, child_connection), daemon=True)
+            process.start()
+            child_connection.close()
+            self.__replicas.append(_Replica(process, connection, self.__notify_applied))
+        for replica in self.__replicas:
+            replica.start()
+        db.add_change_listener(self.__publish)
+
+    def close(self) -> None:
+        """
+        Stops replicas after they answer queries already submitted
+        """
+
+        if not self.__replicas:
+            return
+        self.db.remove_change_listener(self.__publish)
+        for replica in self.__replicas:
+            replica.outgoing.put(None)
+        for replica in self.__replicas:
+            replica.process.join()
+            replica.join()
+            replica.connection.close()
+        self.__replicas = []
+
+    def __publish(self, record: tuple) -> None:
+        self.__sequence += 1
+        with self.__applied:
+            self.__published.append((self.__sequence, time.monotonic()))
+        for replica in self.__replicas:
+            replica.outgoing.put(("change", self.__sequence, record))
+
+    def __notify_applied(self) -> None:
+        with self.__applied:
+            applied = min((replica.applied for replica in self.__replicas if replica.alive), default=self.__sequence)
+            while self.__published and self.__published[0][0] <= applied:
+                self.__published.popleft()
+            self.__applied.notify_all()
+
+    def execute(self, query: str, params: list | tuple = ()):
+        """
+        Executes query: SELECT on a replica, other queries on the writer
+
+        Returns:
+            Rows of SELECT result or status message of other queries
+
+        Raises:
+            QueryError: If query is invalid or fails
+        """
+
+        if is_read_only(query):
+            return self.submit(query, params).result()
+        with self.__write_lock:
+            return self.__writer.execute(query, params)
+
+    def submit(self, query: str, params: list | tuple = ()) -> Future:
+        """
+        Sends SELECT to the least busy replica without waiting for its result. Replica runs it
+        after applying every change made before this call
+
+        Returns:
+            Future of rows, its exception is QueryError if query fails
+        """
+
+        replicas = [replica for replica in self.__replicas if replica.alive]
+        if not replicas:
+            raise RuntimeError("No replica is running")
+        replica = min(replicas, key=lambda replica: replica.pending)
+        return replica.submit(next(self.__request_ids), query, params)
+
+    @property
+    def sequence(self) -> int:
+        """
+        Gets number of the last change sent to replicas
+        """
+
+        return self.__sequence
+
+    def lag(self) -> list[dict]:
+        """
+        Gets lag of every replica: number of changes it has not applied yet and age in seconds
+        of the oldest of them (0 for replica that is up to date)
+        """
+
+        now = time.monotonic()
+        result = []
+        with self.__applied:
+            for replica in self.__replicas:
+                oldest = next((published for sequence, published in self.__published
+                               if sequence > replica.applied), None)
+                result.append({
+                    "alive": replica.alive,
+                    "changes": self.__sequence - replica.applied,
+                    "seconds": 0.0 if oldest is None else now - oldest,
+                })
+        return result
+
+    def wait_applied(self, sequence: int | None = None, timeout: float | None = None) -> bool:
+        """
+        Waits until every running replica applied change with given number (the last one if None)
+
+        Returns:
+            False if timeout expired first
+        """
+
+        sequence = self.__sequence if sequence is None else sequence
+        with self.__applied:
+            return self.__applied.wait_for(
+                lambda: all(replica.applied >= sequence for replica in self.__replicas if replica.alive), timeout
+            )
@@ -0,0 +1,258 @@
+"""
+Contains row format table file: header, sorted fixed-width rows, then strings
+(dictionaries and heap) of VAR_STRING and DICT_STRING columns if the table has them
+
+Header is columns count and key column (2 bytes each), one byte per column type and,
+for tables with such columns, 8-byte rows count, all big-endian.
+"""
+
+import mmap
+import os
+
+from data_entry import DataEntry, RowLayout
+
+_columns_count_size = 2
+_enum_column_type_size = 1
+_row_count_size = 8
+_write_chunk_size = 1 << 20
+
+
+def encode_header(key_col: int, column_types: list[int], row_count: int = 0) -> bytes:
+    """
+    Builds table file header: columns count, key column and column types.
+    Tables with VAR_STRING or DICT_STRING columns also store rows count,
+    as string heap and dictionaries follow the rows
+    """
+
+    header = (
+        len(column_types).to_bytes(_columns_count_size, "big")
+        + key_col.to_bytes(_columns_count_size, "big")
+        + bytes(column_types)
+    )
+    if RowLayout(column_types).has_strings:
+        header += row_count.to_bytes(_row_count_size, "big")
+    return header
+
+
+def decode_header(content) -> tuple[int, list[int], int]:
+    """
+    Parses table file header
+
+    Returns:
+        (key column, column types, offset of first row)
+    """
+
+    columns_count = int.from_bytes(content[:_columns_count_size])
+    key_col = int.from_bytes(content[_columns_count_size:_columns_count_size * 2])
+    rows_offset = _columns_count_size * 2 + _enum_column_type_size * columns_count
+    column_types = list(content[_columns_count_size * 2:rows_offset])
+    if RowLayout(column_types).has_strings:
+        rows_offset += _row_count_size
+
+    return key_col, column_types, rows_offset
+
+
+def read_header(filename: str) -> tuple[int, list[int], int, int, int]:
+    """
+    Reads header of row format table file
+
+    Returns:
+        (key column, column types, offset of first row, rows count,
+        offset of strings (dictionaries and heap) written after rows)
+    """
+
+    with open(filename, "rb") as file:
+        header = file.read(_columns_count_size * 2)
+        columns_count = int.from_bytes(header[:_columns_count_size])
+        header += file.read(columns_count * _enum_column_type_size + _row_count_size)
+
+    key_col, column_types, rows_offset = decode_header(header)
+    layout = RowLayout(column_types)
+    row_size = layout.row_size
+    if layout.has_strings:
+        row_count = int.from_bytes(header[rows_offset - _row_count_size:rows_offset])
+    else:
+        row_count = (os.path.getsize(filename) - rows_offset) // row_size
+
+    return key_col, column_types, rows_offset, row_count, rows_offset + row_count * row_size
+
+
+def iter_rows(content, layout: RowLayout, rows_offset: int):
+    """
+    Decodes rows of whole row format table file content, strings included
+    """
+
+    if not layout.has_strings:
+        return layout.iter_decode(memoryview(content)[rows_offset:])
+
+    row_count = int.from_bytes(content[rows_offset - _row_count_size:rows_offset])
+    strings_offset = rows_offset + row_count * layout.row_size
+    heap, dictionaries = layout.decode_strings(memoryview(content)[strings_offset:])
+    return layout.iter_decode(memoryview(content)[rows_offset:strings_offset], heap, dictionaries)
+
+
+def write_rows(filename: str, key_col: int, column_types: list[int], data_entries) -> int:
+    """
+    Writes rows sorted by key into row format file.
+    Rows are encoded into a reusable fixed-size chunk buffer and streamed into a temporary
+    file, which atomically replaces the target file once it is complete
+
+    Returns:
+        Number of written rows
+    """
+
+    layout = RowLayout(column_types)
+    row_size = layout.row_size
+    chunk = bytearray(max(1, _write_chunk_size // row_size) * row_size)
+    chunk_view = memoryview(chunk)
+    heap, dictionaries = layout.new_strings()
+    tmp_filename = f"{filename}.tmp"
+
+    try:
+        with open(tmp_filename, "wb") as file:
+            file.write(encode_header(key_col, column_types))
+
+            offset = 0
+            row_count = 0
+            for data_entry in data_entries:
+                layout.encode_into(chunk, offset, data_entry.columns, heap, dictionaries)
+                offset += row_size
+                row_count += 1
+                if offset == len(chunk):
+                    file.write(chunk_view)
+                    offset = 0
+            file.write(chunk_view[:offset])
+
+            if layout.has_strings:
+                # Rows count is known only now, header is patched after the strings are written
+                file.write(layout.encode_strings(heap, dictionaries))
+                file.seek(0)
+                file.write(encode_header(key_col, column_types, row_count))
+
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+    return row_count
+
+
+class MappedRows:
+    """
+    Sorted fixed-width rows of table file, read through mmap.
+    Rows are decoded only when touched, lookups are binary searches over the file
+    """
+
+    def __init__(self, filename: str, layout: RowLayout, key_col: int, rows_offset: int, row_count: int):
+        self.__layout = layout
+        self.__rows_offset = rows_offset
+        self.__row_size = layout.row_size
+        self.__key_offset = rows_offset + layout.column_offset(key_col)
+        self.__key_layout = RowLayout([layout.column_types[key_col]])
+        self.__count = row_count
+
+        with open(filename, "rb") as file:
+            self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__heap, self.__dictionaries = None, None
+        self.__key_dictionaries = None
+        if layout.has_strings:
+            self.__heap, self.__dictionaries = layout.decode_strings(
+                memoryview(self.__map)[rows_offset + row_count * self.__row_size:]
+            )
+        if key_col in layout.dictionary_columns:
+            self.__key_dictionaries = [self.__dictionaries[layout.dictionary_columns.index(key_col)]]
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __iter__(self):
+        end = self.__rows_offset + self.__count * self.__row_size
+        rows = memoryview(self.__map)[self.__rows_offset:end]
+        for columns in self.__layout.iter_decode(rows, self.__heap, self.__dictionaries):
+            yield DataEntry(columns)
+
+    def key_at(self, index: int):
+        """
+        Decodes key of row by index
+        """
+
+        return self.__key_layout.decode_from(
+            self.__map, self.__key_offset + index * self.__row_size, self.__heap, self.__key_dictionaries
+        )[0]
+
+    def row_at(self, index: int) -> DataEntry:
+        """
+        Decodes row by index
+        """
+
+        return DataEntry(
+            self.__layout.decode_from(
+                self.__map, self.__rows_offset + index * self.__row_size, self.__heap, self.__dictionaries
+            )
+        )
+
+    def lower_bound(self, key) -> int:
+        """
+        Gets index of first row with key not less than given
+        """
+
+        low, high = 0, self.__count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def upper_bound(self, key) -> int:
+        """
+        Gets index of first row with key greater than given
+        """
+
+        low, high = 0, self.__count
+        while low < high:
+            middle = (low + high) // 2
+            if key < self.key_at(middle):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def find(self, key) -> list[DataEntry]:
+        """
+        Searches for all rows with key
+        """
+
+        start = self.lower_bound(key)
+        result = []
+        while start < self.__count and self.key_at(start) == key:
+            result.append(self.row_at(start))
+            start += 1
+        return result
+
+    def find_range(self, low=None, high=None) -> list[DataEntry]:
+        """
+        Gets rows with low <= key <= high, bound set to None is not checked
+        """
+
+        start = 0 if low is None else self.lower_bound(low)
+        end = self.__count if high is None else self.upper_bound(high)
+        return [self.row_at(index) for index in range(start, end)]
+
+    def close(self) -> None:
+        """
+        Unmaps file
+        """
+
+        if self.__heap is not None:
+            self.__heap.release()
+        try:
+            self.__map.close()
+        except BufferError:
+            # Unfinished iterator still holds a view, mapping is released with it
+            pass
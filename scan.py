@@ -0,0 +1,169 @@
+"""
+Contains vectorized scan engine for queries that can not use the key tree
+
+WHERE conditions are evaluated as NumPy boolean masks over whole columns, and only
+rows passing all conditions are materialized as DataEntry. Numeric columns are
+compared as unsigned arrays, string columns as byte string arrays (utf-8 keeps
+code point order, so byte comparison orders strings like str comparison does).
+DICT_STRING columns are arrays of dictionary codes: equality is evaluated on the codes,
+ordering comparisons on dictionary strings gathered by code.
+Requires NumPy, callers fall back to row by row filtering when it is missing.
+"""
+
+import operator
+
+from columnar import ColumnarRows, is_numeric
+from data_entry import ColumnType, DataEntry, StringDictionary
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_numpy_types = {ColumnType.INT: np.uint32, ColumnType.LONG: np.uint64} if np is not None else {}
+
+
+def is_available() -> bool:
+    """
+    Checks whether vectorized scans can be used (NumPy is installed)
+    """
+
+    return np is not None
+
+
+class ColumnBatch:
+    """
+    Column arrays over all rows of table sorted by key.
+    Arrays are built on first use of a column and kept while the batch lives
+    """
+
+    def __init__(self, column_types: list[int], count: int, get_values, get_rows):
+        """
+        Args:
+            column_types: Types of table columns
+            count: Number of rows
+            get_values: Callback returning all values of column by index, numeric columns
+                may return numpy array directly, DICT_STRING columns (codes array, StringDictionary) pair
+            get_rows: Callback returning DataEntry list for array of row indexes
+        """
+
+        self.__column_types = column_types
+        self.__count = count
+        self.__get_values = get_values
+        self.__get_rows = get_rows
+        self.__arrays = {}
+        self.__dictionaries = {}
+
+    @classmethod
+    def from_entries(cls, column_types: list[int], data_entries: list[DataEntry]) -> "ColumnBatch":
+        """
+        Creates batch over materialized rows (e.g. tree.inorder())
+        """
+
+        def get_values(index):
+            return [data_entry.columns[index] for data_entry in data_entries]
+
+        def get_rows(indexes):
+            return [data_entries[i] for i in indexes.tolist()]
+
+        return cls(column_types, len(data_entries), get_values, get_rows)
+
+    @classmethod
+    def from_columnar(cls, rows: ColumnarRows) -> "ColumnBatch":
+        """
+        Creates batch over columnar file, numeric columns are used without copying
+        """
+
+        def get_values(index):
+            if rows.column_types[index] == ColumnType.DICT_STRING:
+                return rows.column(index), rows.dictionary(index)
+            return rows.column(index)
+
+        def get_rows(indexes):
+            return [rows.row_at(i) for i in indexes.tolist()]
+
+        return cls(rows.column_types, len(rows), get_values, get_rows)
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def column(self, index: int):
+        """
+        Gets column as numpy array, DICT_STRING column as array of codes
+        """
+
+        if index not in self.__arrays:
+            column_type = self.__column_types[index]
+            values = self.__get_values(index)
+            if is_numeric(column_type):
+                self.__arrays[index] = np.asarray(values, dtype=_numpy_types[column_type])
+            elif column_type == ColumnType.DICT_STRING:
+                if isinstance(values, tuple):
+                    codes, dictionary = values
+                else:
+                    dictionary = StringDictionary()
+                    codes = np.fromiter(map(dictionary.add, values), dtype=np.uint32, count=len(values))
+                self.__arrays[index] = np.asarray(codes, dtype=np.uint32)
+                self.__dictionaries[index] = dictionary
+            else:
+                encoded = [value.encode("utf-8") for value in values]
+                self.__arrays[index] = np.array(encoded) if encoded else np.array([], dtype="S1")
+        return self.__arrays[index]
+
+    def mask(self, conditions: list[tuple]):
+        """
+        Evaluates conditions joined with AND into boolean mask
+
+        Args:
+            conditions: (column index, comparison function from operator module, value) tuples
+        """
+
+        result = np.ones(self.__count, dtype=bool)
+        for col_ind, op, value in conditions:
+            result &= self.__compare(col_ind, op, value)
+        return result
+
+    def filter(self, conditions: list[tuple]) -> list[DataEntry]:
+        """
+        Gets rows sorted by key which satisfy all conditions
+        """
+
+        return self.__get_rows(np.flatnonzero(self.mask(conditions)))
+
+    def __compare(self, col_ind: int, op, value):
+        column_type = self.__column_types[col_ind]
+        if column_type == ColumnType.DICT_STRING:
+            return self.__compare_codes(col_ind, op, value)
+        if not is_numeric(column_type):
+            return op(self.column(col_ind), value.encode("utf-8"))
+
+        # Values outside of unsigned column range can not be converted to its type,
+        # but every stored value is on the same side of them
+        limit = 1 << (8 * ColumnType.get_size(column_type))
+        if value < 0 or value >= limit:
+            below = value < 0
+            constant = {
+                operator.eq: False,
+                operator.ne: True,
+                operator.lt: not below,
+                operator.le: not below,
+                operator.gt: below,
+                operator.ge: below,
+            }[op]
+            return np.full(self.__count, constant, dtype=bool)
+
+        return op(self.column(col_ind), _numpy_types[column_type](value))
+
+    def __compare_codes(self, col_ind: int, op, value: str):
+        codes = self.column(col_ind)
+        dictionary = self.__dictionaries[col_ind]
+        if op in (operator.eq, operator.ne):
+            code = dictionary.lookup(value)
+            if code is None:
+                return np.full(self.__count, op is operator.ne, dtype=bool)
+            return op(codes, np.uint32(code))
+
+        # Ordering of codes says nothing about strings: compare each distinct string once,
+        # then gather results by code
+        strings = np.array([string.encode("utf-8") for string in dictionary.values] or [b""])
+        return op(strings, value.encode("utf-8"))[codes]
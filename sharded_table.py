@@ -0,0 +1,570 @@
+"""
+Table partitioned by key ranges across worker processes (see Database.shard_table)
+
+Every shard is a process keeping rows of its key range in its own in-memory tree, so one
+table uses several cores and heaps. Shard i owns keys in [boundaries[i - 1], boundaries[i]).
+Point operations go to one shard; scans and aggregates are sent to all shards their key
+range touches at once, shards filter and project their rows in parallel.
+When one shard grows past max_skew times the average, boundaries are moved to row
+quantiles and rows are moved between shards.
+"""
+
+import heapq
+import itertools
+import multiprocessing
+import os
+from bisect import bisect_right
+
+from data_entry import DataEntry, RowLayout
+from database_table import DatabaseTable
+from columnar import write_columnar
+from row_file import write_rows
+
+AGGREGATES = ("count", "sum", "min", "max")
+
+
+def _iter_range(tree, low, high):
+    key_col = tree.key_col
+    for data_entry in tree.iter_inorder():
+        key = data_entry.columns[key_col]
+        if high is not None and key > high:
+            break
+        if low is None or key >= low:
+            yield data_entry
+
+
+def _matching_rows(tree, low, high, conditions: list):
+    # Full walk builds list at once, which is faster than lazy walk when nothing stops it early
+    data_entries = tree.inorder() if low is None and high is None else _iter_range(tree, low, high)
+    if not conditions:
+        return (data_entry.columns for data_entry in data_entries)
+    if len(conditions) == 1:
+        col_ind, op, value = conditions[0]
+        return (data_entry.columns for data_entry in data_entries if op(data_entry.columns[col_ind], value))
+    return (
+        data_entry.columns for data_entry in data_entries
+        if all(op(data_entry.columns[col_ind], value) for col_ind, op, value in conditions)
+    )
+
+
+def _run_command(tree, command: str, args: tuple):
+    """
+    Runs command on tree of shard
+
+    Returns:
+        Tree (commands moving rows rebuild it) and result sent back
+    """
+
+    key_col = tree.key_col
+    match command:
+        case "insert":
+            for columns in args[0]:
+                tree.insert(DataEntry(columns))
+            return tree, None
+        case "erase":
+            erased = len(tree.find(args[0]))
+            tree.erase(args[0])
+            return tree, erased
+        case "find":
+            return tree, [data_entry.columns for data_entry in tree.find(args[0])]
+        case "scan":
+            low, high, conditions, indexes = args
+            rows = _matching_rows(tree, low, high, conditions)
+            if indexes is None:
+                return tree, list(rows)
+            return tree, [[columns[i] for i in indexes] for columns in rows]
+        case "aggregate":
+            function, col_ind, low, high, conditions = args
+            values = (columns[col_ind] for columns in _matching_rows(tree, low, high, conditions))
+            if function == "count":
+                return tree, sum(1 for _ in values)
+            if function == "sum":
+                return tree, sum(values)
+            return tree, (min if function == "min" else max)(values, default=None)
+        case "keys_at":
+            ranks = iter(args[0])
+            keys = []
+            rank = next(ranks, None)
+            for i, data_entry in enumerate(tree.iter_inorder()):
+                while rank == i:
+                    keys.append(data_entry.columns[key_col])
+                    rank = next(ranks, None)
+                if rank is None:
+                    break
+            return tree, keys
+        case "keep_range":
+            # Rows outside [low, high) are removed and returned sorted, tree is rebuilt of the rest
+            low, high, keep = args
+            kept, moved = [], []
+            for data_entry in tree.iter_inorder():
+                key = data_entry.columns[key_col]
+                inside = keep and (low is None or key >= low) and (high is None or key < high)
+                (kept if inside else moved).append(data_entry)
+            new_tree = type(tree)(key_col)
+            new_tree.bulk_build(kept)
+            return new_tree, (len(kept), [data_entry.columns for data_entry in moved])
+        case "add":
+            # Added rows are sorted by key, merge keeps existing rows first for equal keys
+            added = (DataEntry(columns) for columns in args[0])
+            new_tree = type(tree)(key_col)
+            new_tree.bulk_build(heapq.merge(
+                tree.iter_inorder(), added, key=lambda data_entry: data_entry.columns[key_col]
+            ))
+            return new_tree, None
+        case "convert":
+            new_tree = args[0](key_col)
+            new_tree.bulk_build(tree.iter_inorder())
+            return new_tree, None
+    raise ValueError(f"Unknown shard command \"{command}\"")
+
+
+def _serve_shard(connection, tree_type, key_col: int) -> None:
+    """
+    Main function of shard process: runs commands from connection until it is closed
+    """
+
+    tree = tree_type(key_col)
+    while True:
+        try:
+            command, args = connection.recv()
+        except EOFError:
+            return
+        if command == "close":
+            connection.close()
+            return
+        try:
+            tree, result = _run_command(tree, command, args)
+            connection.send((True, result))
+        except Exception as e:
+            connection.send((False, f"{type(e).__name__}: {e}"))
+
+
+class ShardedTable:
+    """
+    Represents table whose rows are partitioned by key ranges across worker processes.
+    Supports the same reads and writes as DatabaseTable, rows are written to table file
+    as usual, so reopened database loads table unsharded
+    """
+
+    DEFAULT_MAX_SKEW = 1.5
+
+    sharded = True
+
+    __min_rebalance_rows = 1000
+
+    def __init__(self, tree_type, key_col: int, column_types: list[int], data_entries=(),
+                 shards: int | None = None, storage_format: str = DatabaseTable.ROWS_FORMAT,
+                 max_skew: float = DEFAULT_MAX_SKEW):
+        """
+        Args:
+            tree_type: In-memory tree class of every shard
+            key_col: Key column index
+            column_types: Types of table columns
+            data_entries: Rows sorted by key to start with
+            shards: Number of shard processes, number of CPUs if None
+            storage_format: Format table file is written in, rows or columnar
+            max_skew: Rows of the largest shard relative to average that trigger rebalancing,
+                0 turns automatic rebalancing off (rebalance() still can be called)
+        """
+
+        if DatabaseTable.is_on_disk(tree_type):
+            raise RuntimeError("Shards keep rows in memory, on-disk tree type can not be sharded.")
+        if storage_format not in (DatabaseTable.ROWS_FORMAT, DatabaseTable.COLUMNAR_FORMAT):
+            raise RuntimeError(f"Sharded table can not be stored in \"{storage_format}\" format.")
+
+        self.max_skew = max_skew
+        self.__key_col = key_col
+        self.__column_types = column_types
+        self.__layout = RowLayout(column_types)
+        self.__key_layout = RowLayout([column_types[key_col]])
+        self.__storage_format = storage_format
+        self.__dirty = True
+        self.__version = DatabaseTable.next_version()
+        self.__boundaries = []
+
+        self.__connections = []
+        self.__processes = []
+        for _ in range(shards or os.cpu_count() or 1):
+            connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_serve_shard, args=(child_connection, tree_type, key_col), daemon=True
+            )
+            process.start()
+            child_connection.close()
+            self.__connections.append(connection)
+            self.__processes.append(process)
+        self.__counts = [0] * len(self.__connections)
+
+        rows = [data_entry.columns for data_entry in data_entries]
+        self.__boundaries = self.__quantiles(len(rows), lambda ranks: [rows[rank][key_col] for rank in ranks])
+        self.__add_sorted(rows)
+
+    def __del__(self):
+        if getattr(self, "_ShardedTable__connections", None):
+            self.close()
+
+    def close(self) -> None:
+        """
+        Stops shard processes, their rows are lost
+        """
+
+        for connection in self.__connections:
+            try:
+                connection.send(("close", ()))
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in self.__processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.__connections = []
+        self.__processes = []
+
+    @property
+    def shards(self) -> int:
+        """
+        Gets number of shards
+        """
+
+        return len(self.__connections)
+
+    @property
+    def boundaries(self) -> list:
+        """
+        Gets smallest keys of shards except the first one (shards past the last boundary are empty)
+        """
+
+        return list(self.__boundaries)
+
+    @property
+    def shard_row_counts(self) -> list[int]:
+        """
+        Gets number of rows in every shard
+        """
+
+        return list(self.__counts)
+
+    def __shard_of(self, key) -> int:
+        return bisect_right(self.__boundaries, key)
+
+    def __shards_between(self, low, high) -> range:
+        return range(
+            0 if low is None else self.__shard_of(low),
+            len(self.__boundaries) + 1 if high is None else self.__shard_of(high) + 1
+        )
+
+    def __receive(self, shard: int):
+        success, result = self.__connections[shard].recv()
+        if not success:
+            raise RuntimeError(f"Shard {shard} failed: {result}")
+        return result
+
+    def __call(self, shard: int, command: str, *args):
+        self.__connections[shard].send((command, args))
+        return self.__receive(shard)
+
+    def __fan_out(self, requests: dict) -> dict:
+        # All requests are sent before any response is read, so shards work in parallel
+        for shard, (command, *args) in requests.items():
+            self.__connections[shard].send((command, tuple(args)))
+        return {shard: self.__receive(shard) for shard in requests}
+
+    def __quantiles(self, total: int, keys_at) -> list:
+        # Boundaries split rows into equal parts, equal keys never span two shards
+        boundaries = []
+        if total == 0:
+            return boundaries
+        shards = len(self.__connections)
+        for key in keys_at([i * total // shards for i in range(1, shards)]):
+            if not boundaries or key > boundaries[-1]:
+                boundaries.append(key)
+        return boundaries
+
+    def __add_sorted(self, rows) -> None:
+        groups = {}
+        key_col = self.__key_col
+        for columns in rows:
+            groups.setdefault(self.__shard_of(columns[key_col]), []).append(columns)
+        self.__fan_out({shard: ("add", group) for shard, group in groups.items()})
+        for shard, group in groups.items():
+            self.__counts[shard] += len(group)
+
+    def insert(self, data_entry: DataEntry) -> None:
+        """
+        Inserts row into its shard
+        """
+
+        shard = self.__shard_of(data_entry.columns[self.__key_col])
+        self.__call(shard, "insert", [data_entry.columns])
+        self.__counts[shard] += 1
+        self.mark_dirty()
+        self.__check_skew()
+
+    def insert_many(self, data_entries: list[DataEntry]) -> None:
+        """
+        Inserts many rows, shards insert their parts in parallel
+        """
+
+        groups = {}
+        key_col = self.__key_col
+        for data_entry in data_entries:
+            groups.setdefault(self.__shard_of(data_entry.columns[key_col]), []).append(data_entry.columns)
+        self.__fan_out({shard: ("insert", group) for shard, group in groups.items()})
+        for shard, group in groups.items():
+            self.__counts[shard] += len(group)
+        self.mark_dirty()
+        self.__check_skew()
+
+    def erase(self, key) -> None:
+        """
+        Erases all rows with key from table
+        """
+
+        shard = self.__shard_of(key)
+        erased = self.__call(shard, "erase", key)
+        if erased:
+            self.__counts[shard] -= erased
+            self.mark_dirty()
+
+    def find(self, key) -> list[DataEntry]:
+        """
+        Searches for all rows with key in its shard
+        """
+
+        return [DataEntry(columns) for columns in self.__call(self.__shard_of(key), "find", key)]
+
+    def __scan(self, low, high, conditions, indexes) -> list[list]:
+        results = self.__fan_out({
+            shard: ("scan", low, high, list(conditions), indexes) for shard in self.__shards_between(low, high)
+        })
+        # Shards own consecutive key ranges, so their sorted results joined in shard order are merged
+        return list(itertools.chain.from_iterable(results[shard] for shard in sorted(results)))
+
+    def scan(self, low=None, high=None, conditions=()) -> list[DataEntry]:
+        """
+        Gets rows with low <= key <= high (None bound is not checked) sorted by key, which satisfy
+        all conditions (col_ind, op, value) with op from operator module; shards filter in parallel
+        """
+
+        return [DataEntry(columns) for columns in self.__scan(low, high, conditions, None)]
+
+    def find_range(self, low=None, high=None) -> list[DataEntry]:
+        """
+        Gets rows with low <= key <= high sorted by key, bound set to None is not checked
+        """
+
+        return self.scan(low, high)
+
+    def inorder(self) -> list[DataEntry]:
+        """
+        Gets all rows sorted by key
+        """
+
+        return self.scan()
+
+    def iter_inorder(self):
+        """
+        Iterates over all rows sorted by key (rows are fetched from shards at once)
+        """
+
+        return iter(self.scan())
+
+    def select_columns(self, indexes: list[int]) -> list[list]:
+        """
+        Gets projection of all rows sorted by key on given columns, shards project in parallel
+        """
+
+        return self.__scan(None, None, (), indexes)
+
+    def aggregate(self, function: str, col_ind: int | None = None, low=None, high=None, conditions=()):
+        """
+        Computes count, sum, min or max of column over rows with low <= key <= high satisfying
+        conditions; every shard computes it over its rows and results are combined
+
+        Returns:
+            Aggregate value, None for min and max of no rows
+        """
+
+        if function not in AGGREGATES:
+            raise RuntimeError(f"Unknown aggregate \"{function}\", expected one of {', '.join(AGGREGATES)}.")
+        col_ind = self.__key_col if col_ind is None else col_ind
+
+        parts = self.__fan_out({
+            shard: ("aggregate", function, col_ind, low, high, list(conditions))
+            for shard in self.__shards_between(low, high)
+        }).values()
+        if function in ("count", "sum"):
+            return sum(parts)
+        values = [part for part in parts if part is not None]
+        return (min if function == "min" else max)(values, default=None)
+
+    def scan_batch(self) -> None:
+        """
+        Sharded table has no column arrays, scans are filtered by shards instead
+        """
+
+        return None
+
+    def __check_skew(self) -> None:
+        total = sum(self.__counts)
+        if self.max_skew and total >= ShardedTable.__min_rebalance_rows \
+                and max(self.__counts) > self.max_skew * total / len(self.__counts):
+            self.rebalance()
+
+    def __keys_at(self, ranks: list[int]) -> list:
+        starts = list(itertools.accumulate(self.__counts, initial=0))
+        local_ranks = {}
+        for rank in ranks:
+            shard = bisect_right(starts, rank) - 1
+            local_ranks.setdefault(shard, []).append(rank - starts[shard])
+        keys = self.__fan_out({shard: ("keys_at", shard_ranks) for shard, shard_ranks in local_ranks.items()})
+        return [key for shard in sorted(keys) for key in keys[shard]]
+
+    def rebalance(self) -> bool:
+        """
+        Moves boundaries so that shards hold about equal numbers of rows, rows outside
+        new ranges of their shards are moved to the shards that own them now
+
+        Returns:
+            False if boundaries did not change
+        """
+
+        boundaries = self.__quantiles(sum(self.__counts), self.__keys_at)
+        if boundaries == self.__boundaries:
+            return False
+
+        requests = {}
+        for shard in range(len(self.__connections)):
+            low = boundaries[shard - 1] if 0 < shard <= len(boundaries) else None
+            high = boundaries[shard] if shard < len(boundaries) else None
+            requests[shard] = ("keep_range", low, high, shard <= len(boundaries))
+        results = self.__fan_out(requests)
+
+        self.__boundaries = boundaries
+        self.__counts = [results[shard][0] for shard in range(len(self.__connections))]
+        key_col = self.__key_col
+        self.__add_sorted(heapq.merge(
+            *(moved for _, moved in results.values()), key=lambda columns: columns[key_col]
+        ))
+        return True
+
+    def convert_tree(self, tree_type) -> None:
+        """
+        Rebuilds tree of every shard as another in-memory tree type
+        """
+
+        if DatabaseTable.is_on_disk(tree_type):
+            raise RuntimeError("Table can only be converted to in-memory tree type.")
+        self.__fan_out({shard: ("convert", tree_type) for shard in range(len(self.__connections))})
+
+    def write_to_file(self, filename: str) -> None:
+        """
+        Writes rows of all shards into table file
+        """
+
+        if self.__storage_format == DatabaseTable.COLUMNAR_FORMAT:
+            write_columnar(filename, self.__key_col, self.__column_types, self.iter_inorder())
+        else:
+            write_rows(filename, self.__key_col, self.__column_types, self.iter_inorder())
+        self.__dirty = False
+
+    @property
+    def storage_format(self) -> str:
+        """
+        Gets format of table file: rows or columnar
+        """
+
+        return self.__storage_format
+
+    @storage_format.setter
+    def storage_format(self, value: str):
+        if value not in (DatabaseTable.ROWS_FORMAT, DatabaseTable.COLUMNAR_FORMAT):
+            raise RuntimeError(f"Sharded table can not be stored in \"{value}\" format.")
+        if value != self.__storage_format:
+            self.__storage_format = value
+            self.mark_dirty()
+
+    @property
+    def workload(self) -> None:
+        """
+        Workload of sharded tables is not tracked
+        """
+
+        return None
+
+    def set_workload_tracking(self, window: int) -> None:
+        """
+        Does nothing, backend advisor does not migrate sharded tables
+        """
+
+    @property
+    def row_count(self) -> int:
+        """
+        Gets number of rows
+        """
+
+        return sum(self.__counts)
+
+    def mark_dirty(self) -> None:
+        """
+        Marks table as changed since it was last written to file
+        """
+
+        self.__dirty = True
+        self.__version = DatabaseTable.next_version()
+
+    def mark_clean(self) -> None:
+        """
+        Marks table as written to file by someone else
+        """
+
+        self.__dirty = False
+
+    @property
+    def dirty(self) -> bool:
+        """
+        Whether table changed since it was last written to file
+        """
+
+        return self.__dirty
+
+    @property
+    def version(self) -> int:
+        """
+        Counter increased by every table modification, shared with DatabaseTable versions
+        """
+
+        return self.__version
+
+    @property
+    def key_col(self) -> int:
+        """
+        Gets key column index
+        """
+
+        return self.__key_col
+
+    @property
+    def layout(self) -> RowLayout:
+        """
+        Gets binary row layout of table
+        """
+
+        return self.__layout
+
+    @property
+    def key_layout(self) -> RowLayout:
+        """
+        Gets binary layout of key column
+        """
+
+        return self.__key_layout
+
+    @property
+    def column_types(self) -> list[int]:
+        """
+        Gets types of table columns
+        """
+
+        return self.__column_types
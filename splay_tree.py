@@ -2,6 +2,8 @@
 Contains splay tree representation
 """
 
+from collections.abc import Iterator
+
 from data_entry import DataEntry
 from abstract_tree import AbstractTree, AbstractTreeNode
 
@@ -207,6 +209,9 @@ class SplayTree(AbstractTree):
 
         return result
 
+    def iter_inorder(self) -> Iterator[DataEntry]:
+        return self._iter_binary_inorder(self.__root)
+
     def preorder(self) -> list[DataEntry]:
         def preorder_recursive(node, result):
             if node is None:
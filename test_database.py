@@ -0,0 +1,914 @@
+"""
+Unit tests for database storage: table files and database folder
+"""
+
+import operator
+import os
+import random
+import tempfile
+import unittest
+
+from avl_tree import AVLTree
+from b_tree import MediumBTree
+from bloom_filter import BloomFilter
+from data_entry import ColumnType, DataEntry, RowLayout
+from database import Database
+from columnar import ColumnarRows, is_columnar_file
+from database_table import DatabaseTable
+from paged_b_tree import PagedBTree
+from query import QuerySession
+from splay_tree import SplayTree
+from treap import Treap
+from workload import BackendAdvisor
+
+ALL_TYPES = [ColumnType.INT, ColumnType.LONG, ColumnType.CHAR, ColumnType.SMALL_STRING, ColumnType.BIG_STRING]
+
+
+def random_entries(count: int) -> list[DataEntry]:
+    """
+    Generates data entries for table with ALL_TYPES columns
+    """
+
+    return [
+        DataEntry([
+            random.randrange(2 ** 32),
+            random.randrange(2 ** 64),
+            random.choice("abc"),
+            f"name{random.randrange(count)}",
+            "description" * random.randint(0, 20)
+        ])
+        for _ in range(count)
+    ]
+
+
+class TestDatabaseTable(unittest.TestCase):
+    """
+    Tests table file format
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, "table")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_row_layout(self):
+        """
+        Tests that row layout matches per-column encoding
+        """
+
+        layout = RowLayout(ALL_TYPES)
+        self.assertEqual(layout.row_size, sum(ColumnType.get_size(col_type) for col_type in ALL_TYPES))
+
+        for entry in random_entries(50):
+            raw = layout.encode(entry.columns)
+            self.assertEqual(raw, b"".join(
+                ColumnType.to_bytes(value, col_type) for value, col_type in zip(entry.columns, ALL_TYPES)
+            ))
+            self.assertListEqual(layout.decode(raw), entry.columns)
+
+    def test_write_and_read(self):
+        """
+        Tests that table survives writing to and reading from file
+        """
+
+        tree = AVLTree(3)
+        for entry in random_entries(300):
+            tree.insert(entry)
+
+        DatabaseTable(tree, ALL_TYPES).write_to_file(self.filename)
+        loaded = DatabaseTable.read_from_file(SplayTree, self.filename)
+
+        self.assertListEqual(loaded.column_types, ALL_TYPES)
+        self.assertEqual(loaded.tree.key_col, 3)
+        self.assertListEqual(loaded.tree.inorder(), tree.inorder())
+
+    def test_write_in_chunks(self):
+        """
+        Tests streaming writer when rows span several chunk buffers
+        """
+
+        tree = AVLTree(0)
+        for entry in random_entries(5000):
+            tree.insert(entry)
+        DatabaseTable(tree, ALL_TYPES).write_to_file(self.filename)
+
+        layout = RowLayout(ALL_TYPES)
+        self.assertEqual(os.path.getsize(self.filename), 4 + len(ALL_TYPES) + 5000 * layout.row_size)
+        self.assertListEqual(DatabaseTable.read_from_file(AVLTree, self.filename).tree.inorder(), tree.inorder())
+        self.assertListEqual(os.listdir(self.tmp_dir.name), ["table"])
+
+    def test_mapped_reads(self):
+        """
+        Tests that mapped table answers reads like in-memory one
+        """
+
+        tree = AVLTree(0)
+        for i in range(500):
+            tree.insert(DataEntry([random.randrange(200), f"name{i}"]))
+        DatabaseTable(tree, [ColumnType.INT, ColumnType.SMALL_STRING]).write_to_file(self.filename)
+
+        table = DatabaseTable.open_mapped(Treap, self.filename)
+        self.assertTrue(table.mapped)
+        self.assertListEqual(table.inorder(), tree.inorder())
+        for key in range(-1, 201):
+            self.assertListEqual(table.find(key), tree.find(key))
+        self.assertListEqual(
+            table.find_range(50, 60),
+            [data_entry for data_entry in tree.inorder() if 50 <= data_entry.columns[0] <= 60]
+        )
+        self.assertTrue(table.mapped)
+        self.assertFalse(table.dirty)
+
+        table.insert(DataEntry([1000, "new"]))
+        self.assertFalse(table.mapped)
+        self.assertEqual(len(table.inorder()), 501)
+        self.assertListEqual(table.find_range(50, 60), DatabaseTable.open_mapped(Treap, self.filename).find_range(50, 60))
+
+    def test_bloom_filter(self):
+        """
+        Tests that table with bloom filter answers lookups like one without it,
+        and that filter of changed table file is not trusted
+        """
+
+        bloom = BloomFilter.from_keys(range(0, 20000, 2), 10000)
+        self.assertTrue(all(key in bloom for key in range(0, 20000, 2)))
+        self.assertLess(sum(key in bloom for key in range(1, 20000, 2)), 300)
+
+        tree = AVLTree(0)
+        for i in range(500):
+            tree.insert(DataEntry([random.randrange(0, 400, 2), f"name{i}"]))
+        table = DatabaseTable(tree, [ColumnType.INT, ColumnType.SMALL_STRING])
+        table.bloom_filter = True
+        table.write_to_file(self.filename)
+        self.assertTrue(os.path.exists(f"{self.filename}.bloom"))
+        self.assertEqual(DatabaseTable.table_files(self.filename), [self.filename, f"{self.filename}.bloom"])
+        with open(f"{self.filename}.bloom", "rb") as file:
+            stale_bloom = file.read()
+
+        for table in [DatabaseTable.open_mapped(Treap, self.filename), DatabaseTable.read_from_file(Treap, self.filename)]:
+            self.assertTrue(table.bloom_filter)
+            for key in range(-1, 401):
+                self.assertListEqual(table.find(key), tree.find(key))
+            table.insert(DataEntry([401, "new"]))
+            self.assertEqual(len(table.find(401)), 1)
+            table.erase(1)
+            table.erase(402)
+
+        table.write_to_file(self.filename)
+        with open(f"{self.filename}.bloom", "wb") as file:
+            file.write(stale_bloom)
+        table = DatabaseTable.open_mapped(Treap, self.filename)
+        self.assertEqual(len(table.find(401)), 1)
+
+        table.bloom_filter = False
+        table.write_to_file(self.filename)
+        self.assertFalse(os.path.exists(f"{self.filename}.bloom"))
+
+    def test_key_cache(self):
+        """
+        Tests that cached point lookups stay correct across inserts, erases and loading mapped table
+        """
+
+        tree = AVLTree(0)
+        for i in range(300):
+            tree.insert(DataEntry([i % 50, f"name{i}"]))
+        DatabaseTable(tree, [ColumnType.INT, ColumnType.SMALL_STRING]).write_to_file(self.filename)
+
+        table = DatabaseTable.open_mapped(SplayTree, self.filename)
+        table.set_key_cache(10)
+        for _ in range(3):
+            for key in [1, 2, 3, 100]:
+                self.assertListEqual(table.find(key), tree.find(key))
+        self.assertEqual((table.key_cache.hits, table.key_cache.misses), (8, 4))
+
+        table.find(3).clear()
+        self.assertEqual(len(table.find(3)), 6)
+
+        for step in range(500):
+            key = random.randrange(60)
+            if step % 5 == 0:
+                table.erase(key)
+                tree.erase(key)
+            elif step % 5 == 1:
+                table.insert(DataEntry([key, f"new{step}"]))
+                tree.insert(DataEntry([key, f"new{step}"]))
+            self.assertListEqual(table.find(key), tree.find(key))
+        self.assertLessEqual(len(table.key_cache), 10)
+        self.assertGreater(table.key_cache.hits, 8)
+
+        table.set_key_cache(0)
+        self.assertIsNone(table.key_cache)
+
+    def test_columnar_format(self):
+        """
+        Tests that columnar table file answers reads like row format one
+        """
+
+        tree = AVLTree(0)
+        for data_entry in random_entries(1000):
+            data_entry.columns[0] %= 300
+            data_entry.columns[3] = "\u0457" * 10
+            tree.insert(data_entry)
+        table = DatabaseTable(tree, ALL_TYPES, DatabaseTable.COLUMNAR_FORMAT)
+        table.write_to_file(self.filename)
+        self.assertTrue(is_columnar_file(self.filename))
+
+        DatabaseTable(tree, ALL_TYPES).write_to_file(f"{self.filename}_rows")
+        rows_table = DatabaseTable.read_from_file(AVLTree, f"{self.filename}_rows")
+        loaded = DatabaseTable.read_from_file(AVLTree, self.filename)
+
+        self.assertEqual(loaded.storage_format, DatabaseTable.COLUMNAR_FORMAT)
+        self.assertTrue(loaded.mapped)
+        self.assertListEqual(loaded.inorder(), rows_table.inorder())
+        self.assertListEqual(loaded.select_columns([4, 0]), rows_table.select_columns([4, 0]))
+        for key in [-1, 0, 17, 299, 300, 2 ** 40]:
+            self.assertListEqual(loaded.find(key), rows_table.find(key))
+        self.assertListEqual(loaded.find_range(-5, 20), rows_table.find_range(0, 20))
+        self.assertEqual(DatabaseTable.read_metadata(self.filename), (0, ALL_TYPES, 1000))
+
+        rows = ColumnarRows(self.filename)
+        self.assertListEqual(list(rows.column(1)), [data_entry.columns[1] for data_entry in tree.inorder()])
+        rows.close()
+
+        loaded.insert(DataEntry([5, 6, "c", "new", "row"]))
+        self.assertFalse(loaded.mapped)
+        loaded.write_to_file(self.filename)
+        self.assertEqual(DatabaseTable.read_metadata(self.filename)[2], 1001)
+
+    def test_var_strings(self):
+        """
+        Tests table with VAR_STRING columns (key included): file, mapped reads and parallel decoding
+        """
+
+        column_types = [ColumnType.VAR_STRING, ColumnType.INT, ColumnType.VAR_STRING]
+        tree = AVLTree(0)
+        for i in range(400):
+            tree.insert(DataEntry([f"key{random.randrange(100)}", i, "\u0457" * random.randint(0, 300)]))
+        DatabaseTable(tree, column_types).write_to_file(self.filename)
+
+        # Long values are kept whole, yet the file is smaller than with BIG_STRING padding
+        loaded = DatabaseTable.read_from_file(SplayTree, self.filename)
+        self.assertListEqual(loaded.tree.inorder(), tree.inorder())
+        self.assertEqual(DatabaseTable.read_metadata(self.filename), (0, column_types, 400))
+        self.assertLess(os.path.getsize(self.filename), 400 * RowLayout([ColumnType.BIG_STRING] * 2).row_size)
+
+        mapped = DatabaseTable.open_mapped(Treap, self.filename)
+        self.assertListEqual(mapped.inorder(), tree.inorder())
+        for key in ["key0", "key5", "key50", "zzz", ""]:
+            self.assertListEqual(mapped.find(key), tree.find(key))
+        self.assertListEqual(
+            mapped.find_range("key1", "key2"),
+            [data_entry for data_entry in tree.inorder() if "key1" <= data_entry.columns[0] <= "key2"]
+        )
+        mapped.close()
+
+        tables = DatabaseTable.read_many_from_files(AVLTree, [self.filename], workers=2, chunk_rows=64)
+        self.assertListEqual(tables[self.filename].tree.inorder(), tree.inorder())
+
+        with self.assertRaises(ValueError):
+            RowLayout(column_types).encode(["key", 1, "value"])
+
+    def test_dict_strings(self):
+        """
+        Tests table with DICT_STRING columns in row and columnar files
+        """
+
+        column_types = [ColumnType.INT, ColumnType.DICT_STRING, ColumnType.DICT_STRING]
+        names = [f"name{i}" for i in range(20)]
+        tree = AVLTree(0)
+        for i in range(1000):
+            tree.insert(DataEntry([i, random.choice(names), random.choice(["\u0457", "b"])]))
+        DatabaseTable(tree, column_types).write_to_file(self.filename)
+        self.assertLess(os.path.getsize(self.filename), 1000 * RowLayout([ColumnType.SMALL_STRING]).row_size)
+
+        loaded = DatabaseTable.read_from_file(AVLTree, self.filename)
+        self.assertListEqual(loaded.tree.inorder(), tree.inorder())
+        # Rows share one string object per distinct value
+        self.assertEqual(len({id(data_entry.columns[1]) for data_entry in loaded.tree.inorder()}), 20)
+
+        mapped = DatabaseTable.open_mapped(Treap, self.filename)
+        self.assertListEqual(mapped.find(500), tree.find(500))
+        self.assertListEqual(mapped.inorder(), tree.inorder())
+        mapped.close()
+
+        tables = DatabaseTable.read_many_from_files(AVLTree, [self.filename], workers=2, chunk_rows=300)
+        self.assertListEqual(tables[self.filename].tree.inorder(), tree.inorder())
+
+        DatabaseTable(tree, column_types, DatabaseTable.COLUMNAR_FORMAT).write_to_file(self.filename)
+        columnar = DatabaseTable.read_from_file(AVLTree, self.filename)
+        self.assertListEqual(columnar.inorder(), tree.inorder())
+        self.assertListEqual(columnar.select_columns([2, 1]), loaded.select_columns([2, 1]))
+
+    def test_empty_table(self):
+        """
+        Tests writing and reading table without rows
+        """
+
+        DatabaseTable(AVLTree(0), [ColumnType.INT]).write_to_file(self.filename)
+        self.assertListEqual(DatabaseTable.read_from_file(AVLTree, self.filename).tree.inorder(), [])
+
+
+class TestDatabase(unittest.TestCase):
+    """
+    Tests database folder handling
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_database(self) -> Database:
+        """
+        Creates database with two saved tables
+        """
+
+        db = Database(Treap, self.path, save_on_exit=False)
+        db.create_table("first", [("id", ColumnType.INT), ("name", ColumnType.SMALL_STRING)], 0)
+        db.create_table("second", [("id", ColumnType.INT)], 0)
+        for i in range(10):
+            db.insert("first", [i, f"name{i}"])
+            db.insert("second", [i])
+        db.save()
+        return db
+
+    def test_save_and_load(self):
+        """
+        Tests that saved database is loaded back
+        """
+
+        self.create_database()
+        db = Database(AVLTree, self.path, save_on_exit=False)
+
+        self.assertListEqual(db.get_tables_names(), ["first", "second"])
+        self.assertListEqual(db.get_table_columns_names("first"), ["id", "name"])
+        self.assertListEqual(db.select(["name"], "first")[:2], [["name0"], ["name1"]])
+
+    def test_lazy_loading(self):
+        """
+        Tests that tables are loaded only when accessed, while metadata is read from files
+        """
+
+        self.create_database()
+        db = Database(AVLTree, self.path, save_on_exit=False)
+
+        self.assertFalse(db.is_table_loaded("first"))
+        self.assertEqual(db.get_table_row_count("first"), 10)
+        self.assertFalse(db.is_table_loaded("first"))
+
+        db.insert("second", [100])
+        self.assertTrue(db.is_table_loaded("second"))
+        self.assertFalse(db.is_table_loaded("first"))
+        self.assertEqual(db.get_table_row_count("second"), 11)
+
+        db.save()
+        self.assertFalse(db.is_table_loaded("first"))
+        self.assertEqual(db.get_table_row_count("second"), 11)
+
+        db.preload()
+        self.assertTrue(db.is_table_loaded("first"))
+        self.assertListEqual(db.select(["id"], "first")[:2], [[0], [1]])
+
+    def test_parallel_preload(self):
+        """
+        Tests that tables decoded by worker processes match serially loaded ones
+        """
+
+        self.create_database()
+        big = Database(Treap, self.path, save_on_exit=False)
+        big.create_table("big", [(f"c{i}", col_type) for i, col_type in enumerate(ALL_TYPES)], 3)
+        for data_entry in random_entries(3000):
+            big.insert("big", data_entry.columns)
+        big.save()
+
+        serial = Database(AVLTree, self.path, save_on_exit=False)
+        parallel = Database(AVLTree, self.path, save_on_exit=False)
+        tables = DatabaseTable.read_many_from_files(
+            AVLTree, [os.path.join(self.path, "big"), os.path.join(self.path, "second")], workers=2, chunk_rows=700
+        )
+        parallel.preload(workers=2)
+
+        for table_name in ["first", "second", "big"]:
+            self.assertTrue(parallel.is_table_loaded(table_name))
+            self.assertFalse(parallel.get_table(table_name).dirty)
+            self.assertListEqual(parallel.get_table(table_name).inorder(), serial.get_table(table_name).inorder())
+        self.assertListEqual(tables[os.path.join(self.path, "big")].inorder(), serial.get_table("big").inorder())
+
+    def test_mapped_database(self):
+        """
+        Tests database opened with mapped table files
+        """
+
+        self.create_database()
+        db = Database(AVLTree, self.path, save_on_exit=False, mapped=True)
+
+        self.assertTrue(db.get_table("first").mapped)
+        self.assertListEqual(db.select(["name"], "first")[:2], [["name0"], ["name1"]])
+        db.insert("second", [100])
+        db.save()
+
+        self.assertTrue(db.get_table("first").mapped)
+        self.assertFalse(db.get_table("second").mapped)
+        self.assertEqual(len(Database(Treap, self.path, save_on_exit=False).select(["id"], "second")), 11)
+
+    def test_only_dirty_tables_rewritten(self):
+        """
+        Tests that save rewrites only changed tables and config
+        """
+
+        db = self.create_database()
+        inodes = {name: os.stat(os.path.join(self.path, name)).st_ino for name in os.listdir(self.path)}
+
+        db.insert("second", [100])
+        db.select(["id"], "first")
+        db.save()
+
+        self.assertEqual(os.stat(os.path.join(self.path, "first")).st_ino, inodes["first"])
+        self.assertEqual(os.stat(os.path.join(self.path, "db_data.cnf")).st_ino, inodes["db_data.cnf"])
+        self.assertNotEqual(os.stat(os.path.join(self.path, "second")).st_ino, inodes["second"])
+        self.assertFalse(db.get_table("second").dirty)
+
+    def test_paged_tables(self):
+        """
+        Tests that on-disk tree type converts table files into page files, which stay paged
+        """
+
+        self.create_database()
+        db = Database(PagedBTree, self.path, save_on_exit=False)
+        db.preload()
+        self.assertTrue(PagedBTree.is_paged_file(os.path.join(self.path, "first")))
+
+        db.create_table("third", [("id", ColumnType.INT)], 0)
+        for i in range(100):
+            db.insert("third", [i % 7])
+        db.erase("first", 3)
+        db.save()
+        del db
+
+        db = Database(AVLTree, self.path, save_on_exit=False)
+        self.assertIsInstance(db.get_table("third").tree, PagedBTree)
+        self.assertEqual(len(db.select(["id"], "third")), 100)
+        self.assertListEqual(db.select(["id"], "first"), [[i] for i in range(10) if i != 3])
+        self.assertListEqual([data_entry.columns[0] for data_entry in db.get_table("first").find_range(2, 5)], [2, 4, 5])
+
+        db.drop_table("third")
+        db.save()
+        self.assertListEqual(sorted(os.listdir(self.path)), ["db_data.cnf", "first", "second"])
+
+    def test_paged_cache_budget(self):
+        """
+        Tests that buffer pools of paged tables, created and opened, keep to cache budget of database
+        """
+
+        self.create_database()
+        db = Database(PagedBTree, self.path, save_on_exit=False, cache_bytes=10 * PagedBTree.DEFAULT_PAGE_SIZE)
+        db.create_table("third", [("id", ColumnType.INT), ("name", ColumnType.SMALL_STRING)], 0)
+        db.insert_many("third", [[i, f"name{i}"] for i in range(5000)])
+        db.save()
+
+        pool = db.get_table("third").tree.pool
+        self.assertEqual(pool.capacity, 10)
+        self.assertLessEqual(len(pool), 10)
+        self.assertGreater(pool.evictions, 0)
+        self.assertEqual(db.get_table("first").tree.pool.capacity, 10)
+        db.get_table("first").close()
+        db.get_table("third").close()
+
+        db = Database(PagedBTree, self.path, save_on_exit=False, cache_bytes=10 * PagedBTree.DEFAULT_PAGE_SIZE)
+        self.assertEqual(len(db.select(["id"], "third")), 5000)
+        pool = db.get_table("third").tree.pool
+        self.assertLessEqual(len(pool), 10)
+        self.assertGreater(pool.evictions, 0)
+        db.get_table("third").close()
+
+    def test_table_formats(self):
+        """
+        Tests choosing storage format per table
+        """
+
+        db = self.create_database()
+        db.create_table("third", [("id", ColumnType.INT), ("value", ColumnType.LONG)], 0, "columnar")
+        db.insert("third", [2, 20])
+        db.insert("third", [1, 10])
+        db.set_table_format("first", "columnar")
+        db.save()
+
+        self.assertTrue(is_columnar_file(os.path.join(self.path, "first")))
+        self.assertFalse(is_columnar_file(os.path.join(self.path, "second")))
+        db = Database(AVLTree, self.path, save_on_exit=False)
+        self.assertListEqual(db.select(["value"], "third"), [[10], [20]])
+        self.assertListEqual(db.select(["name"], "first")[:2], [["name0"], ["name1"]])
+
+        db.set_table_format("first", "rows")
+        db.save()
+        self.assertFalse(is_columnar_file(os.path.join(self.path, "first")))
+        self.assertEqual(len(Database(AVLTree, self.path, save_on_exit=False).select(["id"], "first")), 10)
+
+    def test_lsm_tables(self):
+        """
+        Tests LSM table across saves, and converting tables to and from LSM format
+        """
+
+        db = self.create_database()
+        db.create_table("third", [("id", ColumnType.INT), ("name", ColumnType.SMALL_STRING)], 0, "lsm")
+        for i in range(100):
+            db.insert("third", [i % 20, f"name{i}"])
+        db.erase("third", 5)
+        db.set_table_format("first", "lsm")
+        db.save()
+        db.insert("third", [5, "again"])
+        db.erase("first", 3)
+        db.save()
+
+        db = Database(AVLTree, self.path, save_on_exit=False)
+        self.assertEqual(db.get_table("first").storage_format, "lsm")
+        self.assertListEqual(db.select(["id"], "first"), [[i] for i in range(10) if i != 3])
+        self.assertListEqual(db.select(["name"], "third")[25:31], [["again"]] + [[f"name{i}"] for i in range(6, 106, 20)])
+        self.assertEqual(DatabaseTable.read_metadata(os.path.join(self.path, "third"))[2], 96)
+
+        db.set_table_format("first", "rows")
+        db.drop_table("third")
+        db.save()
+        self.assertListEqual(sorted(os.listdir(self.path)), ["db_data.cnf", "first", "second"])
+        self.assertListEqual(
+            Database(Treap, self.path, save_on_exit=False).select(["id"], "first"), [[i] for i in range(10) if i != 3]
+        )
+
+    def test_convert_table(self):
+        """
+        Tests converting tables between tree types without rewriting their files,
+        and that converted tables keep their tree types after reopening
+        """
+
+        db = self.create_database()
+        with self.assertRaises(RuntimeError):
+            db.create_table("third@avl", [("id", ColumnType.INT)], 0)
+        inode = os.stat(os.path.join(self.path, "first")).st_ino
+        db.convert_table("first", "avl")
+        db.convert_table("second", SplayTree)
+        self.assertIs(db.get_table_tree_type("first"), AVLTree)
+        self.assertFalse(db.get_table("first").dirty)
+        self.assertListEqual(db.select(["name"], "first")[:2], [["name0"], ["name1"]])
+        with self.assertRaises(RuntimeError):
+            db.convert_table("first", "missing")
+        with self.assertRaises(RuntimeError):
+            db.convert_table("first", PagedBTree)
+        db.save()
+        self.assertEqual(os.stat(os.path.join(self.path, "first")).st_ino, inode)
+
+        db = Database(Treap, self.path, save_on_exit=False)
+        self.assertIs(db.get_table_tree_type("first"), AVLTree)
+        self.assertIs(db.get_table_tree_type("second"), SplayTree)
+        self.assertListEqual(db.select(["id"], "second"), [[i] for i in range(10)])
+        db.convert_table("second", Treap)
+        db.save()
+        with open(os.path.join(self.path, "db_data.cnf"), encoding="utf-8") as file:
+            self.assertListEqual(file.read().split("\n"), ["first@avl id name", "second id"])
+
+        db = Database(PagedBTree, self.path, save_on_exit=False)
+        db.preload(["second"])
+        db.convert_table("second", "rb")
+        db.insert("second", [10])
+        db.save()
+        self.assertFalse(PagedBTree.is_paged_file(os.path.join(self.path, "second")))
+        db = Database(PagedBTree, self.path, save_on_exit=False, mapped=True)
+        db.convert_table("second", "treap")
+        self.assertListEqual(db.select(["id"], "second"), [[i] for i in range(11)])
+        self.assertIsInstance(db.get_table("second").tree, Treap)
+
+    def test_adaptive_backends(self):
+        """
+        Tests that tables are migrated to backends matching their workload and decisions are logged
+        """
+
+        db = self.create_database()
+        db.set_adaptive_backends(interval=200, auto_migrate=True, advisor=BackendAdvisor(min_operations=100))
+        for i in range(300):
+            db.get_table("first").find(1 if i % 10 else i % 7)
+            db.select(["id"], "second")
+        self.assertIs(db.get_table_tree_type("first"), SplayTree)
+        self.assertIs(db.get_table_tree_type("second"), MediumBTree)
+
+        for i in range(400):
+            db.insert("first", [100 + i, "new"])
+        self.assertEqual(db.advise(["first"])[0].recommended, "treap")
+        self.assertIs(db.get_table_tree_type("first"), Treap)
+        self.assertEqual(len(db.select(["id"], "first")), 410)
+        # Later recommendations for the same workload keep tables where they are
+        self.assertListEqual([(d.table_name, d.recommended) for d in db.decision_log if d.migrated], [
+            ("first", "splay"), ("second", "medium-btree"), ("first", "treap")
+        ])
+
+        db.set_adaptive_backends(interval=10 ** 9, advisor=BackendAdvisor(min_operations=100))
+        for i in range(200):
+            db.get_table("second").find(i % 10)
+        decision = db.advise()[0]
+        self.assertEqual((decision.table_name, decision.recommended, decision.migrated), ("second", "avl", False))
+        self.assertIn("not migrated", str(decision))
+        self.assertLess(decision.stats["key_skew"], 0.2)
+
+    def test_sharded_table(self):
+        """
+        Tests routing, scans, aggregates and rebalancing of table sharded across processes
+        """
+
+        db = self.create_database()
+        db.create_table("big", [("id", ColumnType.INT), ("value", ColumnType.LONG)], 0)
+        keys = list(range(0, 3000, 2))
+        random.shuffle(keys)
+        for key in keys:
+            db.insert("big", [key, key * 10])
+        db.save()
+
+        sharded = db.shard_table("big", shards=3)
+        self.assertFalse(sharded.dirty)
+        self.assertEqual(len(sharded.boundaries), 2)
+        self.assertListEqual(sharded.shard_row_counts, [500, 500, 500])
+        self.assertListEqual([data_entry.columns for data_entry in db.get_table("big").find(20)], [[20, 200]])
+        session = QuerySession(db)
+        self.assertListEqual(session.execute("SELECT id FROM big WHERE id >= 994 AND id < 1004"), [
+            [994], [996], [998], [1000], [1002]
+        ])
+        self.assertListEqual(session.execute("SELECT id FROM big WHERE value = 29980"), [[2998]])
+        self.assertEqual(sharded.aggregate("count"), 1500)
+        self.assertEqual(sharded.aggregate("sum", 1, 0, 100), sum(range(0, 1010, 20)))
+        self.assertEqual(sharded.aggregate("max", 1, conditions=[(0, operator.lt, 1000)]), 9980)
+        self.assertIsNone(sharded.aggregate("min", 1, 5000))
+        with self.assertRaises(RuntimeError):
+            db.background_save()
+
+        # Growing keys go to the last shard until it is skewed enough to be rebalanced
+        for key in range(3000, 5000):
+            db.insert("big", [key, 0])
+        db.erase("big", 0)
+        counts = sharded.shard_row_counts
+        self.assertEqual(sum(counts), 3499)
+        self.assertLessEqual(max(counts), sharded.max_skew * sum(counts) / 3)
+        self.assertListEqual(db.select(["id"], "big"), [[key] for key in range(2, 3000, 2)] + [
+            [key] for key in range(3000, 5000)
+        ])
+        db.save()
+
+        self.assertEqual(len(Database(Treap, self.path, save_on_exit=False).select(["id"], "big")), 3499)
+        db.unshard_table("big")
+        self.assertFalse(getattr(db.get_table("big"), "sharded", False))
+        self.assertEqual(db.get_table("big").find(4998)[0].columns, [4998, 0])
+
+    def test_sharded_update_and_delete(self):
+        """
+        Tests UPDATE and DELETE through query session on sharded table, whose rows come from shard processes
+        """
+
+        db = self.create_database()
+        db.create_table("big", [("id", ColumnType.INT), ("value", ColumnType.LONG)], 0)
+        db.insert_many("big", [[key % 100, key] for key in range(300)])
+        db.shard_table("big", shards=2)
+        session = QuerySession(db)
+
+        self.assertEqual(session.execute("UPDATE big SET value = 1000 WHERE id = 1"), "Updated 3 rows in big")
+        self.assertEqual(session.execute("UPDATE big SET value = 2000 WHERE value = 150"), "Updated 1 rows in big")
+        self.assertEqual(session.execute("DELETE FROM big WHERE id = 2"), "Deleted 3 rows from big")
+        self.assertEqual(session.execute("DELETE FROM big WHERE id >= 90 AND value >= 200"), "Deleted 10 rows from big")
+        self.assertListEqual(session.execute("SELECT value FROM big WHERE id = 1"), [[1000], [1000], [1000]])
+        self.assertListEqual(session.execute("SELECT value FROM big WHERE id = 50"), [[50], [2000], [250]])
+        self.assertEqual(session.execute("SELECT * FROM big WHERE id = 2"), [])
+        self.assertEqual(len(session.execute("SELECT * FROM big")), 287)
+
+        db.save()
+        reopened = Database(Treap, self.path, save_on_exit=False)
+        self.assertListEqual([data_entry.columns[1] for data_entry in reopened.get_table("big").find(1)], [1000] * 3)
+        self.assertEqual(len(reopened.select(["id"], "big")), 287)
+
+    def test_drop_table(self):
+        """
+        Tests that file of dropped table is deleted on save
+        """
+
+        db = self.create_database()
+        db.drop_table("first")
+        db.save()
+
+        self.assertListEqual(sorted(os.listdir(self.path)), ["db_data.cnf", "second"])
+        self.assertListEqual(Database(Treap, self.path, save_on_exit=False).get_tables_names(), ["second"])
+
+    def test_save_on_exit(self):
+        """
+        Tests that save on exit can be disabled
+        """
+
+        db = self.create_database()
+        db.insert("second", [100])
+        del db
+        self.assertEqual(len(Database(Treap, self.path, save_on_exit=False).select(["id"], "second")), 10)
+
+        db = Database(Treap, self.path)
+        db.insert("second", [100])
+        del db
+        self.assertEqual(len(Database(Treap, self.path, save_on_exit=False).select(["id"], "second")), 11)
+
+    def test_background_save(self):
+        """
+        Tests that background save writes snapshot of the moment of fork and keeps later changes dirty
+        """
+
+        db = self.create_database()
+        db.insert("first", [100, "before"])
+        db.drop_table("second")
+        db.create_table("third", [("id", ColumnType.INT)], 0)
+        self.assertTrue(db.background_save())
+        self.assertFalse(db.background_save())
+        db.insert("first", [200, "after"])
+        db.wait_background_save()
+        self.assertFalse(db.background_save_running)
+        self.assertIsNone(db.background_save_error)
+
+        snapshot = Database(Treap, self.path, save_on_exit=False)
+        self.assertListEqual(snapshot.get_tables_names(), ["first", "third"])
+        self.assertEqual(len(snapshot.select(["id"], "first")), 11)
+        self.assertListEqual(sorted(os.listdir(self.tmp_dir.name)), ["db"])
+
+        db.save()
+        self.assertEqual(len(Database(Treap, self.path, save_on_exit=False).select(["id"], "first")), 12)
+
+        # Format and bloom filter changed during background save are written by the next save
+        self.assertTrue(db.background_save())
+        db.set_table_format("first", "columnar")
+        db.get_table("third").bloom_filter = True
+        db.wait_background_save()
+        self.assertTrue(db.get_table("first").dirty)
+        self.assertTrue(db.get_table("third").dirty)
+        db.save()
+        self.assertEqual(Database(Treap, self.path, save_on_exit=False).get_table("first").storage_format, "columnar")
+        self.assertTrue(Database(Treap, self.path, save_on_exit=False).get_table("third").bloom_filter)
+
+        # Clean tables stay clean and mapped, their files are hard-linked into the snapshot
+        mapped_db = Database(Treap, self.path, save_on_exit=False, mapped=True)
+        mapped_db.preload()
+        version = mapped_db.get_table("first").version
+        self.assertTrue(mapped_db.background_save())
+        mapped_db.wait_background_save()
+        self.assertTrue(mapped_db.get_table("first").mapped)
+        self.assertFalse(mapped_db.get_table("first").dirty)
+        self.assertEqual(mapped_db.get_table("first").version, version)
+        del mapped_db
+
+        # Value that does not fit INT column fails in the child, folder stays as it was
+        db.insert("third", [2 ** 40])
+        db.background_save()
+        with self.assertRaises(RuntimeError):
+            db.wait_background_save()
+        self.assertIn("error", db.background_save_error)
+        self.assertEqual(len(Database(Treap, self.path, save_on_exit=False).select(["id"], "third")), 0)
+        self.assertListEqual(sorted(os.listdir(self.tmp_dir.name)), ["db"])
+
+
+class TestWriteAheadLog(unittest.TestCase):
+    """
+    Tests crash recovery from write-ahead log
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "db")
+        self.wal_path = os.path.join(self.path, "db_wal.log")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def open_database(self) -> Database:
+        """
+        Opens database with write-ahead log, without saving on exit (simulates crash)
+        """
+
+        return Database(Treap, self.path, save_on_exit=False, use_wal=True, wal_batch_size=4)
+
+    def fill_database(self, db: Database):
+        """
+        Creates table and modifies it with every kind of operation
+        """
+
+        db.create_table("t", [("id", ColumnType.INT), ("name", ColumnType.SMALL_STRING)], 0)
+        for i in range(20):
+            db.insert("t", [i % 10, f"name{i}"])
+        db.erase("t", 3)
+        db.update("t", 4, [[4, "updated"], [40, "moved"]])
+        db.create_table("dropped", [("id", ColumnType.INT)], 0)
+        db.insert("dropped", [1])
+        db.drop_table("dropped")
+
+    def test_replay_after_crash(self):
+        """
+        Tests that modifications are recovered without save
+        """
+
+        db = self.open_database()
+        self.fill_database(db)
+        expected = db.select(["id", "name"], "t")
+        del db
+
+        db = self.open_database()
+        self.assertListEqual(db.get_tables_names(), ["t"])
+        self.assertListEqual(db.select(["id", "name"], "t"), expected)
+
+        db.save()
+        self.assertEqual(os.path.getsize(self.wal_path), 0)
+        del db
+        self.assertListEqual(self.open_database().select(["id", "name"], "t"), expected)
+
+    def test_replay_insert_many(self):
+        """
+        Tests batched inserts into empty and filled table against inserting rows one by one
+        """
+
+        db = self.open_database()
+        db.create_table("t", [("id", ColumnType.INT), ("name", ColumnType.SMALL_STRING)], 0)
+        db.create_table("expected", [("id", ColumnType.INT), ("name", ColumnType.SMALL_STRING)], 0)
+        for _ in range(2):
+            rows = [[random.randrange(50), f"name{i}"] for i in range(200)]
+            db.insert_many("t", rows)
+            for values in rows:
+                db.insert("expected", values)
+            self.assertListEqual(db.select(["id", "name"], "t"), db.select(["id", "name"], "expected"))
+        expected = db.select(["id", "name"], "t")
+        del db
+
+        self.assertListEqual(self.open_database().select(["id", "name"], "t"), expected)
+
+    def test_replay_var_strings(self):
+        """
+        Tests recovery of table with VAR_STRING key and DICT_STRING column from log
+        """
+
+        db = self.open_database()
+        db.create_table(
+            "v", [("name", ColumnType.VAR_STRING), ("text", ColumnType.VAR_STRING), ("kind", ColumnType.DICT_STRING)], 0
+        )
+        for i in range(10):
+            db.insert("v", [f"name{i}", "text" * i * 30, f"kind{i % 3}"])
+        db.erase("v", "name3")
+        expected = db.select(["name", "text", "kind"], "v")
+        del db
+
+        self.assertListEqual(self.open_database().select(["name", "text", "kind"], "v"), expected)
+
+    def test_replay_is_idempotent(self):
+        """
+        Tests crash after checkpoint wrote tables, but before log was emptied
+        """
+
+        db = self.open_database()
+        self.fill_database(db)
+        expected = db.select(["id", "name"], "t")
+        db.commit()
+        with open(self.wal_path, "rb") as file:
+            wal_content = file.read()
+        db.save()
+        del db
+
+        with open(self.wal_path, "wb") as file:
+            file.write(wal_content)
+
+        self.assertListEqual(self.open_database().select(["id", "name"], "t"), expected)
+
+    def test_background_save(self):
+        """
+        Tests that log records written after the fork survive the snapshot swap
+        """
+
+        db = self.open_database()
+        self.fill_database(db)
+        db.background_save()
+        db.insert("t", [77, "after fork"])
+        db.wait_background_save()
+        db.insert("t", [78, "after swap"])
+        expected = db.select(["id", "name"], "t")
+        del db
+
+        self.assertListEqual(self.open_database().select(["id", "name"], "t"), expected)
+
+    def test_torn_record(self):
+        """
+        Tests that incomplete record at the end of log is ignored
+        """
+
+        db = self.open_database()
+        self.fill_database(db)
+        expected = db.select(["id", "name"], "t")
+        del db
+
+        with open(self.wal_path, "ab") as file:
+            file.write(b"\x00\x00\x01\x00garbage")
+
+        db = self.open_database()
+        self.assertListEqual(db.select(["id", "name"], "t"), expected)
+        db.insert("t", [100, "after"])
+        del db
+        self.assertEqual(self.open_database().select(["name"], "t")[-1], ["after"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
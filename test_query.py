@@ -0,0 +1,305 @@
+"""
+Unit tests for SQL-like query parsing, plan caching and prepared statements
+"""
+
+import operator
+import os
+import random
+import tempfile
+import unittest
+
+from database import Database
+from query import PlanCache, QueryError, QuerySession, ResultCache, shape_tokens, split_statements, tokenize
+from treap import Treap
+
+
+class TestQuery(unittest.TestCase):
+    """
+    Tests query tokenizer, parser and compiled plans
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = Database(Treap, os.path.join(self.tmp_dir.name, "db"))
+        self.session = QuerySession(self.db, PlanCache())
+        self.session.execute("CREATE TABLE t (id INT, name SMALL_STRING, descr BIG_STRING)")
+
+    def tearDown(self):
+        del self.session
+        del self.db
+        self.tmp_dir.cleanup()
+
+    def test_shape_ignores_values(self):
+        """
+        Tests that queries differing only in values share one shape
+        """
+
+        first = shape_tokens(tokenize("INSERT INTO t VALUES (1, Abc, 'x y')"))
+        second = shape_tokens(tokenize("insert into T values (25, Other, \"z\")"))
+
+        self.assertEqual(first[0], second[0])
+        self.assertListEqual(first[1], [1, "Abc", "x y"])
+        self.assertListEqual(second[1], [25, "Other", "z"])
+
+    def test_plan_cache_hits(self):
+        """
+        Tests that repeated query shapes are parsed once
+        """
+
+        for i in range(10):
+            self.session.execute(f"INSERT INTO t VALUES {i} name{i} descr")
+
+        self.assertEqual(self.session.plan_cache.misses, 2)
+        self.assertEqual(self.session.plan_cache.hits, 9)
+        self.assertEqual(len(self.session.execute("SELECT * FROM t")), 10)
+
+    def test_select_where(self):
+        """
+        Tests SELECT with projection and WHERE conditions
+        """
+
+        for i in range(5):
+            self.session.execute(f"INSERT INTO t VALUES {i} Name{i} descr")
+
+        self.assertListEqual(
+            self.session.execute("SELECT name, id FROM t WHERE id >= 2 AND name != Name3"),
+            [["Name2", 2], ["Name4", 4]]
+        )
+        self.assertListEqual(self.session.execute("SELECT id FROM t WHERE id = 3"), [[3]])
+        self.assertListEqual(self.session.execute("SELECT id FROM t WHERE id = 7"), [])
+        self.assertListEqual(self.session.execute("SELECT id FROM t WHERE id > 1 AND id <= 3"), [[2], [3]])
+
+    def test_update_and_delete(self):
+        """
+        Tests UPDATE and DELETE queries
+        """
+
+        for i in range(4):
+            self.session.execute(f"INSERT INTO t VALUES {i % 2} Name{i} descr")
+
+        self.session.execute("UPDATE t SET descr = changed WHERE name = Name2")
+        self.session.execute("DELETE FROM t WHERE name = Name1")
+
+        self.assertListEqual(self.session.execute("SELECT * FROM t"), [
+            [0, "Name0", "descr"],
+            [0, "Name2", "changed"],
+            [1, "Name3", "descr"],
+        ])
+
+        self.session.execute("DELETE FROM t WHERE id = 0")
+        self.assertListEqual(self.session.execute("SELECT name FROM t"), [["Name3"]])
+
+    def test_update_key(self):
+        """
+        Tests that UPDATE moving rows to a key it has not reached yet does not match them again
+        """
+
+        for i in range(4):
+            self.session.execute(f"INSERT INTO t VALUES {i} n{i} descr")
+
+        self.assertEqual(self.session.execute("UPDATE t SET id = 3 WHERE id >= 1"), "Updated 3 rows in t")
+        self.assertListEqual(sorted(self.session.execute("SELECT id, name FROM t")), [
+            [0, "n0"], [3, "n1"], [3, "n2"], [3, "n3"]
+        ])
+        self.assertEqual(self.session.execute("UPDATE t SET id = 0 WHERE name = n2"), "Updated 1 rows in t")
+        self.assertListEqual(sorted(self.session.execute("SELECT id, name FROM t")), [
+            [0, "n0"], [0, "n2"], [3, "n1"], [3, "n3"]
+        ])
+
+    def test_update_and_delete_mapped(self):
+        """
+        Tests UPDATE and DELETE on table read from mapped file, whose rows are decoded on every read
+        """
+
+        for i in range(6):
+            self.session.execute(f"INSERT INTO t VALUES {i % 3} n{i} descr")
+        self.db.save()
+
+        session = QuerySession(Database(Treap, os.path.join(self.tmp_dir.name, "db"), save_on_exit=False, mapped=True))
+        self.assertEqual(session.execute("UPDATE t SET name = zz WHERE name = n2"), "Updated 1 rows in t")
+        self.assertEqual(session.execute("DELETE FROM t WHERE name = n3"), "Deleted 1 rows from t")
+        self.assertListEqual(session.execute("SELECT id, name FROM t"), [
+            [0, "n0"], [1, "n1"], [1, "n4"], [2, "zz"], [2, "n5"]
+        ])
+    def test_update_and_delete_lsm(self):
+        """
+        Tests UPDATE and DELETE on LSM table with rows both in runs and in memtable
+        """
+
+        self.db.set_table_format("t", "lsm")
+        for i in range(6):
+            self.session.execute(f"INSERT INTO t VALUES {i % 3} n{i} descr")
+        self.db.save()
+        self.session.execute("INSERT INTO t VALUES 2 n6 descr")
+
+        self.assertEqual(self.session.execute("UPDATE t SET name = zz WHERE name = n2"), "Updated 1 rows in t")
+        self.assertEqual(self.session.execute("DELETE FROM t WHERE id = 1"), "Deleted 2 rows from t")
+        self.assertEqual(self.session.execute("DELETE FROM t WHERE name = n3"), "Deleted 1 rows from t")
+        self.assertListEqual(self.session.execute("SELECT id, name FROM t"), [
+            [0, "n0"], [2, "zz"], [2, "n5"], [2, "n6"]
+        ])
+        self.db.save()
+        self.assertEqual(self.db.get_table_row_count("t"), 4)
+    def test_result_cache(self):
+        """
+        Tests that repeated SELECT results are cached until their table changes
+        """
+
+        session = QuerySession(self.db, PlanCache(), ResultCache())
+        for i in range(5):
+            session.execute(f"INSERT INTO t VALUES {i} name{i} descr")
+
+        first = session.execute("SELECT id FROM t WHERE id >= 2")
+        self.assertIs(session.execute("select id from t where id >= 2"), first)
+        self.assertListEqual(session.execute("SELECT id FROM t WHERE id >= ?", [3]), [[3], [4]])
+        self.assertEqual((session.result_cache.hits, session.result_cache.misses), (1, 2))
+
+        session.execute("DELETE FROM t WHERE id = 4")
+        self.assertListEqual(session.execute("SELECT id FROM t WHERE id >= 2"), [[2], [3]])
+        self.assertEqual(session.result_cache.invalidations, 1)
+
+        self.db.drop_table("t")
+        self.session.execute("CREATE TABLE t (id INT, name SMALL_STRING, descr BIG_STRING)")
+        self.assertListEqual(session.execute("SELECT id FROM t WHERE id >= 2"), [])
+
+        for i in range(5):
+            session.execute(f"INSERT INTO t VALUES {i} name{i} descr")
+        session.result_cache = ResultCache(capacity_bytes=1000)
+        session.execute("SELECT * FROM t")
+        session.execute("SELECT id FROM t")
+        session.execute("SELECT name FROM t")
+        self.assertLessEqual(session.result_cache.size_bytes, session.result_cache.capacity_bytes)
+        self.assertGreater(session.result_cache.evictions, 0)
+
+    def test_script_statements(self):
+        """
+        Tests splitting script into statements and compiling INSERTs for batching
+        """
+
+        self.assertListEqual(
+            split_statements("INSERT INTO t VALUES 1 'a;b' x; ;SELECT * FROM t;"),
+            ["INSERT INTO t VALUES 1 'a;b' x", "SELECT * FROM t"]
+        )
+        self.assertEqual(
+            self.session.compile_insert("INSERT INTO t VALUES 1 'a;b' x"),
+            ("insert into t values ? ? ?", "t", [1, "a;b", "x"])
+        )
+        self.assertIsNone(self.session.compile_insert("SELECT * FROM t"))
+        self.assertIsNone(self.session.compile_insert("INSERT INTO t VALUES ?, ?, ?"))
+        with self.assertRaises(QueryError):
+            self.session.compile_insert("INSERT INTO t VALUES abc name descr")
+        self.assertListEqual(self.session.execute("SELECT * FROM t"), [])
+
+    def test_prepared_statements(self):
+        """
+        Tests PREPARE, EXECUTE and DEALLOCATE
+        """
+
+        self.session.execute("PREPARE ins AS INSERT INTO t VALUES ?, ?, fixed")
+        self.session.execute("EXECUTE ins 5, 'with space'")
+        self.session.execute("EXECUTE ins USING (6, other)")
+
+        self.assertListEqual(self.session.execute("SELECT * FROM t WHERE id = ?", [5]), [
+            [5, "with space", "fixed"]
+        ])
+        self.assertEqual(len(self.session.execute("SELECT * FROM t")), 2)
+
+        self.session.execute("DEALLOCATE ins")
+        with self.assertRaises(QueryError):
+            self.session.execute("EXECUTE ins 7, name")
+
+    def test_plan_recompiled_after_schema_change(self):
+        """
+        Tests that cached plans are not reused for a recreated table
+        """
+
+        self.session.execute("INSERT INTO t VALUES 1 name descr")
+        self.db.drop_table("t")
+        self.session.execute("CREATE TABLE t (name SMALL_STRING, id INT)")
+        self.session.execute("INSERT INTO t VALUES name 1")
+
+        self.assertListEqual(self.session.execute("SELECT * FROM t"), [["name", 1]])
+
+    def test_columnar_table(self):
+        """
+        Tests CREATE TABLE with STORED AS clause
+        """
+
+        self.session.execute("CREATE TABLE c (id INT, value LONG) STORED AS COLUMNAR")
+        self.session.execute("INSERT INTO c VALUES 2 20")
+        self.session.execute("INSERT INTO c VALUES 1 10")
+        self.db.save()
+
+        self.assertEqual(self.db.get_table("c").storage_format, "columnar")
+        self.assertListEqual(self.session.execute("SELECT value FROM c"), [[10], [20]])
+        with self.assertRaises(QueryError):
+            self.session.execute("CREATE TABLE d (id INT) STORED AS heap")
+
+    def test_columnar_update_and_delete(self):
+        """
+        Tests UPDATE and DELETE on columnar table read from its file, whose rows are decoded on every read
+        """
+
+        self.session.execute("CREATE TABLE c (id INT, value LONG) STORED AS COLUMNAR")
+        for i in range(6):
+            self.session.execute(f"INSERT INTO c VALUES {i % 3} {i}")
+        self.db.save()
+
+        session = QuerySession(Database(Treap, os.path.join(self.tmp_dir.name, "db"), save_on_exit=False))
+        self.assertEqual(session.execute("UPDATE c SET value = 40 WHERE id = 1 AND value = 4"), "Updated 1 rows in c")
+        self.assertEqual(session.execute("DELETE FROM c WHERE value >= 5 AND value < 40"), "Deleted 1 rows from c")
+        self.assertListEqual(session.execute("SELECT id, value FROM c"), [[0, 0], [0, 3], [1, 1], [1, 40], [2, 2]])
+
+    def test_full_scan_conditions(self):
+        """
+        Tests WHERE on non-key columns for row and columnar tables against plain filtering
+        """
+
+        self.session.execute("CREATE TABLE s (id INT, amount LONG, tag SMALL_STRING, kind DICT_STRING)")
+        for i in range(500):
+            row = [
+                random.randrange(100), random.randrange(1000),
+                random.choice(["a", "b", "\u0457\u0436"]), random.choice(["x", "y", "\u0457"])
+            ]
+            self.session.execute("INSERT INTO s VALUES ?, ?, ?, ?", row)
+
+        ops = {"=": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+        queries = [("amount", op, value) for op in ops for value in [-1, 0, 500, 999, 2 ** 70]]
+        queries += [(column, op, value) for column in ["tag", "kind"] for op in ops for value in ["a", "b", "\u0457", "z"]]
+
+        for storage_format in ["rows", "columnar"]:
+            self.db.set_table_format("s", storage_format)
+            self.db.save()
+            session = QuerySession(Database(Treap, os.path.join(self.tmp_dir.name, "db"), save_on_exit=False))
+            expected_all = session.execute("SELECT * FROM s")
+            for column, op, value in queries:
+                col_ind = ["id", "amount", "tag", "kind"].index(column)
+                result = session.execute(f"SELECT * FROM s WHERE {column} {op} ?", [value])
+                self.assertListEqual(
+                    result,
+                    [row for row in expected_all if ops[op](row[col_ind], value)],
+                    msg=f"{storage_format}: {column} {op} {value}"
+                )
+
+    def test_errors(self):
+        """
+        Tests that invalid queries raise QueryError
+        """
+
+        for query in [
+            "",
+            "DROP TABLE t",
+            "SELECT id t",
+            "SELECT unknown FROM t",
+            "SELECT * FROM missing",
+            "INSERT INTO t VALUES 1",
+            "INSERT INTO t VALUES abc name descr",
+            "INSERT INTO t VALUES ?, ?, ?",
+            "CREATE TABLE a@avl (id INT)",
+        ]:
+            with self.assertRaises(QueryError, msg=query):
+                self.session.execute(query)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
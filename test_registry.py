@@ -0,0 +1,82 @@
+"""
+Unit tests for tree backend registry and CLI startup imports
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+import tree_registry
+from avl_tree import AVLTree
+from b_tree import SmallBTree
+from red_black_tree import RedBlackTree
+
+# Modules a CLI call using only AVL tree must not import at startup
+HEAVY_MODULES = ["numpy", "asyncio", "concurrent.futures", "splay_tree", "treap", "red_black_tree", "b_tree"]
+# Limit of cumulative import time of crud, microseconds (about 50 ms is usual, loaded machines are slower)
+CRUD_IMPORT_LIMIT = 500_000
+
+
+class TestTreeRegistry(unittest.TestCase):
+    """
+    Tests resolving tree backends by name
+    """
+
+    def test_builtin_backends(self):
+        """
+        Tests that names and aliases of builtin backends resolve case-insensitively
+        """
+
+        self.assertIs(tree_registry.get_tree_class("avl"), AVLTree)
+        self.assertIs(tree_registry.get_tree_class("AVL"), AVLTree)
+        self.assertIs(tree_registry.get_tree_class("sb"), SmallBTree)
+        self.assertIs(tree_registry.get_tree_class("small-btree"), SmallBTree)
+        self.assertIs(tree_registry.get_tree_class("rb"), RedBlackTree)
+        self.assertIn("treap", tree_registry.backend_names())
+        with self.assertRaises(ValueError):
+            tree_registry.get_tree_class("missing")
+
+    def test_register_backend(self):
+        """
+        Tests registering backend by class and by "module:Class" target
+        """
+
+        for name in ["test-avl", "tavl", "test-rb", "test-broken"]:
+            self.addCleanup(tree_registry._backends.pop, name, None)
+
+        tree_registry.register_backend(["test-avl", "tavl"], "avl_tree:AVLTree")
+        tree_registry.register_backend("test-rb", RedBlackTree)
+        tree_registry.register_backend("test-broken", "avl_tree:MissingTree")
+        self.assertIs(tree_registry.get_tree_class("TAVL"), AVLTree)
+        self.assertIs(tree_registry.get_tree_class("test-rb"), RedBlackTree)
+        with self.assertRaises(ValueError):
+            tree_registry.get_tree_class("test-broken")
+
+    def test_startup_imports(self):
+        """
+        Tests that CLI resolving one backend does not import other backends or heavy dependencies
+        """
+
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c",
+             "import sys, crud; crud.get_tree_class('avl'); print(*sys.modules)"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+        )
+        # Lines are "import time: self [us] | cumulative | module", nested modules are indented
+        imported = {}
+        for line in result.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[1].strip().isdigit():
+                imported[parts[2].strip()] = int(parts[1])
+
+        # Backend module is imported by importlib, which importtime does not report
+        modules = set(result.stdout.split())
+        self.assertIn("avl_tree", modules)
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, modules)
+        self.assertLess(imported["crud"], CRUD_IMPORT_LIMIT)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
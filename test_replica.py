@@ -0,0 +1,81 @@
+"""
+Unit tests for read replicas
+"""
+
+import os
+import tempfile
+import unittest
+
+from avl_tree import AVLTree
+from data_entry import ColumnType
+from database import Database
+from paged_b_tree import PagedBTree
+from query import QueryError
+from replica import ReplicaSet
+
+
+class TestReplicaSet(unittest.TestCase):
+    """
+    Tests replicas forked from loaded database
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "db")
+        self.db = Database(AVLTree, self.path, save_on_exit=False)
+        self.db.create_table("t", [("id", ColumnType.INT), ("name", ColumnType.SMALL_STRING)], 0)
+        self.db.insert_many("t", [[i, f"name{i}"] for i in range(100)])
+        self.db.save()
+
+    def tearDown(self):
+        del self.db
+        self.tmp_dir.cleanup()
+
+    def test_reads_and_writes(self):
+        """
+        Tests that replicas serve reads and see writes made before them, in order
+        """
+
+        replicas = ReplicaSet(self.db, replicas=2)
+        try:
+            self.assertEqual(replicas.execute("SELECT name FROM t WHERE id = ?", [5]), [["name5"]])
+            futures = [replicas.submit("SELECT id FROM t WHERE id < ?", [3]) for _ in range(4)]
+            self.assertListEqual([future.result() for future in futures], [[[0], [1], [2]]] * 4)
+
+            replicas.execute("INSERT INTO t VALUES ?, ?", [100, "new"])
+            replicas.execute("DELETE FROM t WHERE id = ?", [0])
+            replicas.execute("UPDATE t SET name = ? WHERE id = ?", ["changed", 1])
+            for _ in range(2):
+                self.assertListEqual(replicas.execute("SELECT name FROM t WHERE id <= ?", [1]), [["changed"]])
+                self.assertListEqual(replicas.execute("SELECT name FROM t WHERE id = ?", [100]), [["new"]])
+
+            # Changes made to database directly are replicated too
+            self.db.create_table("u", [("id", ColumnType.INT)], 0, "lsm")
+            self.db.insert_many("u", [[i] for i in range(10)])
+            self.db.drop_table("t")
+            self.assertEqual(replicas.sequence, 15)
+            self.assertTrue(replicas.wait_applied(timeout=10))
+            self.assertListEqual([(lag["changes"], lag["seconds"]) for lag in replicas.lag()], [(0, 0.0)] * 2)
+            self.assertEqual(len(replicas.execute("SELECT * FROM u")), 10)
+            with self.assertRaises(QueryError):
+                replicas.execute("SELECT * FROM t")
+            with self.assertRaises(QueryError):
+                replicas.submit("INSERT INTO u VALUES 1").result()
+        finally:
+            replicas.close()
+
+        # Replicas never write files, only the writer does (LSM table writes its manifest at once)
+        self.assertListEqual(sorted(os.listdir(self.path)), ["db_data.cnf", "t", "u"])
+
+    def test_on_disk_tables(self):
+        """
+        Tests that tables written in place can not be shared with replicas
+        """
+
+        db = Database(PagedBTree, self.path, save_on_exit=False)
+        with self.assertRaises(RuntimeError):
+            ReplicaSet(db)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
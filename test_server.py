@@ -0,0 +1,84 @@
+"""
+Unit tests for asyncio query server and client
+"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+from database import Database
+from query import QueryError
+from query_server import QueryClient, QueryServer, encode_frame, read_frame
+from treap import Treap
+
+
+class TestQueryServer(unittest.IsolatedAsyncioTestCase):
+    """
+    Tests query server over loopback connections
+    """
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = Database(Treap, os.path.join(self.tmp_dir.name, "db"), save_on_exit=False)
+        self.server = QueryServer(self.db, workers=2, chunk_rows=10)
+        self.port = await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+        del self.db
+        self.tmp_dir.cleanup()
+
+    async def test_pipelined_requests(self):
+        """
+        Tests that pipelined requests of one connection run and are answered in order
+        """
+
+        client = await QueryClient.connect(port=self.port)
+        await client.execute("CREATE TABLE t (id INT, name SMALL_STRING)")
+        results = await asyncio.gather(*(
+            client.execute("INSERT INTO t VALUES ?, ?", [i, f"name{i}"]) for i in range(100)
+        ), client.execute("SELECT id FROM t WHERE id < ?", [25]))
+
+        self.assertEqual(results[0], "Successfully inserted data into t")
+        self.assertListEqual(results[-1], [[i] for i in range(25)])
+        with self.assertRaises(QueryError):
+            await client.execute("SELECT missing FROM t")
+        self.assertEqual(len(await client.execute("SELECT * FROM t")), 100)
+        await client.close()
+
+    async def test_streaming_and_concurrent_clients(self):
+        """
+        Tests that large results arrive in parts and several clients are served at once
+        """
+
+        clients = [await QueryClient.connect(port=self.port) for _ in range(5)]
+        await clients[0].execute("CREATE TABLE t (id INT)")
+        await asyncio.gather(*(
+            client.execute(f"INSERT INTO t VALUES {i * 5 + j}")
+            for j, client in enumerate(clients) for i in range(20)
+        ))
+
+        parts = [part async for part in clients[1].stream("SELECT id FROM t")]
+        self.assertEqual(len(parts), 10)
+        self.assertListEqual([row for part in parts for row in part], [[i] for i in range(100)])
+        self.assertEqual(self.server.connections, 5)
+        for client in clients:
+            await client.close()
+
+    async def test_bad_frame(self):
+        """
+        Tests that malformed request gets error and connection is closed
+        """
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(encode_frame(["not", "request"]))
+        writer.write(b"\0\0\0\3abc")
+        self.assertIn("error", await read_frame(reader))
+        self.assertIn("Bad request", (await read_frame(reader))["error"])
+        self.assertIsNone(await read_frame(reader))
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -2,10 +2,14 @@
 Unit tests to check trees implementations correctness
 """
 
+import os
+import tempfile
 import unittest
 import random
 
-from data_entry import DataEntry
+from data_entry import ColumnType, DataEntry
+from lsm_tree import LsmTree
+from paged_b_tree import PagedBTree
 from unbalanced_tree import UnbalancedTree
 from splay_tree import SplayTree
 from avl_tree import AVLTree
@@ -190,5 +194,225 @@ class TestTree(unittest.TestCase):
                     sorted_postorder.sort(key=lambda data : data.columns[key_col])
                     self.assertListEqual(tree.inorder(), sorted_postorder)
 
+    def test_iter_inorder(self):
+        """
+        Tests that lazy in-order walk matches inorder
+        Does not work if inorder or insert fails
+        """
+
+        tests_count = 10
+        test_size = 300
+
+        for TreeType in TREES_FOR_TEST:
+            for _ in range(tests_count):
+                tree = TreeType(0)
+                for _ in range(test_size):
+                    tree.insert(DataEntry([random.randint(0, test_size // 2)]))
+
+                self.assertListEqual(list(tree.iter_inorder()), tree.inorder())
+
+    def test_bulk_build(self):
+        """
+        Tests that tree built from sorted entries behaves like tree built by inserts
+        Does not work if insert, erase, find or inorder fails
+        """
+
+        test_size = 300
+
+        for TreeType in TREES_FOR_TEST:
+            values = sorted(
+                (DataEntry([random.randint(0, test_size // 3), i]) for i in range(test_size)),
+                key=lambda data: data.columns[0]
+            )
+            tree = TreeType(0)
+            tree.bulk_build(values)
+            expected = TreeType(0)
+            for value in values:
+                expected.insert(value)
+            self.assertListEqual(tree.inorder(), values)
+
+            for i in range(test_size):
+                key = random.randint(0, test_size // 2)
+                if i % 3 == 0:
+                    tree.erase(key)
+                    expected.erase(key)
+                else:
+                    tree.insert(DataEntry([key, -i]))
+                    expected.insert(DataEntry([key, -i]))
+                self.assertListEqual(tree.find(key), expected.find(key))
+
+            self.assertListEqual(tree.inorder(), expected.inorder())
+
+class TestPagedBTree(unittest.TestCase):
+    """
+    Tests disk-resident B-tree against in-memory one
+    """
+
+    column_types = [ColumnType.INT, ColumnType.SMALL_STRING]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, "tree")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_tree(self) -> PagedBTree:
+        """
+        Creates tree with small pages and buffer pool, so that pages are evicted often
+        """
+
+        return PagedBTree.create(self.filename, 0, self.column_types, page_size=128, cache_bytes=0)
+
+    def test_matches_memory_tree(self):
+        """
+        Tests random inserts and erases with duplicate keys, across reopening the file
+        """
+
+        tree = self.create_tree()
+        expected = AVLTree(0)
+        self.assertGreaterEqual(tree.page_size, 128)
+
+        for step in range(3000):
+            key = random.randrange(300)
+            if random.random() < 0.25:
+                tree.erase(key)
+                expected.erase(key)
+            else:
+                data_entry = DataEntry([key, f"value{step}"])
+                tree.insert(data_entry)
+                expected.insert(data_entry)
+
+            if step % 1000 == 999:
+                tree.close()
+                tree = PagedBTree.open(self.filename, cache_bytes=0)
+
+        self.assertListEqual(tree.inorder(), expected.inorder())
+        self.assertListEqual(list(tree.iter_inorder()), expected.inorder())
+        self.assertEqual(len(tree), len(expected.inorder()))
+        self.assertEqual(sorted(tree.preorder(), key=str), sorted(expected.inorder(), key=str))
+        for key in range(-1, 301):
+            self.assertListEqual(tree.find(key), expected.find(key))
+        self.assertListEqual(
+            tree.find_range(100, 150),
+            [data_entry for data_entry in expected.inorder() if 100 <= data_entry.columns[0] <= 150]
+        )
+        self.assertLessEqual(len(tree.pool), tree.pool.capacity)
+        self.assertGreater(tree.pool.evictions, 0)
+        tree.close()
+
+    def test_free_pages_reused(self):
+        """
+        Tests that pages of erased rows are reused instead of growing the file
+        """
+
+        tree = self.create_tree()
+        for key in range(500):
+            tree.insert(DataEntry([key, "name"]))
+        tree.flush()
+        size = os.path.getsize(self.filename)
+
+        for key in range(500):
+            tree.erase(key)
+        self.assertListEqual(tree.inorder(), [])
+        for key in range(500):
+            tree.insert(DataEntry([key, "other"]))
+        tree.close()
+
+        self.assertEqual(os.path.getsize(self.filename), size)
+        self.assertEqual(len(PagedBTree.open(self.filename).inorder()), 500)
+
+
+class TestLsmTree(unittest.TestCase):
+    """
+    Tests LSM tree against in-memory one
+    """
+
+    column_types = [ColumnType.INT, ColumnType.SMALL_STRING]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, "tree")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def check_matches(self, tree: LsmTree, expected: AVLTree):
+        """
+        Compares all reads of both trees
+        """
+
+        self.assertListEqual(tree.inorder(), expected.inorder())
+        self.assertEqual(len(tree), len(expected.inorder()))
+        for key in range(-1, 301):
+            self.assertListEqual(tree.find(key), expected.find(key))
+        self.assertListEqual(
+            tree.find_range(100, 150),
+            [data_entry for data_entry in expected.inorder() if 100 <= data_entry.columns[0] <= 150]
+        )
+
+    def test_matches_memory_tree(self):
+        """
+        Tests random inserts and erases with duplicate keys through memtable flushes,
+        compactions and reopening the file
+        """
+
+        tree = LsmTree.create(self.filename, 0, self.column_types, Treap, memtable_rows=50, fanin=3)
+        expected = AVLTree(0)
+
+        for step in range(3000):
+            key = random.randrange(300)
+            if random.random() < 0.25:
+                tree.erase(key)
+                expected.erase(key)
+            else:
+                data_entry = DataEntry([key, f"value{step}"])
+                tree.insert(data_entry)
+                expected.insert(data_entry)
+
+            if step % 1000 == 499:
+                tree.flush()
+                tree.wait_compaction()
+                tree.close()
+                tree = LsmTree.open(self.filename, Treap, memtable_rows=50, fanin=3)
+
+        self.assertGreater(tree.compactions, 0)
+        self.check_matches(tree, expected)
+
+        tree.compact()
+        self.assertEqual(tree.runs_count, 1)
+        self.check_matches(tree, expected)
+        tree.flush()
+        tree.close()
+
+        # Merged runs are deleted by flush, only manifest and the compacted run remain
+        table_files = [os.path.basename(filename) for filename in LsmTree.table_files(self.filename)]
+        self.assertEqual(len(table_files), 2)
+        self.assertListEqual(sorted(os.listdir(self.tmp_dir.name)), sorted(table_files))
+        reopened = LsmTree.open(self.filename, AVLTree)
+        self.check_matches(reopened, expected)
+        reopened.close()
+        self.assertEqual(LsmTree.read_metadata(self.filename), (0, self.column_types, len(expected.inorder())))
+
+    def test_unsaved_runs_discarded(self):
+        """
+        Tests that runs flushed after the last saved manifest are deleted on open
+        """
+
+        tree = LsmTree.create(self.filename, 0, self.column_types, AVLTree, memtable_rows=10,
+                              background_compaction=False)
+        for key in range(25):
+            tree.insert(DataEntry([key, "saved"]))
+        tree.flush()
+        for key in range(25):
+            tree.insert(DataEntry([key, "lost"]))
+        tree.close()
+
+        reopened = LsmTree.open(self.filename, AVLTree)
+        self.assertListEqual([data_entry.columns[1] for data_entry in reopened.inorder()], ["saved"] * 25)
+        self.assertEqual(len(LsmTree.table_files(self.filename)), len(os.listdir(self.tmp_dir.name)))
+        reopened.close()
+
+
 if __name__ == "__main__":
     unittest.main(verbosity=2)
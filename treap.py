@@ -4,6 +4,8 @@ Contains randomized cartesian tree (treap) representation
 
 import random
 
+from collections.abc import Iterator
+
 from data_entry import DataEntry
 from abstract_tree import AbstractTree, AbstractTreeNode
 
@@ -63,6 +65,26 @@ class Treap(AbstractTree):
 
         self.__root = insert_recursive(self.__root)
 
+    def bulk_build(self, data_entries) -> None:
+        if self.__root is not None:
+            super().bulk_build(data_entries)
+            return
+
+        # Cartesian tree of sorted keys: right spine of nodes is kept on the stack
+        stack = []
+        for bucket in self._sorted_buckets(data_entries):
+            node = TreapNode(bucket[0])
+            node.data = bucket
+            last = None
+            while stack and stack[-1].priority > node.priority:
+                last = stack.pop()
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+
+        self.__root = stack[0] if stack else None
+
     def find(self, key) -> list[DataEntry]:
         if self.__root is None:
             return []
@@ -129,6 +151,9 @@ class Treap(AbstractTree):
 
         return result
 
+    def iter_inorder(self) -> Iterator[DataEntry]:
+        return self._iter_binary_inorder(self.__root)
+
     def preorder(self) -> list[DataEntry]:
         def preorder_recursive(node, result):
             if node is None:
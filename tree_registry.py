@@ -0,0 +1,108 @@
+"""
+Registry of tree backends by name. Backend modules are imported only when their name
+is first resolved, so programs using one tree type do not load the others.
+
+Third-party backends are found through "sbbst.tree_backends" entry points: entry point
+name is the backend name, its value is "module:Class", e.g. in pyproject.toml
+
+    [project.entry-points."sbbst.tree_backends"]
+    skiplist = "my_package.skiplist:SkipListTree"
+"""
+
+import importlib
+
+ENTRY_POINT_GROUP = "sbbst.tree_backends"
+
+_BUILTIN_BACKENDS = {
+    ("avl",): "avl_tree:AVLTree",
+    ("sb", "small-btree"): "b_tree:SmallBTree",
+    ("mb", "medium-btree"): "b_tree:MediumBTree",
+    ("bb", "big-btree"): "b_tree:BigBTree",
+    ("b23", "two-three-tree"): "b_tree:TwoThreeTree",
+    ("pb", "paged-btree"): "paged_b_tree:PagedBTree",
+    ("rb", "red-black"): "red_black_tree:RedBlackTree",
+    ("sp", "splay"): "splay_tree:SplayTree",
+    ("tr", "treap"): "treap:Treap",
+    ("ub", "unbalanced"): "unbalanced_tree:UnbalancedTree",
+}
+
+# Name to "module:Class" target, or to class once it is imported
+_backends = {name: target for names, target in _BUILTIN_BACKENDS.items() for name in names}
+_entry_points_loaded = False
+
+
+def register_backend(names: str | list[str], target) -> None:
+    """
+    Registers tree backend under one or several names (replacing existing ones)
+
+    Args:
+        names: Backend name or list of aliases, names are case-insensitive
+        target: Tree class, or "module:Class" string imported on first use
+    """
+
+    for name in [names] if isinstance(names, str) else names:
+        _backends[name.lower()] = target
+
+
+def get_tree_class(name: str):
+    """
+    Gets tree class by backend name (or by "module:Class" target of unregistered class),
+    importing its module on first use
+
+    Raises:
+        ValueError: If no backend has this name or its module can not be imported
+    """
+
+    if ":" in name:
+        register_backend(name, name)
+    name = name.lower()
+    if name not in _backends:
+        _load_entry_points()
+    if name not in _backends:
+        raise ValueError(f"{name} is not a valid tree type")
+
+    target = _backends[name]
+    if isinstance(target, str):
+        module_name, _, class_name = target.partition(":")
+        try:
+            tree_class = getattr(importlib.import_module(module_name), class_name)
+        except (ImportError, AttributeError) as e:
+            raise ValueError(f"Tree backend {name} ({target}) can not be loaded: {e}") from e
+        # Aliases of the same target share imported class
+        for alias, alias_target in _backends.items():
+            if alias_target == target:
+                _backends[alias] = tree_class
+        target = tree_class
+    return target
+
+
+def backend_name(tree_class) -> str:
+    """
+    Gets name tree class is registered under (the last, long alias of builtin backends),
+    "module:Class" target if it is not registered. get_tree_class resolves the result back to the class
+    """
+
+    target = f"{tree_class.__module__}:{tree_class.__qualname__}"
+    names = [name for name, backend in _backends.items() if backend is tree_class or backend == target]
+    return names[-1] if names else target
+
+
+def backend_names() -> list[str]:
+    """
+    Gets names of all known backends, entry points included
+    """
+
+    _load_entry_points()
+    return sorted(_backends)
+
+
+def _load_entry_points() -> None:
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+
+    # importlib.metadata scans installed distributions, so it is done only for unknown names
+    from importlib.metadata import entry_points
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        _backends.setdefault(entry_point.name.lower(), entry_point.value)
@@ -2,6 +2,8 @@
 Contains unbalanced binary tree representation
 """
 
+from collections.abc import Iterator
+
 from data_entry import DataEntry
 from abstract_tree import AbstractTree, AbstractTreeNode
 
@@ -60,6 +62,18 @@ class UnbalancedTree(AbstractTree):
                 curr_node.data.append(data_entry)
                 return
 
+    def bulk_build(self, data_entries) -> None:
+        if self.__root is not None:
+            super().bulk_build(data_entries)
+            return
+
+        def make_node(bucket, _):
+            node = UnbalancedTreeNode(bucket[0])
+            node.data = bucket
+            return node
+
+        self.__root = self._build_binary(self._sorted_buckets(data_entries), make_node)
+
     def find(self, key) -> list[DataEntry]:
         curr_node = self.__root
 
@@ -117,6 +131,9 @@ class UnbalancedTree(AbstractTree):
 
         return result
 
+    def iter_inorder(self) -> Iterator[DataEntry]:
+        return self._iter_binary_inorder(self.__root)
+
     def preorder(self) -> list[DataEntry]:
         def preorder_recursive(node, result):
             if node is None:
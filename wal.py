@@ -0,0 +1,289 @@
+"""
+Implements write-ahead log of database modifications
+
+Every record describes resulting state rather than an operation: PUT stores the whole
+bucket of rows for a key after modification, ERASE says the bucket is empty, CREATE
+resets a table to empty. Replaying such records on top of any table files written
+since the log was started gives the same result, so a crash in the middle of
+checkpoint can never apply a change twice.
+"""
+
+import os
+import struct
+import threading
+import zlib
+
+from data_entry import RowLayout
+
+
+class WriteAheadLog:
+    """
+    Append-only log file with group commit
+    """
+
+    OP_CREATE = 1
+    OP_DROP = 2
+    OP_PUT = 3
+    OP_ERASE = 4
+
+    __record_header = struct.Struct(">II")
+    __short = struct.Struct(">H")
+    __count = struct.Struct(">I")
+
+    def __init__(self, filename: str, batch_size: int = 1, sync_interval: float = 0.0):
+        """
+        Args:
+            filename: Log file path, file is created on first append
+            batch_size: Records written between fsync calls (group commit size)
+            sync_interval: If positive, unsynced records are also fsynced by background
+                thread at least this often (in seconds)
+        """
+
+        self.__filename = filename
+        self.__batch_size = max(1, batch_size)
+        self.__sync_interval = sync_interval
+        self.__file = None
+        self.__pending = 0
+        self.__lock = threading.Lock()
+        self.__closed = threading.Event()
+        self.__sync_thread = None
+
+    @property
+    def filename(self) -> str:
+        """
+        Gets log file path
+        """
+
+        return self.__filename
+
+    @property
+    def pending(self) -> int:
+        """
+        Gets number of appended records not yet fsynced
+        """
+
+        return self.__pending
+
+    def log_create(self, table_name: str, key_col: int, columns: list[tuple[str, int]],
+                   storage_format: str = "rows") -> None:
+        """
+        Logs creation of empty table
+        """
+
+        body = [self.__short.pack(key_col), self.__short.pack(len(columns))]
+        for column_name, column_type in columns:
+            body.append(self.__encode_name(column_name))
+            body.append(bytes([column_type]))
+        body.append(self.__encode_name(storage_format))
+        self.__append(WriteAheadLog.OP_CREATE, table_name, b"".join(body))
+
+    def log_drop(self, table_name: str) -> None:
+        """
+        Logs deletion of table
+        """
+
+        self.__append(WriteAheadLog.OP_DROP, table_name, b"")
+
+    def log_put(self, table_name: str, layout: RowLayout, rows: list[list]) -> None:
+        """
+        Logs new content of the bucket for one key (all rows share the key).
+        Strings of VAR_STRING and DICT_STRING columns follow the rows as in table file
+        """
+
+        heap, dictionaries = layout.new_strings()
+        encoded = b"".join(layout.encode(row, heap, dictionaries) for row in rows)
+        strings = layout.encode_strings(heap, dictionaries)
+        self.__append(WriteAheadLog.OP_PUT, table_name, self.__count.pack(len(rows)) + encoded + strings)
+
+    def log_erase(self, table_name: str, key_layout: RowLayout, key) -> None:
+        """
+        Logs that bucket for key is empty
+        """
+
+        heap, dictionaries = key_layout.new_strings()
+        encoded = key_layout.encode([key], heap, dictionaries)
+        self.__append(WriteAheadLog.OP_ERASE, table_name, encoded + key_layout.encode_strings(heap, dictionaries))
+
+    def replay(self, get_table):
+        """
+        Reads valid records of the log, stops at first torn or corrupted record and cuts it off.
+
+        Args:
+            get_table: Callback returning DatabaseTable by name, used to decode rows
+                of records; it is called after all previous records were applied
+
+        Yields:
+            ("create", table_name, key_col, columns, storage_format), ("drop", table_name),
+            ("put", table_name, rows) or ("erase", table_name, key)
+        """
+
+        if not os.path.exists(self.__filename):
+            return
+
+        with open(self.__filename, "rb") as file:
+            content = file.read()
+
+        offset = 0
+        header_size = self.__record_header.size
+        while offset + header_size <= len(content):
+            length, checksum = self.__record_header.unpack_from(content, offset)
+            payload = content[offset + header_size:offset + header_size + length]
+            if len(payload) != length or zlib.crc32(payload) != checksum:
+                break
+            offset += header_size + length
+            yield self.__decode(payload, get_table)
+
+        if offset != len(content):
+            with open(self.__filename, "r+b") as file:
+                file.truncate(offset)
+                file.flush()
+                os.fsync(file.fileno())
+
+    def size(self) -> int:
+        """
+        Gets size of log in bytes, appended records included
+        """
+
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.flush()
+                return self.__file.tell()
+            return os.path.getsize(self.__filename) if os.path.exists(self.__filename) else 0
+
+    def drop_prefix(self, size: int) -> None:
+        """
+        Removes first size bytes of log (records checkpointed by background save),
+        records appended after them are kept
+        """
+
+        with self.__lock:
+            self.__sync_locked()
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+            if not os.path.exists(self.__filename):
+                return
+
+            with open(self.__filename, "rb") as file:
+                file.seek(size)
+                rest = file.read()
+            with open(f"{self.__filename}.tmp", "wb") as file:
+                file.write(rest)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(f"{self.__filename}.tmp", self.__filename)
+
+    def sync(self) -> None:
+        """
+        Forces all appended records to disk
+        """
+
+        with self.__lock:
+            self.__sync_locked()
+
+    def truncate(self) -> None:
+        """
+        Empties log once its records are checkpointed into table files
+        """
+
+        with self.__lock:
+            if self.__file is None:
+                if not os.path.exists(self.__filename):
+                    return
+                self.__open_locked()
+            self.__file.truncate(0)
+            self.__file.seek(0)
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+            self.__pending = 0
+
+    def close(self) -> None:
+        """
+        Syncs and closes log file, it will be reopened by next append
+        """
+
+        self.__closed.set()
+        with self.__lock:
+            self.__sync_locked()
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+        if self.__sync_thread is not None and self.__sync_thread is not threading.current_thread():
+            self.__sync_thread.join()
+        self.__sync_thread = None
+
+    def __append(self, op: int, table_name: str, body: bytes) -> None:
+        payload = bytes([op]) + self.__encode_name(table_name) + body
+        record = self.__record_header.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self.__lock:
+            if self.__file is None:
+                self.__open_locked()
+            self.__file.write(record)
+            self.__pending += 1
+            if self.__pending >= self.__batch_size:
+                self.__sync_locked()
+
+    def __open_locked(self) -> None:
+        folder = os.path.dirname(self.__filename)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.__file = open(self.__filename, "ab")
+
+        if self.__sync_interval > 0 and self.__sync_thread is None:
+            self.__closed.clear()
+            self.__sync_thread = threading.Thread(target=self.__sync_periodically, daemon=True)
+            self.__sync_thread.start()
+
+    def __sync_locked(self) -> None:
+        if self.__file is not None and self.__pending:
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+        self.__pending = 0
+
+    def __sync_periodically(self) -> None:
+        while not self.__closed.wait(self.__sync_interval):
+            self.sync()
+
+    def __encode_name(self, name: str) -> bytes:
+        encoded = name.encode("utf-8")
+        return self.__short.pack(len(encoded)) + encoded
+
+    def __decode_name(self, payload: bytes, offset: int) -> tuple[str, int]:
+        (length,) = self.__short.unpack_from(payload, offset)
+        offset += self.__short.size
+        return payload[offset:offset + length].decode("utf-8"), offset + length
+
+    def __decode(self, payload: bytes, get_table) -> tuple:
+        op = payload[0]
+        table_name, offset = self.__decode_name(payload, 1)
+
+        match op:
+            case WriteAheadLog.OP_CREATE:
+                (key_col,) = self.__short.unpack_from(payload, offset)
+                (columns_count,) = self.__short.unpack_from(payload, offset + self.__short.size)
+                offset += self.__short.size * 2
+                columns = []
+                for _ in range(columns_count):
+                    column_name, offset = self.__decode_name(payload, offset)
+                    columns.append((column_name, payload[offset]))
+                    offset += 1
+                storage_format = self.__decode_name(payload, offset)[0]
+                return ("create", table_name, key_col, columns, storage_format)
+            case WriteAheadLog.OP_DROP:
+                return ("drop", table_name)
+            case WriteAheadLog.OP_PUT:
+                (count,) = self.__count.unpack_from(payload, offset)
+                offset += self.__count.size
+                layout = get_table(table_name).layout
+                strings_offset = offset + count * layout.row_size
+                heap, dictionaries = layout.decode_strings(payload[strings_offset:])
+                rows = list(layout.iter_decode(memoryview(payload)[offset:strings_offset], heap, dictionaries))
+                return ("put", table_name, rows)
+            case WriteAheadLog.OP_ERASE:
+                key_layout = get_table(table_name).key_layout
+                heap, dictionaries = key_layout.decode_strings(payload[offset + key_layout.row_size:])
+                key = key_layout.decode(payload[offset:offset + key_layout.row_size], heap, dictionaries)[0]
+                return ("erase", table_name, key)
+            case _:
+                raise RuntimeError(f"Unknown write-ahead log record type {op}")
@@ -0,0 +1,174 @@
+"""
+Workload statistics of tables and advisor choosing tree backend for them
+(see Database.set_adaptive_backends)
+"""
+
+import time
+from collections import Counter, deque
+
+
+class WorkloadStats:
+    """
+    Counts operations served by table tree and keeps window of recently read keys.
+    Lookups answered by key cache or bloom filter and scans of cached column batch
+    do not reach the tree, so they are not counted
+    """
+
+    def __init__(self, window: int = 1024):
+        """
+        Args:
+            window: Number of recent point read keys used to estimate key skew
+        """
+
+        self.point_reads = 0
+        self.range_scans = 0
+        self.writes = 0
+        self.__recent_keys = deque(maxlen=window)
+
+    def record_read(self, key) -> None:
+        """
+        Records point read of key
+        """
+
+        self.point_reads += 1
+        self.__recent_keys.append(key)
+
+    def record_scan(self) -> None:
+        """
+        Records range or full scan
+        """
+
+        self.range_scans += 1
+
+    def record_write(self, count: int = 1) -> None:
+        """
+        Records inserted or erased rows
+        """
+
+        self.writes += count
+
+    @property
+    def operations(self) -> int:
+        """
+        Gets number of recorded operations
+        """
+
+        return self.point_reads + self.range_scans + self.writes
+
+    @property
+    def write_ratio(self) -> float:
+        """
+        Gets share of writes among operations
+        """
+
+        return self.writes / self.operations if self.operations else 0.0
+
+    @property
+    def scan_ratio(self) -> float:
+        """
+        Gets share of scans among operations
+        """
+
+        return self.range_scans / self.operations if self.operations else 0.0
+
+    @property
+    def key_skew(self) -> float:
+        """
+        Gets share of recent point reads that went to the most read tenth of recently read keys:
+        about 0.1 for uniform reads, close to 1 when few hot keys take most reads
+        """
+
+        if not self.__recent_keys:
+            return 0.0
+        counts = sorted(Counter(self.__recent_keys).values(), reverse=True)
+        return sum(counts[:max(1, len(counts) // 10)]) / len(self.__recent_keys)
+
+    def decay(self) -> None:
+        """
+        Halves counters, so that older operations weigh less in the next recommendation
+        """
+
+        self.point_reads //= 2
+        self.range_scans //= 2
+        self.writes //= 2
+
+    def summary(self) -> dict:
+        """
+        Gets counters and ratios as dictionary
+        """
+
+        return {
+            "point_reads": self.point_reads,
+            "range_scans": self.range_scans,
+            "writes": self.writes,
+            "write_ratio": round(self.write_ratio, 3),
+            "scan_ratio": round(self.scan_ratio, 3),
+            "key_skew": round(self.key_skew, 3),
+        }
+
+
+class BackendAdvisor:
+    """
+    Recommends tree backend (tree_registry name) for table workload:
+    frequent scans - B-tree, as rows of one node are walked together;
+    frequent writes - treap, as its updates do expected O(1) rotations;
+    skewed point reads - splay tree, as hot keys stay near the root;
+    other point reads - AVL tree, the lowest of balanced trees
+    """
+
+    def __init__(self, min_operations: int = 1000, scan_threshold: float = 0.2,
+                 write_threshold: float = 0.4, skew_threshold: float = 0.5):
+        """
+        Args:
+            min_operations: Operations needed before anything is recommended
+            scan_threshold: Share of scans from which B-tree is recommended
+            write_threshold: Share of writes from which treap is recommended
+            skew_threshold: Key skew (see WorkloadStats.key_skew) from which splay tree is recommended
+        """
+
+        self.min_operations = min_operations
+        self.scan_threshold = scan_threshold
+        self.write_threshold = write_threshold
+        self.skew_threshold = skew_threshold
+
+    def recommend(self, stats: WorkloadStats) -> tuple[str, str] | None:
+        """
+        Gets recommended backend name and reason, None if too few operations were recorded
+        """
+
+        if stats.operations < self.min_operations:
+            return None
+        if stats.scan_ratio >= self.scan_threshold:
+            return "medium-btree", f"{stats.scan_ratio:.0%} of operations are scans"
+        if stats.write_ratio >= self.write_threshold:
+            return "treap", f"{stats.write_ratio:.0%} of operations are writes"
+        key_skew = stats.key_skew
+        if key_skew >= self.skew_threshold:
+            return "splay", f"{key_skew:.0%} of point reads go to the hottest tenth of keys"
+        return "avl", f"point reads with key skew {key_skew:.0%}"
+
+
+class Decision:
+    """
+    Entry of decision log: advisor recommendation for table and whether table was migrated
+    """
+
+    def __init__(self, table_name: str, current: str, recommended: str, reason: str, migrated: bool,
+                 stats: dict):
+        self.time = time.time()
+        self.table_name = table_name
+        self.current = current
+        self.recommended = recommended
+        self.reason = reason
+        self.migrated = migrated
+        self.stats = stats
+
+    def __str__(self):
+        if self.migrated:
+            action = f"migrated from {self.current}"
+        elif self.current == self.recommended:
+            action = "already used"
+        else:
+            action = f"not migrated, table uses {self.current}"
+        return (f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.time))} {self.table_name}: "
+                f"{self.recommended} recommended ({self.reason}), {action}")